@@ -14,6 +14,11 @@ class Board:
         "integrated_sram_size" : 0x1800,
         "l2_size"              : 0
     }
+    # Bitstream configuration (applied by make.py to the vendor toolchain, see apply_bitstream_config):
+    # compress (bitstream compression: faster JTAG loads/configuration), config_clk_freq (SPI
+    # configuration clock in MHz), spi_buswidth (SPI configuration width), spi_fall_edge and
+    # spi_32bit_addr (Xilinx UltraScale+ flash settings).
+    bitstream_config = {}
     def __init__(self, soc_cls=None, soc_capabilities={}, soc_constants={}):
         self.soc_cls          = soc_cls
         self.soc_capabilities = soc_capabilities
@@ -23,9 +28,24 @@ class Board:
         prog = self.platform.create_programmer()
         prog.load_bitstream(filename)
 
-    def flash(self, filename):
-        prog = self.platform.create_programmer()
-        prog.flash(0, filename)
+    def flash(self, filename, images=None, delta=False, state=None):
+        # images: {offset: filename} of the Linux images flashed with the bitstream. With delta, only
+        # the flash sectors that differ are programmed (see flash_delta.py). Both require a programmer
+        # writing at the given flash offsets.
+        from flash_delta import flash_delta, has_flash_offset_support, write_flash
+        prog   = self.platform.create_programmer()
+        images = {0: filename, **(images or {})}
+        if (delta or len(images) > 1) and not has_flash_offset_support(prog):
+            raise ValueError(f"{type(prog).__name__} can't write at a flash offset (only the bitstream can be flashed)")
+        if delta:
+            programmed, sectors = flash_delta(prog, images, state=state)
+            print(f"Flash: {programmed}/{sectors} sectors programmed.")
+        else:
+            write_flash(prog, images)
+
+    def has_flash_offset_support(self):
+        from flash_delta import has_flash_offset_support
+        return has_flash_offset_support(self.platform.create_programmer())
 
 #---------------------------------------------------------------------------------------------------
 # Xilinx Boards
@@ -69,13 +89,13 @@ class AcornPCIe(Board):
             "pcie",
         })
 
-    def flash(self, filename):
-        prog = self.platform.create_programmer()
-        prog.flash(0, filename.replace(".bin", "_fallback.bin"))
+    def flash(self, filename, images=None, delta=False, state=None):
+        Board.flash(self, filename.replace(".bin", "_fallback.bin"), images, delta, state)
 
 # Arty support -------------------------------------------------------------------------------------
 
 class Arty(Board):
+    bitstream_config = {"compress": True, "config_clk_freq": 33, "spi_buswidth": 4}
     def __init__(self):
         from litex_boards.targets import digilent_arty
         Board.__init__(self, digilent_arty.BaseSoC, soc_capabilities={
@@ -97,6 +117,7 @@ class Arty(Board):
 class ArtyA7(Arty): pass
 
 class ArtyS7(Board):
+    bitstream_config = {"compress": True, "config_clk_freq": 33, "spi_buswidth": 4}
     def __init__(self):
         from litex_boards.targets import digilent_arty_s7
         Board.__init__(self, digilent_arty_s7.BaseSoC, soc_capabilities={
@@ -161,6 +182,7 @@ class Genesys2(Board):
 # KC705 support ---------------------------------------------------------------------------------
 
 class KC705(Board):
+    bitstream_config = {"compress": True, "config_clk_freq": 33, "spi_buswidth": 4}
     def __init__(self):
         from litex_boards.targets import xilinx_kc705
         Board.__init__(self, xilinx_kc705.BaseSoC, soc_capabilities={
@@ -300,6 +322,13 @@ class AlveoU280(Board):
         "with_hbm"     : True, # Use HBM @ 250MHz (Min).
         "sys_clk_freq" : 250e6
     }
+    bitstream_config = {
+        "compress"        : True,
+        "config_clk_freq" : 85.0,
+        "spi_buswidth"    : 4,
+        "spi_fall_edge"   : True,
+        "spi_32bit_addr"  : True,
+    }
     def __init__(self):
         from litex_boards.targets import xilinx_alveo_u280
         Board.__init__(self, xilinx_alveo_u280.BaseSoC, soc_capabilities={
@@ -310,6 +339,13 @@ class AlveoU280(Board):
 # AlveoU250 support -------------------------------------------------------------------------------
 
 class AlveoU250(Board):
+    bitstream_config = {
+        "compress"        : True,
+        "config_clk_freq" : 63.8,
+        "spi_buswidth"    : 4,
+        "spi_fall_edge"   : True,
+        "spi_32bit_addr"  : True,
+    }
     def __init__(self):
         from litex_boards.targets import xilinx_alveo_u250
         Board.__init__(self, xilinx_alveo_u250.BaseSoC, soc_capabilities={
@@ -464,6 +500,7 @@ class ULX3S(Board):
         "l2_size"                      : 2048, # Use Wishbone and L2 for memory accesses.
         "video_framebuffer_fifo_depth" : 8192,
     }
+    bitstream_config = {"compress": True, "config_clk_freq": 38.8, "spi_buswidth": 1}
     def __init__(self):
         from litex_boards.targets import radiona_ulx3s
         Board.__init__(self, radiona_ulx3s.BaseSoC, soc_capabilities={
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import ast
+import json
+import argparse
+
+# Boards Manifest ----------------------------------------------------------------------------------
+
+# Static board metadata (name, vendor family, capabilities, soc_kwargs, bitstream_config, LiteX-Boards target)
+# extracted from boards.py with ast, so it can be queried without importing LiteX/LiteX-Boards.
+
+def camel_to_snake(name):
+    name = re.sub(r'(?<=[a-z])(?=[A-Z])', '_', name)
+    return name.lower()
+
+def _eval_node(node):
+    # Literals plus the int()/float() conversions used in soc_kwargs (ex: int(150e6)).
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ["int", "float"]:
+        if len(node.args) != 1 or node.keywords:
+            raise ValueError(f"Unsupported call at line {node.lineno}")
+        return {"int": int, "float": float}[node.func.id](_eval_node(node.args[0]))
+    if isinstance(node, ast.Dict):
+        return {_eval_node(k): _eval_node(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [_eval_node(e) for e in node.elts]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_eval_node(node.operand)
+    if isinstance(node, ast.Constant):
+        return node.value
+    raise ValueError(f"Unsupported expression at line {node.lineno}")
+
+def _get_families(source):
+    # Vendor sections are delimited by "# <Vendor> Boards" headers.
+    families = []
+    for lineno, line in enumerate(source.splitlines(), start=1):
+        m = re.match(r"^# (.+) Boards$", line)
+        if m is not None:
+            families.append((lineno, m.group(1)))
+    return families
+
+def _get_class_info(node):
+    info = {"bases": [b.id for b in node.bases if isinstance(b, ast.Name)]}
+    for item in node.body:
+        # Class-level soc_kwargs/bitstream_config.
+        for key in ["soc_kwargs", "bitstream_config"]:
+            if isinstance(item, ast.Assign) and any(isinstance(t, ast.Name) and t.id == key for t in item.targets):
+                info[key] = _eval_node(item.value)
+        # __init__: LiteX-Boards target import and soc_capabilities passed to Board.__init__.
+        if isinstance(item, ast.FunctionDef) and item.name == "__init__":
+            for sub in ast.walk(item):
+                if isinstance(sub, ast.ImportFrom) and sub.module == "litex_boards.targets":
+                    info["target"] = sub.names[0].name
+                if isinstance(sub, ast.Call):
+                    for keyword in sub.keywords:
+                        if keyword.arg == "soc_capabilities":
+                            info["capabilities"] = sorted(_eval_node(keyword.value))
+    return info
+
+def get_boards_manifest(filename=None):
+    if filename is None:
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boards.py")
+    with open(filename, encoding="utf-8") as f:
+        source = f.read()
+    families = _get_families(source)
+
+    # Collect classes.
+    classes = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.ClassDef):
+            info = _get_class_info(node)
+            info["family"] = None
+            for lineno, family in families:
+                if lineno < node.lineno:
+                    info["family"] = family
+            classes[node.name] = info
+
+    # Resolve inheritance (soc_kwargs/bitstream_config/capabilities/target are inherited from the parent board).
+    def resolve(name, key, default):
+        info = classes[name]
+        if key in info:
+            return info[key]
+        for base in info["bases"]:
+            if base in classes:
+                return resolve(base, key, default)
+        return default
+
+    def is_board(name):
+        return any(base == "Board" or (base in classes and is_board(base)) for base in classes[name]["bases"])
+
+    manifest = {}
+    for name in classes:
+        if not is_board(name):
+            continue
+        soc_kwargs = dict(classes["Board"].get("soc_kwargs", {}))
+        soc_kwargs.update(resolve(name, "soc_kwargs", {}))
+        manifest[camel_to_snake(name)] = {
+            "class"            : name,
+            "family"           : classes[name]["family"],
+            "target"           : resolve(name, "target", None),
+            "capabilities"     : resolve(name, "capabilities", []),
+            "soc_kwargs"       : soc_kwargs,
+            "bitstream_config" : resolve(name, "bitstream_config", {}),
+        }
+    return manifest
+
+def filter_boards_manifest(manifest, capabilities=()):
+    return {name: info for name, info in manifest.items()
+        if all(c in info["capabilities"] for c in capabilities)}
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the static board metadata manifest from boards.py.")
+    parser.add_argument("--boards", default=None, help="boards.py file (default: the one next to this script).")
+    parser.add_argument("--output", default=None, help="Output JSON file (default: stdout).")
+    args = parser.parse_args()
+
+    manifest = json.dumps(get_boards_manifest(args.boards), indent=4)
+    if args.output is None:
+        print(manifest)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(manifest + "\n")
+
+if __name__ == "__main__":
+    main()
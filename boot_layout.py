@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import json
+import zlib
+import struct
+import argparse
+
+from dtb_patch import patch_dtb_initrd, write_image
+from initrd    import initrd_images, get_initrd_image
+
+# Boot Layout --------------------------------------------------------------------------------------
+
+# boot.json load addresses computed from the actual image sizes and the SoC memory regions (the
+# "memories" of csr.json) instead of hardcoded addresses:
+# - Image, rv32.dtb and opensbi.bin are placed where the OpenSBI fw_jump firmware expects them
+#   (FW_JUMP_ADDR at the start of main RAM, FW_JUMP_FDT_ADDR just below the OpenSBI region and
+#   FW_TEXT_START at the OpenSBI region) and checked against their real sizes.
+# - the initramfs (and the compressed boot images) are packed after the OpenSBI region and checked
+#   against the main RAM size.
+
+boot_align     = 0x1000   # Load addresses are page aligned.
+dtb_max_size   = 0x10000  # DTB slot below the OpenSBI region.
+opensbi_offset = 0xf00000 # Default OpenSBI region (VexRiscvSMP) when csr.json has none.
+opensbi_size   = 0x80000
+
+# Images packed (in this order) after the OpenSBI region (boot-*.bin: see Boot Stub).
+packed_images = [*initrd_images.values(), "Image.lz4", "boot-unlz4.bin", "boot.bin"]
+
+def _align(n, align=boot_align):
+    return (n + align - 1) & ~(align - 1)
+
+def get_image_size(filename):
+    # RISC-V Linux Image header: effective memory size (including BSS) at offset 16, "RSC\x05"
+    # magic at offset 56. Other files (or raw Images) use their file size.
+    with open(filename, "rb") as f:
+        header = f.read(64)
+    if len(header) == 64 and header[56:60] == b"RSC\x05":
+        return struct.unpack_from("<Q", header, 16)[0]
+    return os.path.getsize(filename)
+
+def _check_region(image, start, size, end):
+    if start + size > end:
+        raise ValueError(f"{image} ({size} bytes) does not fit in 0x{start:08x}-0x{end:08x}")
+
+def get_boot_regions(memories):
+    main_ram_base = memories["main_ram"]["base"]
+    main_ram_end  = main_ram_base + memories["main_ram"]["size"]
+    opensbi       = memories.get("opensbi", {"base": main_ram_base + opensbi_offset, "size": opensbi_size})
+    opensbi_base  = opensbi["base"]
+    opensbi_end   = opensbi_base + opensbi["size"]
+    # {image: (start, end)}, "packed" being the region of the packed images.
+    return {
+        "Image"       : (main_ram_base,               opensbi_base - dtb_max_size),
+        "rv32.dtb"    : (opensbi_base - dtb_max_size, opensbi_base),
+        "opensbi.bin" : (opensbi_base,                opensbi_end),
+        "packed"      : (_align(opensbi_end),         main_ram_end),
+    }
+
+def get_image_file_size(images_dir, image, sizes=None):
+    if image in (sizes or {}):
+        return sizes[image]
+    filename = os.path.join(images_dir, image)
+    return os.path.getsize(filename) if os.path.exists(filename) else None
+
+def get_boot_layout(images, memories, images_dir="images", sizes=None):
+    # sizes: sizes of the images not generated yet (boot stub images).
+    regions = get_boot_regions(memories)
+    layout  = {}
+
+    # Fixed images (images not built/downloaded yet only get their address).
+    for image in images:
+        if image in packed_images:
+            continue
+        if image not in regions or image == "packed":
+            raise ValueError(f"No boot region for {image}")
+        start, end = regions[image]
+        filename = os.path.join(images_dir, image)
+        if os.path.exists(filename):
+            _check_region(image, start, get_image_size(filename), end)
+        layout[image] = start
+
+    # Packed images (the size of all but the last one is required).
+    start, end = regions["packed"]
+    packed     = [image for image in packed_images if image in images]
+    for image in packed:
+        size = get_image_file_size(images_dir, image, sizes)
+        if size is not None:
+            if image in boot_stub_images:
+                size += boot_stub_stack_size
+            _check_region(image, start, size, end)
+        elif image != packed[-1]:
+            raise ValueError(f"{os.path.join(images_dir, image)} is required to compute the boot layout")
+        else:
+            size = 0
+        layout[image] = start
+        start = _align(start + size)
+
+    return {image: layout[image] for image in images}
+
+def get_initrd_start(memories):
+    # The initramfs is the first packed image: its load address does not depend on the image sizes.
+    return get_boot_regions(memories)["packed"][0]
+
+# Boot Stub ----------------------------------------------------------------------------------------
+
+# The boot stub (buildroot/package/litex-boot-stub) is loaded as the last boot.json image: it checks
+# the CRC32 of the images described by the descriptor appended to it, copies/decompresses them to
+# their load address and jumps to OpenSBI. It is used for:
+# - Compressed boot (--boot-compression=lz4): the BIOS loads Image.lz4 (LZ4 legacy format) instead
+#   of Image, boot-unlz4.bin decompresses it.
+# - Bundled boot (--boot-bundle): the BIOS loads a single boot.bin (stub + descriptor + images),
+#   the images are copied out of it (the rootfs is used in place).
+
+boot_stub_magic      = 0x5442584c # "LXBT"
+boot_stub_flag_lz4   = 0x1
+boot_stub_stack_size = 0x1000
+boot_stub_images     = ["boot-unlz4.bin", "boot.bin"]
+
+def get_missing_boot_stub_images(images, images_dir="images"):
+    # Linux images (Buildroot build) required to generate the boot stub images (rv32.dtb is
+    # generated by make.py): make.py skips the boot stub images while some are missing.
+    required = ["boot-stub.bin", *images] + (["Image"] if "Image.lz4" in images else [])
+    return [image for image in dict.fromkeys(required)
+        if image != "rv32.dtb" and not os.path.exists(os.path.join(images_dir, image))]
+
+def get_boot_stub(images_dir):
+    filename = os.path.join(images_dir, "boot-stub.bin")
+    if not os.path.exists(filename):
+        raise ValueError(f"{filename} is required by the boot stub (Buildroot build)")
+    with open(filename, "rb") as f:
+        stub = f.read()
+    return stub + bytes(-len(stub) % 4)
+
+def get_boot_stub_descriptor(entries, next_addr, stack_top):
+    # entries: [(src, data, dst, dst_size, flags)].
+    desc = struct.pack("<4I", boot_stub_magic, len(entries), next_addr, stack_top)
+    for src, data, dst, dst_size, flags in entries:
+        desc += struct.pack("<6I", src, len(data), dst, dst_size, flags, zlib.crc32(data))
+    return desc
+
+def get_boot_stub_descriptor_size(count):
+    return 4*4 + 6*4*count
+
+def get_boot_stub_entry(image, regions, images_dir):
+    # Final (dst, dst_size, flags) of an image.
+    filename = os.path.join(images_dir, image)
+    if image == "Image.lz4":
+        filename = os.path.join(images_dir, "Image")
+        start, end = regions["Image"]
+        if not os.path.exists(filename):
+            raise ValueError(f"{filename} is required by the boot stub (decompressed size)")
+        _check_region("Image", start, get_image_size(filename), end)
+        return start, os.path.getsize(filename), boot_stub_flag_lz4
+    start, end = regions[image]
+    _check_region(image, start, get_image_size(filename), end)
+    return start, os.path.getsize(filename), 0
+
+def _read_image(images_dir, image):
+    filename = os.path.join(images_dir, image)
+    if not os.path.exists(filename):
+        raise ValueError(f"{filename} is required by the boot stub")
+    with open(filename, "rb") as f:
+        return f.read()
+
+def generate_unlz4_boot(images, memories, images_dir="images"):
+    stub    = get_boot_stub(images_dir)
+    regions = get_boot_regions(memories)
+    images  = images + ["boot-unlz4.bin"]
+    sizes   = {"boot-unlz4.bin": len(stub) + get_boot_stub_descriptor_size(1)}
+    layout  = get_boot_layout(images, memories, images_dir, sizes)
+    dst, dst_size, flags = get_boot_stub_entry("Image.lz4", regions, images_dir)
+    desc = get_boot_stub_descriptor(
+        entries   = [(layout["Image.lz4"], _read_image(images_dir, "Image.lz4"), dst, dst_size, flags)],
+        next_addr = regions["opensbi.bin"][0],
+        stack_top = layout["boot-unlz4.bin"] + sizes["boot-unlz4.bin"] + boot_stub_stack_size,
+    )
+    write_image(os.path.join(images_dir, "boot-unlz4.bin"), stub + desc)
+    return layout
+
+def generate_boot_bundle(images, memories, images_dir="images"):
+    stub    = get_boot_stub(images_dir)
+    regions = get_boot_regions(memories)
+    base    = regions["packed"][0]
+
+    # Offsets of the images in the bundle (the rootfs is used in place: page aligned).
+    offset  = len(stub) + get_boot_stub_descriptor_size(len(images))
+    offsets = {}
+    for image in images:
+        size = get_image_file_size(images_dir, image)
+        if size is None:
+            raise ValueError(f"{os.path.join(images_dir, image)} is required by the boot bundle")
+        offset = _align(offset, boot_align if image in initrd_images.values() else 4)
+        offsets[image] = offset
+        offset += size
+    layout = get_boot_layout(["boot.bin"], memories, images_dir, {"boot.bin": offset})
+
+    # The DTB initrd range points to the rootfs in the bundle.
+    dtb = os.path.join(images_dir, "rv32.dtb")
+    for initrd in set(initrd_images.values()) & set(offsets):
+        if os.path.exists(dtb):
+            patch_dtb_initrd(dtb, os.path.join(images_dir, initrd), initrd_start=base + offsets[initrd])
+
+    entries = []
+    bundle  = bytearray(offset)
+    for image in images:
+        data = _read_image(images_dir, image)
+        bundle[offsets[image]:offsets[image] + len(data)] = data
+        if image in initrd_images.values():
+            dst, dst_size, flags = base + offsets[image], len(data), 0
+        else:
+            dst, dst_size, flags = get_boot_stub_entry(image, regions, images_dir)
+        entries.append((base + offsets[image], data, dst, dst_size, flags))
+    desc = get_boot_stub_descriptor(
+        entries   = entries,
+        next_addr = regions["opensbi.bin"][0],
+        stack_top = base + offset + boot_stub_stack_size,
+    )
+    bundle[:len(stub) + len(desc)] = stub + desc
+    write_image(os.path.join(images_dir, "boot.bin"), bundle)
+    return layout
+
+# Flash Boot ---------------------------------------------------------------------------------------
+
+# Boot from the SPI flash (make.py --flash-boot): the images are flashed after the bitstream at
+# fixed (erase sector aligned) offsets and the LiteX BIOS flashboot copies flash_boot.bin from the
+# memory-mapped flash to the start of main RAM and jumps to it (on all harts):
+# - flash_boot.bin: BIOS flash header (length, CRC32) + Image + boot stub + descriptor. The Image is
+#   then already at its load address, its first 8 bytes being replaced by a jump to the boot stub
+#   (placed after the Image, in its BSS, and never overwritten while running).
+# - the boot stub checks/copies the other images from the memory-mapped flash (quad reads with the
+#   SPI flash modes configured as such by the targets) to their boot.json load addresses, restores
+#   the first 8 bytes of the Image (last entry) and jumps to OpenSBI.
+# - flash.json: flash offsets of the images.
+
+flash_boot_offset   = 0x400000 # Default flash offset of the images (after the bitstream).
+flash_boot_align    = 0x10000  # Flash offsets are erase sector aligned (delta flashing).
+flash_boot_max_size = 16 << 20 # LiteX BIOS flashboot image size limit.
+
+def get_flash_boot_jump(offset):
+    # auipc t0, %hi(offset); jalr zero, %lo(offset)(t0).
+    hi = (offset + 0x800) >> 12
+    lo = (offset - (hi << 12)) & 0xfff
+    return struct.pack("<2I", (hi << 12) | (5 << 7) | 0x17, (lo << 20) | (5 << 15) | 0x67)
+
+def get_flash_layout(images, images_dir="images", offset=flash_boot_offset, sizes=None):
+    # {image: flash offset}, flash_boot.bin (replacing Image) first.
+    layout = {}
+    for image in ["flash_boot.bin"] + [image for image in images if image != "Image"]:
+        size = get_image_file_size(images_dir, image, sizes)
+        if size is None:
+            raise ValueError(f"{os.path.join(images_dir, image)} is required by the flash boot")
+        layout[image] = offset
+        offset = _align(offset + size, flash_boot_align)
+    return layout
+
+def generate_flash_boot(images, memories, images_dir="images", offset=flash_boot_offset):
+    # Returns {flash offset: filename} of the images to flash.
+    if "Image" not in images:
+        raise ValueError("The flash boot requires an uncompressed Image")
+    if "spiflash" not in memories:
+        raise ValueError("The flash boot requires a memory-mapped SPI flash (spiflash region)")
+    stub    = get_boot_stub(images_dir)
+    regions = get_boot_regions(memories)
+    layout  = get_boot_layout(images, memories, images_dir)
+    others  = [image for image in images if image != "Image"]
+
+    # flash_boot.bin: Image (at the start of main RAM) + boot stub + descriptor + Image first bytes.
+    image      = bytearray(_read_image(images_dir, "Image"))
+    stub_base  = regions["Image"][0] + _align(len(image))
+    jump       = get_flash_boot_jump(stub_base - regions["Image"][0])
+    desc_size  = get_boot_stub_descriptor_size(len(others) + 1)
+    saved_base = stub_base + len(stub) + desc_size
+    stack_top  = saved_base + len(jump) + boot_stub_stack_size
+    _check_region("flash_boot.bin", regions["Image"][0], stack_top - regions["Image"][0], regions["Image"][1])
+    sizes        = {"flash_boot.bin": 8 + saved_base + len(jump) - regions["Image"][0]}
+    flash_layout = get_flash_layout(images, images_dir, offset, sizes)
+
+    # Descriptor: images copied from the memory-mapped flash, Image first bytes restored last.
+    entries = []
+    for name in others:
+        data = _read_image(images_dir, name)
+        src  = memories["spiflash"]["base"] + flash_layout[name]
+        if name in initrd_images.values():
+            dst, dst_size, flags = layout[name], len(data), 0
+        else:
+            dst, dst_size, flags = get_boot_stub_entry(name, regions, images_dir)
+        entries.append((src, data, dst, dst_size, flags))
+    entries.append((saved_base, bytes(image[:len(jump)]), regions["Image"][0], len(jump), 0))
+    desc = get_boot_stub_descriptor(
+        entries   = entries,
+        next_addr = regions["opensbi.bin"][0],
+        stack_top = stack_top,
+    )
+    payload = image.ljust(stub_base - regions["Image"][0], b"\x00") + stub + desc + image[:len(jump)]
+    payload[:len(jump)] = jump
+    if len(payload) > flash_boot_max_size:
+        raise ValueError(f"flash_boot.bin ({len(payload)} bytes) exceeds the BIOS flashboot limit ({flash_boot_max_size} bytes)")
+    end = max(flash_layout[name] + get_image_file_size(images_dir, name, sizes) for name in flash_layout)
+    if end > memories["spiflash"]["size"]:
+        raise ValueError(f"The flash boot images (up to 0x{end:08x}) do not fit in the SPI flash ({memories['spiflash']['size']} bytes)")
+
+    write_image(os.path.join(images_dir, "flash_boot.bin"), struct.pack("<2I", len(payload), zlib.crc32(payload)) + payload)
+    write_boot_json(os.path.join(images_dir, "flash.json"), flash_layout)
+    return {flash_offset: os.path.join(images_dir, name) for name, flash_offset in flash_layout.items()}
+
+# boot.json ----------------------------------------------------------------------------------------
+
+def get_boot_json_template(rootfs):
+    # Images to load for the RootFS, from the boot_<rootfs>.json templates shipped in images/.
+    template = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", f"boot_{rootfs}.json")
+    with open(template) as f:
+        return list(json.load(f).keys())
+
+def write_boot_json(filename, layout):
+    width = max(len(image) for image in layout) + 2
+    lines = [f"\t{json.dumps(image):<{width}} : \"0x{address:08x}\"" for image, address in layout.items()]
+    write_image(filename, ("{\n" + ",\n".join(lines) + "\n}\n").encode())
+
+def get_boot_json_images(rootfs, compression="none", initrd_compression="gzip"):
+    # Templates load rootfs.cpio.gz: replaced by the initramfs of the selected compression.
+    initrd = get_initrd_image(initrd_compression)
+    images = [initrd if image == "rootfs.cpio.gz" else image for image in get_boot_json_template(rootfs)]
+    if compression == "lz4":
+        images = ["Image.lz4" if image == "Image" else image for image in images]
+    return images
+
+def generate_boot_json(rootfs, memories, images_dir="images", compression="none", bundle=False, initrd_compression="gzip"):
+    initrd = get_initrd_image(initrd_compression)
+    images = get_boot_json_images(rootfs, compression, initrd_compression)
+    os.makedirs(images_dir, exist_ok=True)
+
+    if bundle:
+        layout = generate_boot_bundle(images, memories, images_dir)
+    else:
+        if compression == "lz4":
+            layout = generate_unlz4_boot(images, memories, images_dir)
+        else:
+            layout = get_boot_layout(images, memories, images_dir)
+        # Keep the DTB initrd range in sync with the rootfs load address (also before the rootfs is
+        # built: post-image.sh then only updates the range end).
+        dtb      = os.path.join(images_dir, "rv32.dtb")
+        filename = os.path.join(images_dir, initrd)
+        if initrd in layout and os.path.exists(dtb):
+            patch_dtb_initrd(dtb, filename if os.path.exists(filename) else None, initrd_start=layout[initrd])
+
+    write_boot_json(os.path.join(images_dir, "boot.json"), layout)
+    return layout
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate boot.json from the image sizes and the SoC memory regions.")
+    parser.add_argument("csr_json",                          help="SoC csr.json (ex: build/arty/csr.json).")
+    parser.add_argument("--rootfs",      default="ram0",     help="Location of the RootFS.", choices=["ram0", "mmcblk0p2", "nfs", "squashfs", "erofs"])
+    parser.add_argument("--images-dir",  default="images",   help="Linux images directory.")
+    parser.add_argument("--compression", default="none",     help="Kernel Image compression.", choices=["none", "lz4"])
+    parser.add_argument("--bundle",      action="store_true", help="Load the images from a single boot.bin.")
+    parser.add_argument("--initrd-compression", default="gzip", help="Initramfs compression.", choices=list(initrd_images))
+    parser.add_argument("--flash-boot",  default=None,       help="Also generate flash_boot.bin/flash.json for images flashed at this offset (ex: 0x400000).")
+    args = parser.parse_args()
+
+    with open(args.csr_json) as f:
+        memories = json.load(f)["memories"]
+    layout = generate_boot_json(args.rootfs, memories, args.images_dir, args.compression, args.bundle, args.initrd_compression)
+    for image, address in layout.items():
+        print(f"{image:<16}: 0x{address:08x}")
+    if args.flash_boot is not None:
+        images = get_boot_json_images(args.rootfs, args.compression, args.initrd_compression)
+        for offset, filename in generate_flash_boot(images, memories, args.images_dir, int(args.flash_boot, 0)).items():
+            print(f"{os.path.basename(filename):<16}: flash 0x{offset:08x}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+from urllib.parse import urlparse, unquote
+
+# Build Cache --------------------------------------------------------------------------------------
+
+# Content-addressed cache of the make.py outputs of a board: the key is a hash of everything the
+# outputs depend on (resolved configuration, LiteX packages and input files), the entry is a copy
+# of build/<board>/ (including the board DTB). The shared images/ outputs (rv32.dtb, boot.json) are
+# not cached: concurrent builds (--jobs) of other boards overwrite them, so they are regenerated
+# from the restored board outputs on a hit.
+
+cache_packages = [
+    "migen",
+    "litex",
+    "litex-boards",
+    "litedram",
+    "liteeth",
+    "litepcie",
+    "litesata",
+    "litesdcard",
+    "litespi",
+    "liteiclink",
+    "litescope",
+    "pythondata-cpu-vexriscv-smp",
+    "pythondata-software-picolibc",
+    "pythondata-software-compiler-rt",
+]
+
+def get_package_fingerprint(name):
+    from importlib import metadata # Deferred: only needed when the cache is used.
+    try:
+        dist = metadata.distribution(name)
+    except metadata.PackageNotFoundError:
+        return None
+    fingerprint = dist.version
+    # Editable installs (ex: litex_setup.py) keep the same version while their sources change:
+    # also use the git revision/local changes of the checkout.
+    direct_url = json.loads(dist.read_text("direct_url.json") or "{}")
+    if direct_url.get("dir_info", {}).get("editable", False):
+        path = unquote(urlparse(direct_url["url"]).path)
+        git  = ["git", "-C", path]
+        try:
+            head = subprocess.check_output(git + ["rev-parse", "HEAD"], stderr=subprocess.DEVNULL)
+            diff = subprocess.check_output(git + ["diff", "HEAD"],      stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            return fingerprint
+        fingerprint += "+" + head.decode().strip() + "+" + hashlib.sha256(diff).hexdigest()
+    return fingerprint
+
+def get_file_hash(filename):
+    if not os.path.exists(filename):
+        return None
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def get_build_cache_key(config, input_files):
+    key = {
+        "config"   : config,
+        "packages" : {name: get_package_fingerprint(name) for name in cache_packages},
+        "files"    : {filename: get_file_hash(filename) for filename in sorted(input_files)},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+def restore_build_cache(cache_dir, key, build_dir):
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        return False
+    shutil.copytree(os.path.join(entry, "build"), build_dir, dirs_exist_ok=True)
+    return True
+
+def store_build_cache(cache_dir, key, build_dir):
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+    # Populate a temporary directory and rename it, so concurrent runs never see partial entries.
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+    try:
+        shutil.copytree(build_dir, os.path.join(tmp, "build"), ignore=shutil.ignore_patterns("make.log"))
+        os.rename(tmp, entry)
+    except OSError:
+        if not os.path.isdir(entry):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -6,25 +6,73 @@ BOARD_DIR="$(dirname $0)"
 GENIMAGE_CFG="${BOARD_DIR}/genimage.cfg"
 GENIMAGE_TMP="${BUILD_DIR}/genimage.tmp"
 
+# Post-image arguments (BR2_ROOTFS_POST_SCRIPT_ARGS, set by make.py in the board defconfig).
+ROOTFS_TYPE=ext4
+INITRD_COMPRESSION=gzip
+BOOT_COMPRESSION=none
+for arg in "${@:2}"; do
+	case "$arg" in
+		rootfs=*) ROOTFS_TYPE="${arg#rootfs=}" ;;
+		initrd=*) INITRD_COMPRESSION="${arg#initrd=}" ;;
+		boot=*)   BOOT_COMPRESSION="${arg#boot=}" ;;
+	esac
+done
+
 LINUX_ON_VEXRISCV_OUT_DIR=$BR2_EXTERNAL_LITEX_VEXRISCV_PATH/../images
 DST_DTB=$LINUX_ON_VEXRISCV_OUT_DIR/rv32.dtb
 DST_OPENSBI=$LINUX_ON_VEXRISCV_OUT_DIR/opensbi.bin
 DST_IMAGE=$LINUX_ON_VEXRISCV_OUT_DIR/Image
 DST_ROOTFS_CPIO=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.cpio
 DST_ROOTFS_CPIO_GZ=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.cpio.gz
+DST_ROOTFS_CPIO_LZ4=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.cpio.lz4
+DST_ROOTFS_CPIO_ZST=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.cpio.zst
 DST_ROOTFS_EXT4=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.ext4
+DST_ROOTFS_TAR=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.tar
+DST_ROOTFS_SQUASHFS=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.squashfs
+DST_ROOTFS_EROFS=$LINUX_ON_VEXRISCV_OUT_DIR/rootfs.erofs
+DST_IMAGE_LZ4=$LINUX_ON_VEXRISCV_OUT_DIR/Image.lz4
+DST_BOOT_STUB=$LINUX_ON_VEXRISCV_OUT_DIR/boot-stub.bin
 
-rm -f $DST_OPENSBI $DST_ROOTFS_CPIO $DST_ROOTFS_CPIO_GZ $DST_ROOTFS_EXT4 $DST_IMAGE
+rm -f $DST_OPENSBI $DST_ROOTFS_CPIO $DST_ROOTFS_CPIO_GZ $DST_ROOTFS_CPIO_LZ4 $DST_ROOTFS_CPIO_ZST $DST_ROOTFS_EXT4 $DST_ROOTFS_TAR $DST_ROOTFS_SQUASHFS $DST_ROOTFS_EROFS $DST_IMAGE $DST_IMAGE_LZ4 $DST_BOOT_STUB
 ln -s $BINARIES_DIR/fw_jump.bin $DST_OPENSBI
 ln -s $BINARIES_DIR/Image $DST_IMAGE
 ln -s $BINARIES_DIR/rootfs.cpio $DST_ROOTFS_CPIO
-if [ -e $BINARIES_DIR/rootfs.cpio.gz ]; then
-	ln -s $BINARIES_DIR/rootfs.cpio.gz $DST_ROOTFS_CPIO_GZ
-else
-	gzip -c $BINARIES_DIR/rootfs.cpio > $DST_ROOTFS_CPIO_GZ
-fi
 ln -s $BINARIES_DIR/rootfs.ext4 $DST_ROOTFS_EXT4
 
+# Read-only compressed RootFS (make.py --rootfs=squashfs/erofs).
+if [ "$ROOTFS_TYPE" != "ext4" ]; then
+	ln -s $BINARIES_DIR/rootfs.$ROOTFS_TYPE $LINUX_ON_VEXRISCV_OUT_DIR/rootfs.$ROOTFS_TYPE
+fi
+
+# NFS RootFS tarball (make.py --rootfs=nfs, staged with nfs_stage.py).
+if [ -e $BINARIES_DIR/rootfs.tar ]; then
+	ln -s $BINARIES_DIR/rootfs.tar $DST_ROOTFS_TAR
+fi
+
+# Initramfs compressed with all the cores (make.py --initrd-compression, host lz4/zstd from Buildroot).
+case "$INITRD_COMPRESSION" in
+	lz4)  DST_INITRD=$DST_ROOTFS_CPIO_LZ4 ;;
+	zstd) DST_INITRD=$DST_ROOTFS_CPIO_ZST ;;
+	none) DST_INITRD=$DST_ROOTFS_CPIO ;;
+	*)    DST_INITRD=$DST_ROOTFS_CPIO_GZ ;;
+esac
+if [ "$INITRD_COMPRESSION" != "none" ]; then
+	PATH="$HOST_DIR/bin:$PATH" python3 $BR2_EXTERNAL_LITEX_VEXRISCV_PATH/../initrd.py compress \
+		--compression $INITRD_COMPRESSION --output $BINARIES_DIR/$(basename $DST_INITRD) $BINARIES_DIR/rootfs.cpio
+	ln -s $BINARIES_DIR/$(basename $DST_INITRD) $DST_INITRD
+fi
+
+# Boot stub (make.py --boot-compression=lz4/--boot-bundle/--flash-boot) and LZ4 compressed Image
+# (--boot-compression=lz4).
+if [ -e $BINARIES_DIR/boot-stub.bin ]; then
+	ln -s $BINARIES_DIR/boot-stub.bin $DST_BOOT_STUB
+fi
+if [ "$BOOT_COMPRESSION" = "lz4" ]; then
+	$HOST_DIR/bin/lz4 -l -9 -f -q $BINARIES_DIR/Image $BINARIES_DIR/Image.lz4.tmp
+	mv -f $BINARIES_DIR/Image.lz4.tmp $BINARIES_DIR/Image.lz4
+	ln -s $BINARIES_DIR/Image.lz4 $DST_IMAGE_LZ4
+fi
+
 if [ ! -e $DST_DTB ]; then
 	echo ""
 	echo "Warning: missing file $DST_DTB"
@@ -34,16 +82,13 @@ if [ ! -e $DST_DTB ]; then
 	touch $DST_OPENSBI
 fi
 
+# Update the DTB initrd range in place (no-op when the DTB has no initrd): linux,initrd-start from
+# the boot.json load address of the initramfs (make.py boot layout), linux,initrd-end from its size.
 if [ -e $DST_DTB ]; then
-	DTB_DTS=${GENIMAGE_TMP}/rv32.dts
-	dtc -I dtb -O dts -o $DTB_DTS $DST_DTB
-	INITRD_START=$(sed -n -E 's/.*linux,initrd-start[[:space:]]*=[[:space:]]*<([^>]+)>.*/\1/p' $DTB_DTS | head -n 1)
-	if [ -n "$INITRD_START" ]; then
-		INITRD_SIZE=$(stat -c%s $DST_ROOTFS_CPIO_GZ)
-		INITRD_END=$(printf "0x%x" $((INITRD_START + INITRD_SIZE)))
-		sed -i -E "s/(linux,initrd-end[[:space:]]*=[[:space:]]*<)0x[0-9a-fA-F]+(>)/\1${INITRD_END}\2/" $DTB_DTS
-		dtc -I dts -O dtb -o $DST_DTB $DTB_DTS
-	fi
+	INITRD_START=$(python3 -c 'import json, sys; print(json.load(open(sys.argv[1])).get(sys.argv[2], ""))' \
+		$LINUX_ON_VEXRISCV_OUT_DIR/boot.json $(basename $DST_INITRD) 2>/dev/null || true)
+	python3 $BR2_EXTERNAL_LITEX_VEXRISCV_PATH/../dtb_patch.py --initrd $DST_INITRD \
+		${INITRD_START:+--initrd-start $INITRD_START} $DST_DTB
 fi
 
 # Pass an empty rootpath. genimage makes a full copy of the given rootpath to
@@ -56,11 +101,34 @@ ROOTPATH_TMP="$(mktemp -d)"
 
 rm -rf "${GENIMAGE_TMP}"
 
-genimage \
-    --rootpath "${ROOTPATH_TMP}"   \
-    --tmppath "${GENIMAGE_TMP}"    \
-    --inputpath "${LINUX_ON_VEXRISCV_OUT_DIR}"  \
-    --outputpath "${LINUX_ON_VEXRISCV_OUT_DIR}" \
-    --config "${GENIMAGE_CFG}"
+# SDCard rootfs partition from the selected RootFS image, boot partition with boot.json and the
+# images it loads (make.py boot layout: compressed/bundled boot images), else with the selected
+# initramfs.
+SDCARD_IMG=$LINUX_ON_VEXRISCV_OUT_DIR/sdcard.img
+SDCARD_PY=$BR2_EXTERNAL_LITEX_VEXRISCV_PATH/../sdcard.py
+GENIMAGE_ROOTFS_CFG="${BUILD_DIR}/genimage.cfg"
+python3 $SDCARD_PY config "${GENIMAGE_CFG}" "${GENIMAGE_ROOTFS_CFG}" \
+    --boot-json "${LINUX_ON_VEXRISCV_OUT_DIR}/boot.json" \
+    --inputpath "${LINUX_ON_VEXRISCV_OUT_DIR}" \
+    --rootfs "rootfs.${ROOTFS_TYPE}" \
+    --initrd "$(basename $DST_INITRD)"
+
+# When the genimage configuration is unchanged, only the changed boot files/rootfs blocks of the
+# existing sdcard.img are updated (sdcard.py update): write it with sdcard.py write.
+if [ -e "${SDCARD_IMG}" ] && cmp -s "${GENIMAGE_ROOTFS_CFG}" "${SDCARD_IMG}.cfg" && \
+   PATH="$HOST_DIR/bin:$PATH" python3 $SDCARD_PY update --config "${GENIMAGE_ROOTFS_CFG}" \
+    --inputpath "${LINUX_ON_VEXRISCV_OUT_DIR}" "${SDCARD_IMG}"; then
+	echo "${SDCARD_IMG} updated."
+else
+	rm -f "${SDCARD_IMG}.cfg"
+	genimage \
+	    --rootpath "${ROOTPATH_TMP}"   \
+	    --tmppath "${GENIMAGE_TMP}"    \
+	    --inputpath "${LINUX_ON_VEXRISCV_OUT_DIR}"  \
+	    --outputpath "${LINUX_ON_VEXRISCV_OUT_DIR}" \
+	    --config "${GENIMAGE_ROOTFS_CFG}"
+	cp "${GENIMAGE_ROOTFS_CFG}" "${SDCARD_IMG}.cfg"
+fi
+python3 $SDCARD_PY bmap "${SDCARD_IMG}"
 
 exit $?
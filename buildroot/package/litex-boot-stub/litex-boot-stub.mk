@@ -0,0 +1,24 @@
+################################################################################
+#
+# litex-boot-stub
+#
+################################################################################
+
+LITEX_BOOT_STUB_VERSION = 1.0
+LITEX_BOOT_STUB_SITE = $(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/package/litex-boot-stub/src
+LITEX_BOOT_STUB_SITE_METHOD = local
+LITEX_BOOT_STUB_INSTALL_TARGET = NO
+LITEX_BOOT_STUB_INSTALL_IMAGES = YES
+
+define LITEX_BOOT_STUB_BUILD_CMDS
+	$(TARGET_MAKE_ENV) $(MAKE) -C $(@D) \
+		CC="$(TARGET_CC)" \
+		OBJCOPY="$(TARGET_OBJCOPY)"
+endef
+
+# Image.lz4 is generated by post-image.sh (so it follows kernel rebuilds).
+define LITEX_BOOT_STUB_INSTALL_IMAGES_CMDS
+	$(INSTALL) -D -m 0644 $(@D)/boot-stub.bin $(BINARIES_DIR)/boot-stub.bin
+endef
+
+$(eval $(generic-package))
@@ -0,0 +1,181 @@
+/*
+ * Boot stub: copies or decompresses (LZ4 legacy format, lz4 -l) the boot images to their load
+ * addresses after checking their CRC32, as described by the boot descriptor appended to the stub
+ * binary by boot_layout.py.
+ */
+
+typedef unsigned char u8;
+typedef unsigned int  u32;
+
+#define BOOT_MAGIC       0x5442584c /* "LXBT" */
+#define BOOT_FLAG_LZ4    0x1
+#define LZ4_LEGACY_MAGIC 0x184c2102
+
+/* Boot descriptor (little-endian, written by boot_layout.py). */
+struct boot_entry {
+	u32 src;      /* Load address of the image (as loaded by the BIOS). */
+	u32 size;
+	u32 dst;      /* Final address (== src: used in place). */
+	u32 dst_size;
+	u32 flags;
+	u32 crc32;    /* CRC32 of the loaded image. */
+};
+
+struct boot_desc {
+	u32 magic;
+	u32 count;
+	u32 next;      /* Next stage (OpenSBI) address. */
+	u32 stack_top;
+	struct boot_entry entries[];
+};
+
+int boot_stub(const struct boot_desc *desc);
+
+static u32 get_le32(const u8 *p)
+{
+	return p[0] | (p[1] << 8) | (p[2] << 16) | ((u32)p[3] << 24);
+}
+
+/* CRC32 (zlib) ---------------------------------------------------------------------------------*/
+
+static u32 crc32(const u8 *p, u32 size)
+{
+	u32 table[256];
+	u32 crc, i, j;
+
+	for (i = 0; i < 256; i++) {
+		crc = i;
+		for (j = 0; j < 8; j++)
+			crc = (crc >> 1) ^ (0xedb88320 & -(crc & 1));
+		table[i] = crc;
+	}
+	crc = 0xffffffff;
+	while (size--)
+		crc = table[(crc ^ *p++) & 0xff] ^ (crc >> 8);
+	return ~crc;
+}
+
+/* LZ4 ------------------------------------------------------------------------------------------*/
+
+static u32 get_length(const u8 **ip, const u8 *ip_end, u32 length)
+{
+	u32 b;
+
+	if (length != 15)
+		return length;
+	do {
+		if (*ip >= ip_end)
+			return 0xffffffff;
+		b = *(*ip)++;
+		length += b;
+	} while (b == 255);
+	return length;
+}
+
+/* Decompresses an LZ4 block, returns the decompressed size or -1. */
+static int unlz4_block(const u8 *ip, const u8 *ip_end, u8 *op, u8 *op_end)
+{
+	u8 *op_start = op;
+	const u8 *match;
+	u32 token, length, offset;
+
+	while (ip < ip_end) {
+		token = *ip++;
+
+		/* Literals. */
+		length = get_length(&ip, ip_end, token >> 4);
+		if (length > (u32)(ip_end - ip) || length > (u32)(op_end - op))
+			return -1;
+		while (length--)
+			*op++ = *ip++;
+
+		/* Last sequence has no match. */
+		if (ip == ip_end)
+			break;
+
+		/* Match. */
+		if (ip_end - ip < 2)
+			return -1;
+		offset = ip[0] | (ip[1] << 8);
+		ip += 2;
+		if (offset == 0 || offset > (u32)(op - op_start))
+			return -1;
+		length = get_length(&ip, ip_end, token & 15);
+		if (length == 0xffffffff || length + 4 > (u32)(op_end - op))
+			return -1;
+		length += 4;
+		match = op - offset;
+		while (length--)
+			*op++ = *match++;
+	}
+	return op - op_start;
+}
+
+static int unlz4(const u8 *ip, u32 size, u8 *op, u32 dst_size)
+{
+	const u8 *ip_end = ip + size;
+	u8 *op_end       = op + dst_size;
+	int n;
+
+	if (size < 4 || get_le32(ip) != LZ4_LEGACY_MAGIC)
+		return -1;
+	ip += 4;
+
+	/* Blocks: 32-bit compressed size + LZ4 block (independent blocks of up to 8MB). */
+	while (ip_end - ip >= 4) {
+		size = get_le32(ip);
+		ip += 4;
+		/* Concatenated streams. */
+		if (size == LZ4_LEGACY_MAGIC)
+			continue;
+		if (size > (u32)(ip_end - ip))
+			return -1;
+		n = unlz4_block(ip, ip + size, op, op_end);
+		if (n < 0)
+			return -1;
+		ip += size;
+		op += n;
+	}
+	return op == op_end ? 0 : -1;
+}
+
+/* Copy -----------------------------------------------------------------------------------------*/
+
+static void copy(const u8 *src, u8 *dst, u32 size)
+{
+	/* Word copy when aligned (load addresses are at least 4-byte aligned). */
+	if ((((u32)src | (u32)dst) & 3) == 0) {
+		for (; size >= 4; size -= 4, src += 4, dst += 4)
+			*(u32 *)dst = *(const u32 *)src;
+	}
+	while (size--)
+		*dst++ = *src++;
+}
+
+/* Boot -----------------------------------------------------------------------------------------*/
+
+int boot_stub(const struct boot_desc *desc)
+{
+	const struct boot_entry *e;
+	const u8 *src;
+	u8 *dst;
+	u32 i;
+
+	if (desc->magic != BOOT_MAGIC)
+		return -1;
+
+	for (i = 0; i < desc->count; i++) {
+		e   = &desc->entries[i];
+		src = (const u8 *)e->src;
+		dst = (u8 *)e->dst;
+		if (crc32(src, e->size) != e->crc32)
+			return -1;
+		if (e->flags & BOOT_FLAG_LZ4) {
+			if (unlz4(src, e->size, dst, e->dst_size) < 0)
+				return -1;
+		} else if (src != dst) {
+			copy(src, dst, e->size);
+		}
+	}
+	return 0;
+}
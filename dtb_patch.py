@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import shutil
+import struct
+import argparse
+import subprocess
+
+# Image Files --------------------------------------------------------------------------------------
+
+# Images are replaced (written to a temporary file renamed over them), never rewritten in place: they
+# can be served while being regenerated (tftp_server.py mmaps them) and a mapped file truncated under
+# a reader crashes it (SIGBUS).
+
+def write_image(filename, data):
+    tmp = f"{filename}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, filename)
+
+# Flattened Device Tree ----------------------------------------------------------------------------
+
+# Minimal FDT (DTB) reader/patcher: properties are patched in place (same length), which is enough
+# to update integer properties (ex: linux,initrd-start/end) without a dtc decompile/recompile.
+
+FDT_MAGIC      = 0xd00dfeed
+FDT_BEGIN_NODE = 0x1
+FDT_END_NODE   = 0x2
+FDT_PROP       = 0x3
+FDT_NOP        = 0x4
+FDT_END        = 0x9
+
+def _align4(n):
+    return (n + 3) & ~3
+
+# Returns {(node_path, property_name): (value_offset, value_length)}.
+def get_dtb_properties(dtb):
+    magic, _, off_struct, off_strings = struct.unpack_from(">IIII", dtb, 0)
+    if magic != FDT_MAGIC:
+        raise ValueError("Invalid DTB (bad magic)")
+
+    def get_string(offset):
+        end = dtb.index(b"\0", off_strings + offset)
+        return dtb[off_strings + offset:end].decode()
+
+    properties = {}
+    path       = []
+    offset     = off_struct
+    while True:
+        token, = struct.unpack_from(">I", dtb, offset)
+        offset += 4
+        if token == FDT_BEGIN_NODE:
+            end = dtb.index(b"\0", offset)
+            path.append(dtb[offset:end].decode())
+            offset = _align4(end + 1)
+        elif token == FDT_END_NODE:
+            path.pop()
+        elif token == FDT_PROP:
+            length, nameoff = struct.unpack_from(">II", dtb, offset)
+            offset += 8
+            node = "/" + "/".join(path[1:])
+            properties[(node, get_string(nameoff))] = (offset, length)
+            offset = _align4(offset + length)
+        elif token == FDT_NOP:
+            pass
+        elif token == FDT_END:
+            return properties
+        else:
+            raise ValueError(f"Invalid DTB (unknown token 0x{token:x})")
+
+def get_dtb_int(dtb, node, name):
+    try:
+        offset, length = get_dtb_properties(dtb)[(node, name)]
+    except KeyError:
+        return None
+    return int.from_bytes(dtb[offset:offset + length], "big")
+
+def set_dtb_int(dtb, node, name, value):
+    offset, length = get_dtb_properties(dtb)[(node, name)]
+    dtb[offset:offset + length] = value.to_bytes(length, "big")
+
+# Initrd -------------------------------------------------------------------------------------------
+
+# Sets /chosen linux,initrd-end (and optionally linux,initrd-start) from the initrd size and returns
+# the (start, end) range, or None when the DTB has no initrd. Without initrd file (not built yet),
+# the range keeps its current size.
+def patch_dtb_initrd(dtb_filename, initrd_filename=None, initrd_start=None):
+    with open(dtb_filename, "rb") as f:
+        dtb = bytearray(f.read())
+    dtb_initrd_start = get_dtb_int(dtb, "/chosen", "linux,initrd-start")
+    if dtb_initrd_start is None:
+        return None
+    if initrd_filename is None:
+        initrd_size = get_dtb_int(dtb, "/chosen", "linux,initrd-end") - dtb_initrd_start
+    else:
+        initrd_size = os.path.getsize(initrd_filename)
+    if initrd_start is None:
+        initrd_start = dtb_initrd_start
+    else:
+        set_dtb_int(dtb, "/chosen", "linux,initrd-start", initrd_start)
+    initrd_end = initrd_start + initrd_size
+    set_dtb_int(dtb, "/chosen", "linux,initrd-end", initrd_end)
+    write_image(dtb_filename, dtb)
+    return initrd_start, initrd_end
+
+# Combine ------------------------------------------------------------------------------------------
+
+# Generates the DTB loaded by the boot (images/rv32.dtb) from the board DTB and Device Tree Overlays.
+def combine_dtb(dtb_in, dtb_out, overlays=""):
+    os.makedirs(os.path.dirname(dtb_out) or ".", exist_ok=True)
+    tmp = f"{dtb_out}.tmp-{os.getpid()}"
+    if overlays == "":
+        shutil.copyfile(dtb_in, tmp)
+    else:
+        subprocess.check_call(["fdtoverlay", "-i", dtb_in, "-o", tmp, *overlays.split()])
+    os.replace(tmp, dtb_out)
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Patch the initrd range of a DTB in place.")
+    parser.add_argument("dtb",                                     help="DTB file to patch.")
+    parser.add_argument("--initrd",       required=True,           help="Initrd file (ex: rootfs.cpio.gz).")
+    parser.add_argument("--initrd-start", default=None, type=lambda x: int(x, 0),
+        help="Also set linux,initrd-start (default: keep the DTB one).")
+    args = parser.parse_args()
+
+    initrd = patch_dtb_initrd(args.dtb, args.initrd, args.initrd_start)
+    if initrd is None:
+        print(f"{args.dtb}: no linux,initrd-start, not patched.")
+    else:
+        print(f"{args.dtb}: initrd 0x{initrd[0]:08x}-0x{initrd[1]:08x}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import json
+import hashlib
+import tempfile
+
+# Delta Flashing -----------------------------------------------------------------------------------
+
+# Programs only the SPI flash sectors that differ from the current contents (make.py --flash-delta):
+# - the current contents of the sectors covered by the images are read back when the programmer
+#   supports it (OpenOCD jtagspi, openFPGALoader) and compared per erase sector.
+# - otherwise the sectors are compared with the checksums recorded at the last flashing (flash
+#   state file): the flash is then assumed to not have been written by other means.
+# - differing sectors are programmed with prog.flash(offset, file), runs separated by a few unchanged
+#   sectors being merged (one programmer call costs more than re-programming a few sectors). With
+#   OpenOCD, all the runs are programmed in a single session (one jtagspi_init/fpga_program).
+
+flash_sector_size = 0x10000 # SPI flash erase sector (64KB).
+flash_merge_gap   = 4       # Unchanged sectors merged between two differing runs.
+
+def read_flash_openocd(prog, offset, size, filename):
+    config      = prog.find_config()
+    flash_proxy = prog.find_flash_proxy()
+    script = "; ".join([
+        "init",
+        "jtagspi_init 0 {{{}}}".format(flash_proxy),
+        "flash read_bank 0 {{{}}} 0x{:x} 0x{:x}".format(filename, offset, size),
+        "exit",
+    ])
+    prog.call(["openocd", "-f", config, "-c", script])
+
+def read_flash_openfpgaloader(prog, offset, size, filename):
+    prog.call(prog.cmd + ["--dump-flash", "--offset", str(offset), "--file-size", str(size), filename])
+
+flash_readers = {
+    "OpenOCD"        : read_flash_openocd,
+    "OpenFPGALoader" : read_flash_openfpgaloader,
+}
+
+def read_flash(prog, offset, size):
+    # Current flash contents (None when the programmer has no read back support). Programmers can
+    # also provide their own read_flash(offset, size, filename).
+    reader = getattr(prog, "read_flash", None)
+    if reader is None:
+        for cls in type(prog).__mro__:
+            if cls.__name__ in flash_readers:
+                reader = lambda *args, r=flash_readers[cls.__name__]: r(prog, *args)
+                break
+        else:
+            return None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "flash.bin")
+        reader(offset, size, filename)
+        with open(filename, "rb") as f:
+            return f.read().ljust(size, b"\xff")[:size]
+
+# Programmers --------------------------------------------------------------------------------------
+
+# Programmers known to write prog.flash(offset, file) at the given offset: the others ignore it
+# (VivadoProgrammer writes the file at the start of the flash), reject it (FpgaProg) or have their
+# own semantics (DFU, USBBlaster, UJProg), so only the bitstream can be flashed with them.
+flash_offset_programmers = ["OpenOCD", "OpenFPGALoader"]
+
+def get_flash_programmer(prog):
+    # Name of the programmer class implementing prog.flash.
+    for cls in type(prog).__mro__:
+        if "flash" in vars(cls):
+            return cls.__name__
+    return None
+
+def has_flash_offset_support(prog):
+    return get_flash_programmer(prog) in flash_offset_programmers
+
+def write_flash_openocd(prog, images):
+    config      = prog.find_config()
+    flash_proxy = prog.find_flash_proxy()
+    script = "; ".join([
+        "init",
+        "jtagspi_init 0 {{{}}}".format(flash_proxy),
+        *["jtagspi_program {{{}}} 0x{:x}".format(filename, offset) for offset, filename in sorted(images.items())],
+        "fpga_program",
+        "exit",
+    ])
+    prog.call(["openocd", "-f", config, "-c", script])
+
+flash_writers = {
+    "OpenOCD" : write_flash_openocd,
+}
+
+def write_flash(prog, images):
+    # images: {offset: filename}, programmed in a single session when the programmer allows it.
+    writer = flash_writers.get(get_flash_programmer(prog))
+    if writer is not None:
+        writer(prog, images)
+    else:
+        for offset, filename in sorted(images.items()):
+            prog.flash(offset, filename)
+
+# Delta Flashing Runs ------------------------------------------------------------------------------
+
+def get_flash_spans(images, sector_size=flash_sector_size):
+    # [(first sector, last sector)] covered by the images ({offset: data}), merged when contiguous.
+    spans = []
+    for offset, data in sorted(images.items()):
+        first, last = offset // sector_size, (offset + max(len(data), 1) - 1) // sector_size
+        if spans and first <= spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], last))
+        else:
+            spans.append((first, last))
+    return spans
+
+def get_flash_runs(sectors, known, merge_gap=flash_merge_gap):
+    # [(first sector, last sector)] runs to program from the sorted differing sectors (only merged
+    # over known sectors: the others would be erased).
+    runs = []
+    for sector in sectors:
+        gap = range(runs[-1][1] + 1, sector) if runs else None
+        if runs and len(gap) <= merge_gap and all(s in known for s in gap):
+            runs[-1] = (runs[-1][0], sector)
+        else:
+            runs.append((sector, sector))
+    return runs
+
+def flash_delta(prog, images, state=None, sector_size=flash_sector_size, merge_gap=flash_merge_gap):
+    # images: {offset: filename}. Returns (programmed sectors, total sectors).
+    datas = {}
+    for offset, filename in images.items():
+        with open(filename, "rb") as f:
+            datas[offset] = f.read()
+    recorded = {}
+    if state is not None and os.path.exists(state):
+        with open(state) as f:
+            recorded = {int(k): v for k, v in json.load(f).items()}
+
+    # Desired/current sectors contents (uncovered bytes of partially covered sectors are kept when
+    # read back, erased otherwise).
+    desired = {}
+    current = {}
+    for first, last in get_flash_spans(datas, sector_size):
+        data = read_flash(prog, first*sector_size, (last - first + 1)*sector_size)
+        for sector in range(first, last + 1):
+            if data is not None:
+                current[sector] = data[(sector - first)*sector_size:(sector - first + 1)*sector_size]
+            desired[sector] = bytearray(current.get(sector, b"\xff"*sector_size))
+    for offset, data in datas.items():
+        for sector in range(offset // sector_size, (offset + len(data) - 1) // sector_size + 1):
+            start = max(offset, sector*sector_size)
+            end   = min(offset + len(data), (sector + 1)*sector_size)
+            desired[sector][start - sector*sector_size:end - sector*sector_size] = data[start - offset:end - offset]
+
+    differing = []
+    for sector in sorted(desired):
+        if sector in current:
+            if current[sector] != desired[sector]:
+                differing.append(sector)
+        elif recorded.get(sector) != hashlib.sha256(desired[sector]).hexdigest():
+            differing.append(sector)
+
+    # Program the differing runs (merged runs also include the unchanged sectors between them).
+    runs = get_flash_runs(differing, desired, merge_gap)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = {}
+        for first, last in runs:
+            files[first*sector_size] = os.path.join(tmpdir, f"flash_{first:05x}.bin")
+            with open(files[first*sector_size], "wb") as f:
+                for sector in range(first, last + 1):
+                    f.write(desired[sector])
+        if files:
+            write_flash(prog, files)
+
+    if state is not None:
+        recorded.update({sector: hashlib.sha256(data).hexdigest() for sector, data in desired.items()})
+        with open(state, "w") as f:
+            json.dump({str(k): v for k, v in sorted(recorded.items())}, f, indent=0)
+    return sum(last - first + 1 for first, last in runs), len(desired)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import sys
+import zlib
+import shutil
+import struct
+import argparse
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+from dtb_patch import write_image
+
+# Initramfs ----------------------------------------------------------------------------------------
+
+# Initramfs (rootfs.cpio) compression (make.py --initrd-compression): decompression speed of the
+# kernel on VexRiscv is lz4 > zstd > gzip, none skipping it (at the cost of a larger image to load).
+# The compression is done on the host in post-image.sh, using all the cores:
+# - gzip: independent 1MB deflate chunks (primed with the previous 32KB, as pigz) in one gzip member.
+# - lz4:  LZ4 legacy format (the only one supported by the kernel) with independent 1MB blocks.
+# - zstd: zstd multithreading (1MB window: allocated by the kernel when unpacking).
+
+initrd_images = {
+    "gzip" : "rootfs.cpio.gz",
+    "lz4"  : "rootfs.cpio.lz4",
+    "zstd" : "rootfs.cpio.zst",
+    "none" : "rootfs.cpio",
+}
+
+initrd_chunk_size = 1 << 20
+lz4_legacy_magic  = 0x184c2102
+
+def get_initrd_image(compression="gzip"):
+    return initrd_images[compression]
+
+def _get_chunks(data):
+    return [data[i:i + initrd_chunk_size] for i in range(0, len(data), initrd_chunk_size)] or [b""]
+
+def _gzip_compress(data, jobs):
+    chunks = _get_chunks(data)
+    def compress(i):
+        kwargs = {"zdict": data[max(0, i*initrd_chunk_size - 32768):i*initrd_chunk_size]} if i else {}
+        c = zlib.compressobj(9, zlib.DEFLATED, -15, 9, **kwargs)
+        # Byte-aligned (sync flush) chunks, the last one ending the deflate stream.
+        return c.compress(chunks[i]) + c.flush(zlib.Z_FINISH if i == len(chunks) - 1 else zlib.Z_SYNC_FLUSH)
+    with ThreadPoolExecutor(jobs) as pool:
+        deflate = b"".join(pool.map(compress, range(len(chunks))))
+    header  = struct.pack("<BBBBIBB", 0x1f, 0x8b, 8, 0, 0, 2, 3)
+    trailer = struct.pack("<II", zlib.crc32(data), len(data) & 0xffffffff)
+    return header + deflate + trailer
+
+def _lz4_compress(data, jobs):
+    lz4 = shutil.which("lz4")
+    if lz4 is None:
+        raise FileNotFoundError("lz4 is required for the lz4 initramfs compression")
+    def compress(chunk):
+        # Each chunk is one legacy block (chunk < 8MB legacy block size): keep the block only.
+        out = subprocess.run([lz4, "-l", "-9", "-c", "-q"], input=chunk, stdout=subprocess.PIPE, check=True).stdout
+        return out[4:]
+    with ThreadPoolExecutor(jobs) as pool:
+        blocks = b"".join(pool.map(compress, _get_chunks(data) if data else []))
+    return struct.pack("<I", lz4_legacy_magic) + blocks
+
+def _zstd_compress(data, jobs):
+    zstd = shutil.which("zstd")
+    if zstd is None:
+        raise FileNotFoundError("zstd is required for the zstd initramfs compression")
+    cmd = [zstd, "-19", f"-T{jobs}", "--zstd=wlog=20", "-c", "-q"]
+    return subprocess.run(cmd, input=data, stdout=subprocess.PIPE, check=True).stdout
+
+def compress_initrd(src, dst, compression="gzip", jobs=None):
+    jobs = jobs or os.cpu_count()
+    with open(src, "rb") as f:
+        data = f.read()
+    if compression != "none":
+        data = {"gzip": _gzip_compress, "lz4": _lz4_compress, "zstd": _zstd_compress}[compression](data, jobs)
+    if os.path.abspath(src) != os.path.abspath(dst):
+        write_image(dst, data)
+    return len(data)
+
+# Boot Time ----------------------------------------------------------------------------------------
+
+# Initramfs unpack time from the kernel log (CONFIG_PRINTK_TIME timestamps): from "Trying to unpack
+# rootfs image as initramfs..." to "Freeing initrd memory". With make.py --initrd-timing, the
+# initramfs is unpacked synchronously (initramfs_async=0): other initcalls don't run meanwhile.
+
+def get_initrd_unpack_time(log):
+    start = re.search(r"\[\s*(\d+\.\d+)\] Trying to unpack rootfs image as initramfs", log)
+    end   = re.search(r"\[\s*(\d+\.\d+)\] Freeing initrd memory", log)
+    if start is None or end is None:
+        return None
+    return float(end.group(1)) - float(start.group(1))
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Initramfs compression/unpack time measurement.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compress = subparsers.add_parser("compress", help="Compress rootfs.cpio (using all the cores).")
+    compress.add_argument("rootfs_cpio",                                  help="Uncompressed initramfs (rootfs.cpio).")
+    compress.add_argument("--compression", default="gzip",                help="Compression.", choices=list(initrd_images))
+    compress.add_argument("--output",      default=None,                  help="Output file (default: next to rootfs.cpio, named from the compression).")
+    compress.add_argument("--jobs",        default=None, type=int,        help="Number of threads (default: all cores).")
+    boot_time = subparsers.add_parser("boot-time", help="Initramfs unpack time from a kernel boot log.")
+    boot_time.add_argument("log",                                         help="Boot log/dmesg output (- for stdin).")
+    args = parser.parse_args()
+
+    if args.command == "compress":
+        output = args.output or os.path.join(os.path.dirname(args.rootfs_cpio), get_initrd_image(args.compression))
+        size   = compress_initrd(args.rootfs_cpio, output, args.compression, args.jobs)
+        print(f"{output}: {size} bytes ({args.compression}).")
+    else:
+        if args.log == "-":
+            log = sys.stdin.read()
+        else:
+            with open(args.log, errors="replace") as f:
+                log = f.read()
+        unpack_time = get_initrd_unpack_time(log)
+        if unpack_time is None:
+            raise ValueError("No initramfs unpack messages found in the log (CONFIG_PRINTK_TIME required)")
+        print(f"Initramfs unpacked in {unpack_time:.3f}s.")
+
+if __name__ == "__main__":
+    main()
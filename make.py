@@ -7,17 +7,25 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import os
-import re
+import gc
 import sys
+import copy
+import json
+import time
 import argparse
 import shutil
+import subprocess
 
-from litex.soc.integration.builder import Builder
-from litex.soc.integration.soc import SoCBusHandler
-from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+# Note: LiteX (and soc_linux) imports are deferred until a board is built, so --list/--help and the
+# helpers below do not pay for them.
 
 from boards import *
-from soc_linux import SoCLinux
+from boards_manifest import camel_to_snake, get_boards_manifest, filter_boards_manifest
+from build_cache import get_build_cache_key, restore_build_cache, store_build_cache
+from boot_layout import generate_boot_json, get_boot_json_images, get_initrd_start, generate_flash_boot
+from boot_layout import get_missing_boot_stub_images
+from dtb_patch   import combine_dtb
+from initrd      import initrd_images, get_initrd_image
 
 #---------------------------------------------------------------------------------------------------
 # Helpers
@@ -37,10 +45,6 @@ def parse_kwargs(remaining):
             kwargs[key] = split[1]
     return kwargs
 
-def camel_to_snake(name):
-    name = re.sub(r'(?<=[a-z])(?=[A-Z])', '_', name)
-    return name.lower()
-
 def get_supported_boards():
     board_classes = {}
     for name, obj in globals().items():
@@ -49,26 +53,91 @@ def get_supported_boards():
             board_classes[name] = obj
     return board_classes
 
+# Board bitstream configuration (boards.py bitstream_config) to vendor toolchain settings.
+ecp5_spimodes = {1: "fast-read", 2: "dual-spi", 4: "qspi"}
+
+def get_vivado_bitstream_commands(bitstream_config):
+    properties = []
+    if bitstream_config.get("compress", False):
+        properties.append(("BITSTREAM.GENERAL.COMPRESS", "TRUE"))
+    if "config_clk_freq" in bitstream_config:
+        properties.append(("BITSTREAM.CONFIG.CONFIGRATE", bitstream_config["config_clk_freq"]))
+    if "spi_buswidth" in bitstream_config:
+        properties.append(("BITSTREAM.CONFIG.SPI_BUSWIDTH", bitstream_config["spi_buswidth"]))
+    if bitstream_config.get("spi_fall_edge", False):
+        properties.append(("BITSTREAM.CONFIG.SPI_FALL_EDGE", "YES"))
+    if bitstream_config.get("spi_32bit_addr", False):
+        properties.append(("BITSTREAM.CONFIG.SPI_32BIT_ADDR", "YES"))
+    return [f"set_property {name} {value} [current_design]" for name, value in properties]
+
+def get_trellis_build_kwargs(bitstream_config):
+    build_kwargs = {"compress": bitstream_config.get("compress", True)}
+    if "config_clk_freq" in bitstream_config:
+        build_kwargs["freq"] = float(bitstream_config["config_clk_freq"])
+    if "spi_buswidth" in bitstream_config:
+        build_kwargs["spimode"] = ecp5_spimodes[bitstream_config["spi_buswidth"]]
+    return build_kwargs
+
+def apply_bitstream_config(platform, bitstream_config, build_kwargs):
+    # Returns False when the toolchain is not supported (bitstream_config ignored).
+    toolchain = type(platform.toolchain).__name__
+    if toolchain == "XilinxVivadoToolchain":
+        platform.toolchain.bitstream_commands += get_vivado_bitstream_commands(bitstream_config)
+    elif toolchain == "LatticeTrellisToolchain":
+        build_kwargs.update(get_trellis_build_kwargs(bitstream_config))
+    else:
+        return False
+    return True
+
 def get_buildroot_base_defconfig():
     return "litex_vexriscv_defconfig"
 
+# Read-only compressed RootFS images (SDCard rootfs partition, tmpfs overlay for writes).
+ro_rootfs_types = ["squashfs", "erofs"]
+
+ro_rootfs_buildroot_config = {
+    "squashfs" : [
+        "BR2_TARGET_ROOTFS_SQUASHFS=y",
+        "BR2_TARGET_ROOTFS_SQUASHFS4_LZ4=y",   # Fastest decompression on VexRiscv.
+        "BR2_TARGET_ROOTFS_SQUASHFS_BS_64K=y", # Smaller blocks: less data read/decompressed per page.
+    ],
+    "erofs" : [
+        "BR2_TARGET_ROOTFS_EROFS=y",
+        "BR2_TARGET_ROOTFS_EROFS_LZ4HC=y",
+    ],
+}
+
+# Initramfs compression (rootfs.cpio compressed in post-image.sh with initrd.py, using all the cores):
+# host compressor and kernel decompressor (RD_GZIP/RD_LZ4 already enabled by linux.config).
+initrd_compression_buildroot_config = {
+    "gzip" : [],
+    "lz4"  : ["BR2_PACKAGE_HOST_LZ4=y"],
+    "zstd" : ["BR2_PACKAGE_HOST_ZSTD=y"],
+    "none" : [],
+}
+
 def get_buildroot_config_overrides(
     *,
-    with_usb_host  = False,
-    with_aes       = False,
-    with_fpu       = False,
-    with_nfs_root  = False,
+    with_usb_host           = False,
+    with_aes                = False,
+    with_fpu                = False,
+    with_nfs_root           = False,
+    with_ro_rootfs          = None,
+    with_initrd_compression = "gzip",
+    with_boot_stub          = False,
+    with_boot_compression   = "none",
 ):
     overrides              = []
     linux_config_fragments = []
+    rootfs_overlays        = []
+    post_script_args       = []
 
     if with_usb_host:
         overrides += [
             'BR2_LINUX_KERNEL_CUSTOM_CONFIG_FILE="'
             '$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv_usbhost/linux.config"',
-            'BR2_ROOTFS_OVERLAY="'
-            '$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv_usbhost/rootfs_overlay"',
         ]
+        rootfs_overlays.append("$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv_usbhost/rootfs_overlay")
 
     if with_fpu:
         linux_config_fragments.append(
@@ -97,6 +166,43 @@ def get_buildroot_config_overrides(
             "BR2_TARGET_ROOTFS_TAR=y",
         ]
 
+    if with_ro_rootfs is not None:
+        linux_config_fragments.append(
+            f"$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv/linux-{with_ro_rootfs}.config"
+        )
+        overrides += ro_rootfs_buildroot_config[with_ro_rootfs]
+        post_script_args.append(f"rootfs={with_ro_rootfs}")
+        # Overlay init script (mounted before /sbin/init), on top of the board overlay.
+        if not rootfs_overlays:
+            rootfs_overlays.append("$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv/rootfs_overlay")
+        rootfs_overlays.append("$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv/rootfs_overlay_ro")
+
+    if with_initrd_compression != "gzip":
+        if with_initrd_compression == "zstd":
+            linux_config_fragments.append(
+                "$(BR2_EXTERNAL_LITEX_VEXRISCV_PATH)/board/litex_vexriscv/linux-initrd-zstd.config"
+            )
+        overrides += initrd_compression_buildroot_config[with_initrd_compression]
+        post_script_args.append(f"initrd={with_initrd_compression}")
+
+    # Boot stub (--boot-compression=lz4/--boot-bundle/--flash-boot), Image.lz4 generated by
+    # post-image.sh with host-lz4.
+    if with_boot_stub:
+        overrides += ["BR2_PACKAGE_LITEX_BOOT_STUB=y"]
+    if with_boot_compression == "lz4":
+        overrides += ["BR2_PACKAGE_HOST_LZ4=y"]
+        post_script_args.append("boot=lz4")
+
+    if post_script_args:
+        overrides += [
+            'BR2_ROOTFS_POST_SCRIPT_ARGS="{}"'.format(" ".join(post_script_args)),
+        ]
+
+    if rootfs_overlays:
+        overrides += [
+            'BR2_ROOTFS_OVERLAY="{}"'.format(" ".join(rootfs_overlays)),
+        ]
+
     if linux_config_fragments:
         overrides += [
             'BR2_LINUX_KERNEL_CONFIG_FRAGMENT_FILES="{}"'.format(
@@ -140,10 +246,14 @@ def unset_buildroot_config(config, symbol):
 
 def generate_buildroot_defconfig(
     filename,
-    with_usb_host = False,
-    with_aes      = False,
-    with_fpu      = False,
-    with_nfs_root = False,
+    with_usb_host           = False,
+    with_aes                = False,
+    with_fpu                = False,
+    with_nfs_root           = False,
+    with_ro_rootfs          = None,
+    with_initrd_compression = "gzip",
+    with_boot_stub          = False,
+    with_boot_compression   = "none",
 ):
     base_defconfig = get_buildroot_base_defconfig()
     base_path      = os.path.join(
@@ -160,12 +270,23 @@ def generate_buildroot_defconfig(
         "BR2_RISCV_ABI_ILP32D"                  : "BR2_RISCV_ABI_ILP32",
         "BR2_LINUX_KERNEL_CONFIG_FRAGMENT_FILES": "BR2_LINUX_KERNEL_CUSTOM_CONFIG_FILE",
         "BR2_TARGET_ROOTFS_TAR"                 : "BR2_TARGET_ROOTFS_EXT2_4",
+        "BR2_TARGET_ROOTFS_SQUASHFS"            : "BR2_TARGET_ROOTFS_EXT2_4",
+        "BR2_TARGET_ROOTFS_SQUASHFS4_LZ4"       : "BR2_TARGET_ROOTFS_SQUASHFS",
+        "BR2_TARGET_ROOTFS_SQUASHFS_BS_64K"     : "BR2_TARGET_ROOTFS_SQUASHFS4_LZ4",
+        "BR2_TARGET_ROOTFS_EROFS"               : "BR2_TARGET_ROOTFS_EXT2_4",
+        "BR2_TARGET_ROOTFS_EROFS_LZ4HC"         : "BR2_TARGET_ROOTFS_EROFS",
+        "BR2_ROOTFS_POST_SCRIPT_ARGS"           : "BR2_ROOTFS_POST_IMAGE_SCRIPT",
+        "BR2_PACKAGE_LITEX_BOOT_STUB"           : "BR2_TARGET_OPENSBI_INSTALL_DYNAMIC_IMG",
     }
     for option in get_buildroot_config_overrides(
-        with_usb_host = with_usb_host,
-        with_aes      = with_aes,
-        with_fpu      = with_fpu,
-        with_nfs_root = with_nfs_root,
+        with_usb_host           = with_usb_host,
+        with_aes                = with_aes,
+        with_fpu                = with_fpu,
+        with_nfs_root           = with_nfs_root,
+        with_ro_rootfs          = with_ro_rootfs,
+        with_initrd_compression = with_initrd_compression,
+        with_boot_stub          = with_boot_stub,
+        with_boot_compression   = with_boot_compression,
     ):
         if option.startswith("# ") and option.endswith(" is not set"):
             unset_buildroot_config(config, option[2:-11])
@@ -181,237 +302,581 @@ def generate_buildroot_defconfig(
 
 supported_boards = get_supported_boards()
 
+vexriscv_smp_defaults = None
+
+# Arguments that select actions/parallelism but do not change the generated outputs.
+cache_ignored_args = ["load", "flash", "flash_delta", "flash_image", "doc", "jobs", "shard", "cache", "cache_dir", "build_dir", "images_dir"]
+
+def reset_vexriscv_smp_config():
+    # VexRiscvSMP.args_read configures the CPU through class attributes: snapshot them on first
+    # use and restore them before each board.
+    from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+    global vexriscv_smp_defaults
+    if vexriscv_smp_defaults is None:
+        vexriscv_smp_defaults = {k: v for k, v in vars(VexRiscvSMP).items()
+            if not k.startswith("_") and isinstance(v, (bool, int, float, str))}
+    for k, v in vexriscv_smp_defaults.items():
+        setattr(VexRiscvSMP, k, v)
+
+def reset_peak_rss():
+    # Reset the peak RSS (VmHWM) of the process (Linux >= 4.0), so it can be reported per board.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def get_peak_rss():
+    # Peak RSS in KiB, falling back to the process lifetime peak when /proc is not available.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#---------------------------------------------------------------------------------------------------
+# Parallel Build
+#---------------------------------------------------------------------------------------------------
+
+def get_board_shard(board_names, shard):
+    try:
+        index, count = (int(n) for n in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {shard!r}, expected i/n (ex: 1/4)")
+    if not (1 <= index <= count):
+        raise ValueError(f"Invalid shard {shard!r}, i must be in 1..n")
+    return board_names[index - 1::count]
+
+def get_flash_images(flash_images):
+    # {offset: filename} from --flash-image FILE@OFFSET arguments.
+    images = {}
+    for flash_image in flash_images:
+        filename, sep, offset = flash_image.rpartition("@")
+        try:
+            images[int(offset, 0)] = filename
+        except ValueError:
+            sep = ""
+        if not sep or not filename:
+            raise ValueError(f"Invalid flash image {flash_image!r}, expected FILE@OFFSET (ex: images/Image@0x400000)")
+    return images
+
+# Linux images (make.py inputs) linked in the per-board images directory of the parallel builds.
+board_input_images = ["Image", "Image.lz4", "opensbi.bin", "boot-stub.bin", *initrd_images.values()]
+
+def get_board_argv(board_name, argv, images_dir=None):
+    # Forward the command line to the per-board process, minus the board selection/parallel options
+    # and with its own images directory (outputs shared by the boards otherwise: rv32.dtb, boot.json).
+    board_argv = [f"--board={board_name}"]
+    skip       = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        option = arg.split("=", 1)[0]
+        if option in ["--board", "--jobs", "--shard"] or (images_dir is not None and option == "--images-dir"):
+            skip = "=" not in arg
+            continue
+        board_argv.append(arg)
+    if images_dir is not None:
+        board_argv.append(f"--images-dir={images_dir}")
+    return board_argv
+
+def link_board_images(images_dir, board_images_dir):
+    # Per-board images directory with links to the Linux images of images_dir.
+    os.makedirs(board_images_dir, exist_ok=True)
+    for image in board_input_images:
+        src = os.path.abspath(os.path.join(images_dir, image))
+        dst = os.path.join(board_images_dir, image)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if os.path.exists(src):
+            os.symlink(src, dst)
+
+def build_boards_parallel(board_names, argv, jobs, build_dir="build", images_dir="images"):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def _build(board_name):
+        log_dir = os.path.join(build_dir, board_name)
+        os.makedirs(log_dir, exist_ok=True)
+        log_filename = os.path.join(log_dir, "make.log")
+        board_images_dir = os.path.join(log_dir, "images")
+        link_board_images(images_dir, board_images_dir)
+        cmd = [sys.executable, os.path.abspath(__file__), *get_board_argv(board_name, argv, board_images_dir)]
+        start = time.time()
+        with open(log_filename, "w", encoding="utf-8") as log:
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+            # Reap the process with wait4 to also get its peak RSS.
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, time.time() - start, rusage.ru_maxrss, log_filename
+
+    # Run each board in its own make.py process (fresh interpreter/LiteX state, isolated logs).
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_build, board_name): board_name for board_name in board_names}
+        for future in as_completed(futures):
+            board_name = futures[future]
+            results[board_name] = returncode, duration, peak_rss, log_filename = future.result()
+            status = "PASS" if returncode == 0 else "FAIL"
+            print(f"[{len(results)}/{len(board_names)}] {board_name}: {status} "
+                f"({duration:.1f}s, peak RSS {peak_rss/1024:.1f}MiB, log: {log_filename})")
+
+    # Summary.
+    failed = [board_name for board_name in board_names if results[board_name][0] != 0]
+    print(f"Summary: {len(board_names) - len(failed)} passed, {len(failed)} failed.")
+    for board_name in failed:
+        print(f"- {board_name}: FAIL (log: {results[board_name][3]})")
+    return results
+
 #---------------------------------------------------------------------------------------------------
 # Build
 #---------------------------------------------------------------------------------------------------
 
+def generate_boot_images(args, memories):
+    # boot.json and flash boot images: returns ({image: load address}, {flash offset: filename}).
+    # The boot stub images need the Linux images: before the first Buildroot build, they are skipped
+    # with a warning (the gateware build is not aborted), re-run make.py once Buildroot is built.
+    boot_layout  = {}
+    flash_images = {}
+    images  = get_boot_json_images(args.rootfs, args.boot_compression, args.initrd_compression)
+    missing = get_missing_boot_stub_images(images, args.images_dir)
+    if (args.boot_compression == "lz4" or args.boot_bundle) and missing:
+        print(f"Warning: missing {', '.join(missing)} in {args.images_dir}, boot.json not generated.")
+    else:
+        # Load addresses computed from the image sizes and the SoC memory regions (also updates the
+        # DTB initrd range to the rootfs load address).
+        boot_layout = generate_boot_json(args.rootfs, memories, args.images_dir,
+            compression        = args.boot_compression,
+            bundle             = args.boot_bundle,
+            initrd_compression = args.initrd_compression,
+        )
+    if args.flash_boot:
+        images  = get_boot_json_images(args.rootfs, initrd_compression=args.initrd_compression)
+        missing = get_missing_boot_stub_images(images, args.images_dir)
+        if missing:
+            print(f"Warning: missing {', '.join(missing)} in {args.images_dir}, flash boot images not generated.")
+        else:
+            flash_images = generate_flash_boot(images, memories, args.images_dir, int(args.flash_boot_offset, 0))
+    return boot_layout, flash_images
+
+def build_board(board_name, args):
+    from litex.soc.integration.builder import Builder
+    from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+    from soc_linux import SoCLinux
+
+    # Work on a per-board copy of the configuration: the CPU parameters below update args, and
+    # the class-level soc_kwargs/VexRiscvSMP attributes must not leak into the next board.
+    args = copy.copy(args)
+    reset_vexriscv_smp_config()
+
+    board = supported_boards[board_name]()
+    soc_kwargs = dict(Board.soc_kwargs)
+    soc_kwargs.update(board.soc_kwargs)
+    soc_kwargs.update(parse_kwargs(args.soc_kwargs))
+
+    if args.rootfs == "nfs" and "ethernet" not in board.soc_capabilities:
+        raise ValueError(f"Board {board_name} does not support Ethernet required by --rootfs=nfs")
+    if args.rootfs in ro_rootfs_types and not {"sdcard", "spisdcard"} & set(board.soc_capabilities):
+        raise ValueError(f"Board {board_name} does not support SDCard required by --rootfs={args.rootfs}")
+    if args.flash_boot and "spiflash" not in board.soc_capabilities:
+        raise ValueError(f"Board {board_name} does not support SPI Flash required by --flash-boot")
+
+    # CPU parameters -------------------------------------------------------------------------------
+
+    # If Wishbone Memory is forced, enabled L2 Cache (if not already):
+    if args.with_wishbone_memory:
+        soc_kwargs["l2_size"] = max(soc_kwargs["l2_size"], 2048) # Defaults to 2048.
+    # Else if board is configured to use L2 Cache, force use of Wishbone Memory on VexRiscv-SMP.
+    else:
+        args.with_wishbone_memory = soc_kwargs["l2_size"] != 0
+
+    if "usb_host" in board.soc_capabilities:
+        args.with_coherent_dma = True
+
+    VexRiscvSMP.args_read(args)
+
+    # SoC parameters -------------------------------------------------------------------------------
+    if args.device is not None:
+        soc_kwargs.update(device=args.device)
+    if args.variant is not None:
+        soc_kwargs.update(variant=args.variant)
+    if args.revision is not None:
+        soc_kwargs.update(revision=args.revision)
+    if args.toolchain is not None:
+        soc_kwargs.update(toolchain=args.toolchain)
+    if args.bus_standard is not None:
+        soc_kwargs.update(bus_standard=args.bus_standard)
+
+    # UART.
+    soc_kwargs["uart_baudrate"] = int(args.uart_baudrate)
+    # Default to "serial" when no special UART is requested. SoCCore also
+    # defaults to "serial", but some LiteX-Boards targets read uart_name out
+    # of kwargs before forwarding (ex: lambdaconcept_ecpix5) and KeyError
+    # when the kwarg is absent, so set it unconditionally here.
+    soc_kwargs.setdefault("uart_name", "serial")
+    if "crossover" in board.soc_capabilities:
+        soc_kwargs.update(uart_name="crossover")
+    if "usb_fifo" in board.soc_capabilities:
+        soc_kwargs.update(uart_name="usb_fifo")
+    if "usb_acm" in board.soc_capabilities:
+        soc_kwargs.update(uart_name="usb_acm")
+    # Runtime UART PHY baudrate (used by serial_boot.py for the images upload).
+    if args.uart_dynamic_baudrate and soc_kwargs["uart_name"] == "serial":
+        soc_kwargs.update(uart_with_dynamic_baudrate=True)
+
+    # Peripherals
+    if "leds" in board.soc_capabilities:
+        soc_kwargs.update(with_led_chaser=True)
+    if "ethernet" in board.soc_capabilities:
+        soc_kwargs.update({
+            "with_ethernet" : True,
+            "eth_ip"        : args.local_ip,
+            "remote_ip"     : args.remote_ip,
+        })
+    if "pcie" in board.soc_capabilities:
+        soc_kwargs.update(with_pcie=True)
+    if "spiflash" in board.soc_capabilities:
+        soc_kwargs.update(with_spi_flash=True)
+    if "sata" in board.soc_capabilities:
+        soc_kwargs.update(with_sata=True)
+    if "video_terminal" in board.soc_capabilities:
+        soc_kwargs.update(with_video_terminal=True)
+    if "framebuffer" in board.soc_capabilities:
+        soc_kwargs.update(with_video_framebuffer=True)
+    if "usb_host" in board.soc_capabilities:
+        soc_kwargs.update(with_usb_host=True)
+    if "ps_ddr" in board.soc_capabilities:
+        soc_kwargs.update(with_ps_ddr=True)
+
+    # Build cache ----------------------------------------------------------------------------------
+    build_dir = os.path.join(args.build_dir, board_name)
+    cache_dir = args.cache_dir or os.path.join(args.build_dir, ".cache")
+    cache_key = None
+    if args.cache and not args.dts_only:
+        cache_key = get_build_cache_key(
+            config = {
+                "board"      : board_name,
+                "board_cls"  : board.__class__.__qualname__,
+                "soc_kwargs" : soc_kwargs,
+                "cpu"        : {k: getattr(VexRiscvSMP, k) for k in vexriscv_smp_defaults},
+                "args"       : {k: v for k, v in vars(args).items() if k not in cache_ignored_args},
+            },
+            input_files = [
+                __file__,
+                os.path.join(os.path.dirname(__file__), "boards.py"),
+                os.path.join(os.path.dirname(__file__), "soc_linux.py"),
+                os.path.join(os.path.dirname(__file__), "build_cache.py"),
+                os.path.join(os.path.dirname(__file__), "dtb_patch.py"),
+                os.path.join(os.path.dirname(__file__), "boot_layout.py"),
+                os.path.join(os.path.dirname(__file__), "initrd.py"),
+                os.path.join(os.path.dirname(__file__), "images", f"boot_{args.rootfs}.json"),
+                os.path.join(args.images_dir, "Image"),
+                os.path.join(args.images_dir, "opensbi.bin"),
+                os.path.join(args.images_dir, "Image.lz4"),
+                os.path.join(args.images_dir, "boot-stub.bin"),
+                os.path.join(os.path.dirname(__file__), "buildroot", "configs", get_buildroot_base_defconfig()),
+                os.path.join(args.images_dir, get_initrd_image(args.initrd_compression)),
+                *args.fdtoverlays.split(),
+            ],
+        )
+        # Loading/Flashing/Documentation require the elaborated SoC: only use hits without them.
+        if not (args.load or args.flash or args.doc):
+            if restore_build_cache(cache_dir, cache_key, build_dir):
+                print(f"{board_name}: build cache hit ({cache_key[:16]}), outputs restored to {build_dir}.")
+                combine_dtb(os.path.join(build_dir, f"{board_name}.dtb"), os.path.join(args.images_dir, "rv32.dtb"), args.fdtoverlays)
+                with open(os.path.join(build_dir, "csr.json")) as f:
+                    generate_boot_images(args, json.load(f)["memories"])
+                return
+
+    # SoC creation ---------------------------------------------------------------------------------
+    soc = SoCLinux(board.soc_cls, **soc_kwargs)
+    board.platform = soc.platform
+
+    # Images flashed at an offset require a programmer writing at the given offset (checked before
+    # the build: the others would overwrite the bitstream). The --flash-boot images are always
+    # flashed at --flash-boot-offset.
+    if (args.flash_boot or (args.flash and (args.flash_delta or args.flash_image))) and not board.has_flash_offset_support():
+        raise ValueError(f"Board {board_name} programmer can't write at a flash offset required by --flash-boot/--flash-delta/--flash-image")
+
+    # SoC constants --------------------------------------------------------------------------------
+    for k, v in board.soc_constants.items():
+        soc.add_constant(k, v)
+    # BIOS flashboot of the images flashed after the bitstream (memory-mapped SPI Flash).
+    if args.flash_boot:
+        soc.add_constant("FLASH_BOOT_ADDRESS", soc.bus.regions["spiflash"].origin + int(args.flash_boot_offset, 0))
+
+    # SoC peripherals ------------------------------------------------------------------------------
+    if board_name in ["arty", "arty_a7"]:
+        from litex_boards.platforms.digilent_arty import _sdcard_pmod_io
+        board.platform.add_extension(_sdcard_pmod_io)
+
+    if board_name in ["colorlight_i5"]:
+        from litex_boards.platforms.colorlight_i5 import _sdcard_pmod_io
+        board.platform.add_extension(_sdcard_pmod_io)
+
+    if board_name in ["aesku40"]:
+        from litex_boards.platforms.avnet_aesku40 import _sdcard_pmod_io
+        board.platform.add_extension(_sdcard_pmod_io)
+
+    if board_name in ["colognechip_gatemate_evb"]:
+        from litex_boards.platforms.colognechip_gatemate_evb import pmods_sdcard_io
+        board.platform.add_extension(pmods_sdcard_io("PMODA"))
+
+    if board_name in ["orange_crab"]:
+        from litex_boards.platforms.gsd_orangecrab import feather_i2c
+        board.platform.add_extension(feather_i2c)
+
+    if "spisdcard" in board.soc_capabilities:
+        soc.add_spi_sdcard()
+    if "sdcard" in board.soc_capabilities:
+        soc.add_sdcard()
+    #if "leds" in board.soc_capabilities:
+    #    soc.add_leds()
+    if "rgb_led" in board.soc_capabilities:
+        soc.add_rgb_led()
+    if "switches" in board.soc_capabilities:
+        soc.add_switches()
+    if "spi" in board.soc_capabilities:
+        soc.add_spi(args.spi_data_width, args.spi_clk_freq)
+    if "i2c" in board.soc_capabilities:
+        soc.add_i2c()
+
+    # Build ----------------------------------------------------------------------------------------
+    build_kwargs = {
+        "run"        : args.build,
+        "build_name" : board_name,
+    }
+
+    # Agilex uses quartus_syn/quartus_pfg instead of quartus_map/quartus_cpf
+    if board_name in ["atum_a3_nano"]:
+        build_kwargs.update({
+            "synth_tool" : "quartus_syn",
+            "conv_tool"  : "quartus_pfg",
+        })
+
+    # Bitstream compression/configuration clock from the board metadata.
+    if board.bitstream_config and not args.without_bitstream_config:
+        if not apply_bitstream_config(soc.platform, board.bitstream_config, build_kwargs):
+            print(f"{board_name}: bitstream_config not supported with {type(soc.platform.toolchain).__name__}, ignored.")
+
+    builder   = Builder(soc,
+        output_dir   = build_dir,
+        bios_console = "lite",
+        csr_json     = os.path.join(build_dir, "csr.json"),
+        csr_csv      = os.path.join(build_dir, "csr.csv")
+    )
+    if args.dts_only:
+        # Only finalize the SoC and export its CSR map: no BIOS/software compilation and no
+        # gateware generation.
+        from litex.build.tools import write_to_file
+        from litex.soc.integration import export
+        soc.finalize()
+        os.makedirs(build_dir, exist_ok=True)
+        for filename, get_csr in [(builder.csr_json, export.get_csr_json), (builder.csr_csv, export.get_csr_csv)]:
+            write_to_file(filename, get_csr(
+                csr_regions = soc.csr_regions,
+                constants   = soc.constants,
+                mem_regions = soc.mem_regions,
+            ))
+    else:
+        builder.build(**build_kwargs)
+
+    # Buildroot defconfig --------------------------------------------------------------------------
+    buildroot_defconfig_file = os.path.join(build_dir, "buildroot_defconfig")
+    buildroot_base_defconfig = generate_buildroot_defconfig(
+        buildroot_defconfig_file,
+        with_usb_host           = "usb_host" in board.soc_capabilities,
+        with_aes                = VexRiscvSMP.aes_instruction,
+        with_fpu                = VexRiscvSMP.with_fpu,
+        with_nfs_root           = args.rootfs == "nfs",
+        with_ro_rootfs          = args.rootfs if args.rootfs in ro_rootfs_types else None,
+        with_initrd_compression = args.initrd_compression,
+        with_boot_stub          = args.boot_compression == "lz4" or args.boot_bundle or args.flash_boot,
+        with_boot_compression   = args.boot_compression,
+    )
+    print(f"Buildroot defconfig: {buildroot_defconfig_file}")
+    print(f"Buildroot base defconfig: {buildroot_base_defconfig}")
+
+    # DTS ------------------------------------------------------------------------------------------
+    soc.generate_dts(
+        board_name,
+        args.rootfs,
+        nfs_server    = args.remote_ip,
+        nfs_root      = args.nfs_root,
+        nfs_options   = args.nfs_options,
+        build_dir     = args.build_dir,
+        images_dir    = args.images_dir,
+        initrd        = get_initrd_image(args.initrd_compression),
+        initrd_start  = get_initrd_start(soc.get_csr_dict()["memories"]),
+        initrd_timing = args.initrd_timing,
+    )
+    if hasattr(soc, "get_fdtoverlays"):
+        fdtoverlays = soc.get_fdtoverlays(board_name, args.fdtoverlays)
+    else:
+        fdtoverlays = args.fdtoverlays
+    soc.compile_dts(board_name, fdtoverlays, build_dir=args.build_dir)
+
+    # DTB ------------------------------------------------------------------------------------------
+    soc.combine_dtb(board_name, fdtoverlays, build_dir=args.build_dir, images_dir=args.images_dir)
+
+    # boot.json/Flash boot images (flash_boot.bin/flash.json) --------------------------------------
+    boot_layout, flash_images = generate_boot_images(args, soc.get_csr_dict()["memories"])
+    for image, address in boot_layout.items():
+        print(f"boot.json: {image} @ 0x{address:08x}")
+    for offset, filename in flash_images.items():
+        print(f"flash: {os.path.basename(filename)} @ 0x{offset:08x}")
+
+    if args.dts_only:
+        return
+
+    # PCIe Driver ----------------------------------------------------------------------------------
+    if "pcie" in board.soc_capabilities:
+        from litepcie.software import generate_litepcie_software
+        generate_litepcie_software(soc, os.path.join(builder.output_dir, "driver"))
+
+    # Build cache ----------------------------------------------------------------------------------
+    if cache_key is not None:
+        store_build_cache(cache_dir, cache_key, build_dir)
+
+    # Load FPGA bitstream --------------------------------------------------------------------------
+    if args.load:
+        board.load(filename=builder.get_bitstream_filename(mode="sram"))
+
+    # Flash bitstream/images (to SPI Flash) --------------------------------------------------------
+    if args.flash:
+        board.flash(filename=builder.get_bitstream_filename(mode="flash"),
+            images = {**flash_images, **get_flash_images(args.flash_image)},
+            delta  = args.flash_delta,
+            state  = os.path.join(build_dir, "flash_state.json"),
+        )
+
+    # Generate SoC documentation -------------------------------------------------------------------
+    if args.doc:
+        soc.generate_doc(board_name, build_dir=args.build_dir)
+
+#---------------------------------------------------------------------------------------------------
+# Main
+#---------------------------------------------------------------------------------------------------
+
+def add_list_args(parser):
+    parser.add_argument("--list",           action="store_true",         help="List supported boards (without importing LiteX) and exit.")
+    parser.add_argument("--has",            default=None,                help="With --list, only list boards with these capabilities (ex: ethernet,sdcard).")
+    parser.add_argument("--json",           action="store_true",         help="With --list, print the boards metadata manifest as JSON.")
+
+def list_boards(has=None, as_json=False):
+    manifest = get_boards_manifest()
+    if has is not None:
+        manifest = filter_boards_manifest(manifest, has.split(","))
+    if as_json:
+        print(json.dumps(manifest, indent=4))
+    else:
+        for name in sorted(manifest.keys()):
+            print(name)
+
 def main():
+    # Board(s) listing (answered from the static manifest, before importing LiteX) -----------------
+    list_parser = argparse.ArgumentParser(add_help=False)
+    add_list_args(list_parser)
+    list_args, _ = list_parser.parse_known_args()
+    if list_args.list:
+        list_boards(list_args.has, list_args.json)
+        return
+
+    from litex.soc.integration.soc import SoCBusHandler
+    from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+
     description = "Linux on LiteX-VexRiscv\n\n"
     description += "Available boards:\n"
     for name in sorted(supported_boards.keys()):
         description += "- " + name + "\n"
     parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument("--board",          required=True,               help="FPGA board.")
+    parser.add_argument("--board",          default=None,                help="FPGA board (or all).")
     parser.add_argument("--device",         default=None,                help="FPGA device.")
     parser.add_argument("--variant",        default=None,                help="FPGA board variant.")
     parser.add_argument("--revision",       default=None,                help="FPGA board revision.")
     parser.add_argument("--toolchain",      default=None,                help="Toolchain use to build.")
     parser.add_argument("--bus-standard",   default=None,                help="SoC bus standard.", choices=SoCBusHandler.supported_standard)
     parser.add_argument("--uart-baudrate",  default=115.2e3, type=float, help="UART baudrate.")
+    parser.add_argument("--uart-dynamic-baudrate", action="store_true",  help="Make the UART baudrate changeable at runtime (high-speed serial_boot.py).")
     parser.add_argument("--build",          action="store_true",         help="Build bitstream.")
     parser.add_argument("--load",           action="store_true",         help="Load bitstream (to SRAM).")
+    parser.add_argument("--without-bitstream-config", action="store_true", help="Keep the toolchain default bitstream configuration (no compression/faster config clock from boards.py).")
     parser.add_argument("--flash",          action="store_true",         help="Flash bitstream/images (to Flash).")
+    parser.add_argument("--flash-delta",    action="store_true",         help="Only program the flash sectors that differ from the current contents (read back/checksums).")
+    parser.add_argument("--flash-image",    default=[], action="append", help="Linux image flashed with the bitstream, as FILE@OFFSET (ex: images/Image@0x400000), can be repeated.")
+    parser.add_argument("--flash-boot",     action="store_true",         help="Boot the Linux images from the SPI Flash (flashed after the bitstream with --flash, BIOS flashboot).")
+    parser.add_argument("--flash-boot-offset", default="0x400000",       help="SPI Flash offset of the --flash-boot images (after the bitstream).")
     parser.add_argument("--doc",            action="store_true",         help="Build documentation.")
+    parser.add_argument("--dts-only",       action="store_true",         help="Only generate csr.json/DTS/DTB (skip BIOS/software and gateware generation).")
     parser.add_argument("--local-ip",       default="192.168.1.50",      help="Local IP address.")
     parser.add_argument("--remote-ip",      default="192.168.1.100",     help="Remote IP address of TFTP server.")
     parser.add_argument("--spi-data-width", default=8,   type=int,       help="SPI data width (max bits per xfer).")
     parser.add_argument("--spi-clk-freq",   default=1e6, type=int,       help="SPI clock frequency.")
     parser.add_argument("--fdtoverlays",    default="",                  help="Device Tree Overlays to apply.")
     parser.add_argument("--rootfs",         default="ram0",              help="Location of the RootFS.",
-        choices=["ram0", "mmcblk0p2", "nfs"]
+        choices=["ram0", "mmcblk0p2", "nfs", *ro_rootfs_types]
+    )
+    parser.add_argument("--boot-compression", default="none",            help="Kernel Image compression (lz4: boot.json loads Image.lz4 + boot stub).",
+        choices=["none", "lz4"]
     )
+    parser.add_argument("--boot-bundle",    action="store_true",         help="Load the Linux images from a single boot.bin (one transfer/file read, CRC32 checked).")
+    parser.add_argument("--initrd-compression", default="gzip",          help="Initramfs compression (rootfs.cpio compressed in post-image.sh with initrd.py).",
+        choices=list(initrd_images)
+    )
+    parser.add_argument("--initrd-timing",  action="store_true",         help="Unpack the initramfs synchronously (initramfs_async=0) to measure its unpack time (initrd.py boot-time).")
     parser.add_argument("--nfs-root",       default="/srv/nfs/litex-vexriscv",
         help="NFS exported root directory when using --rootfs=nfs.")
     parser.add_argument("--nfs-options",    default="vers=3,tcp,nolock",
         help="NFS mount options when using --rootfs=nfs.")
+    parser.add_argument("--build-dir",      default="build",             help="Base build directory (outputs in <build-dir>/<board>).")
+    parser.add_argument("--images-dir",     default="images",            help="Linux images directory (rootfs input, rv32.dtb/boot.json outputs).")
+    parser.add_argument("--jobs",           default=1,   type=int,       help="Number of boards built in parallel, each in its own process.")
+    parser.add_argument("--shard",          default=None,                help="Only build shard i/n of the selected boards (ex: 1/4).")
+    parser.add_argument("--cache",          action="store_true",         help="Restore unchanged board outputs from the build cache instead of rebuilding.")
+    parser.add_argument("--cache-dir",      default=None,                help="Build cache directory (default: <build-dir>/.cache).")
+    add_list_args(parser)
     parser.add_argument("soc_kwargs", nargs=argparse.REMAINDER)
     VexRiscvSMP.args_fill(parser)
     args = parser.parse_args()
+    if args.board is None:
+        parser.error("the following arguments are required: --board")
+    if args.dts_only and (args.build or args.load or args.flash or args.doc):
+        parser.error("--dts-only can't be combined with --build/--load/--flash/--doc")
+    if (args.flash_delta or args.flash_image) and not args.flash:
+        parser.error("--flash-delta/--flash-image require --flash")
+    if args.flash_boot and (args.boot_compression != "none" or args.boot_bundle):
+        parser.error("--flash-boot can't be combined with --boot-compression/--boot-bundle")
+    try:
+        get_flash_images(args.flash_image)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Board(s) selection ---------------------------------------------------------------------------
     if args.board == "all":
         board_names = list(supported_boards.keys())
     else:
         board_names = [args.board]
+    if args.shard is not None:
+        board_names = get_board_shard(board_names, args.shard)
+
+    # Board(s) parallel build ----------------------------------------------------------------------
+    if args.jobs > 1 and len(board_names) > 1:
+        results = build_boards_parallel(board_names, sys.argv[1:], args.jobs, args.build_dir, args.images_dir)
+        if any(returncode != 0 for returncode, _, _, _ in results.values()):
+            sys.exit(1)
+        return
 
     # Board(s) iteration ---------------------------------------------------------------------------
     for board_name in board_names:
-        board = supported_boards[board_name]()
-        soc_kwargs = Board.soc_kwargs
-        soc_kwargs.update(board.soc_kwargs)
-        soc_kwargs.update(parse_kwargs(args.soc_kwargs))
-
-        if args.rootfs == "nfs" and "ethernet" not in board.soc_capabilities:
-            raise ValueError(f"Board {board_name} does not support Ethernet required by --rootfs=nfs")
-
-        # CPU parameters ---------------------------------------------------------------------------
-
-        # If Wishbone Memory is forced, enabled L2 Cache (if not already):
-        if args.with_wishbone_memory:
-            soc_kwargs["l2_size"] = max(soc_kwargs["l2_size"], 2048) # Defaults to 2048.
-        # Else if board is configured to use L2 Cache, force use of Wishbone Memory on VexRiscv-SMP.
-        else:
-            args.with_wishbone_memory = soc_kwargs["l2_size"] != 0
-
-        if "usb_host" in board.soc_capabilities:
-            args.with_coherent_dma = True
-
-        VexRiscvSMP.args_read(args)
-
-        # SoC parameters ---------------------------------------------------------------------------
-        if args.device is not None:
-            soc_kwargs.update(device=args.device)
-        if args.variant is not None:
-            soc_kwargs.update(variant=args.variant)
-        if args.revision is not None:
-            soc_kwargs.update(revision=args.revision)
-        if args.toolchain is not None:
-            soc_kwargs.update(toolchain=args.toolchain)
-        if args.bus_standard is not None:
-            soc_kwargs.update(bus_standard=args.bus_standard)
-
-        # UART.
-        soc_kwargs["uart_baudrate"] = int(args.uart_baudrate)
-        # Default to "serial" when no special UART is requested. SoCCore also
-        # defaults to "serial", but some LiteX-Boards targets read uart_name out
-        # of kwargs before forwarding (ex: lambdaconcept_ecpix5) and KeyError
-        # when the kwarg is absent, so set it unconditionally here.
-        soc_kwargs.setdefault("uart_name", "serial")
-        if "crossover" in board.soc_capabilities:
-            soc_kwargs.update(uart_name="crossover")
-        if "usb_fifo" in board.soc_capabilities:
-            soc_kwargs.update(uart_name="usb_fifo")
-        if "usb_acm" in board.soc_capabilities:
-            soc_kwargs.update(uart_name="usb_acm")
-
-        # Peripherals
-        if "leds" in board.soc_capabilities:
-            soc_kwargs.update(with_led_chaser=True)
-        if "ethernet" in board.soc_capabilities:
-            soc_kwargs.update({
-                "with_ethernet" : True,
-                "eth_ip"        : args.local_ip,
-                "remote_ip"     : args.remote_ip,
-            })
-        if "pcie" in board.soc_capabilities:
-            soc_kwargs.update(with_pcie=True)
-        if "spiflash" in board.soc_capabilities:
-            soc_kwargs.update(with_spi_flash=True)
-        if "sata" in board.soc_capabilities:
-            soc_kwargs.update(with_sata=True)
-        if "video_terminal" in board.soc_capabilities:
-            soc_kwargs.update(with_video_terminal=True)
-        if "framebuffer" in board.soc_capabilities:
-            soc_kwargs.update(with_video_framebuffer=True)
-        if "usb_host" in board.soc_capabilities:
-            soc_kwargs.update(with_usb_host=True)
-        if "ps_ddr" in board.soc_capabilities:
-            soc_kwargs.update(with_ps_ddr=True)
-
-        # SoC creation -----------------------------------------------------------------------------
-        soc = SoCLinux(board.soc_cls, **soc_kwargs)
-        board.platform = soc.platform
-
-        # SoC constants ----------------------------------------------------------------------------
-        for k, v in board.soc_constants.items():
-            soc.add_constant(k, v)
-
-        # SoC peripherals --------------------------------------------------------------------------
-        if board_name in ["arty", "arty_a7"]:
-            from litex_boards.platforms.digilent_arty import _sdcard_pmod_io
-            board.platform.add_extension(_sdcard_pmod_io)
-
-        if board_name in ["colorlight_i5"]:
-            from litex_boards.platforms.colorlight_i5 import _sdcard_pmod_io
-            board.platform.add_extension(_sdcard_pmod_io)
-
-        if board_name in ["aesku40"]:
-            from litex_boards.platforms.avnet_aesku40 import _sdcard_pmod_io
-            board.platform.add_extension(_sdcard_pmod_io)
-
-        if board_name in ["colognechip_gatemate_evb"]:
-            from litex_boards.platforms.colognechip_gatemate_evb import pmods_sdcard_io
-            board.platform.add_extension(pmods_sdcard_io("PMODA"))
-
-        if board_name in ["orange_crab"]:
-            from litex_boards.platforms.gsd_orangecrab import feather_i2c
-            board.platform.add_extension(feather_i2c)
-
-        if "spisdcard" in board.soc_capabilities:
-            soc.add_spi_sdcard()
-        if "sdcard" in board.soc_capabilities:
-            soc.add_sdcard()
-        #if "leds" in board.soc_capabilities:
-        #    soc.add_leds()
-        if "rgb_led" in board.soc_capabilities:
-            soc.add_rgb_led()
-        if "switches" in board.soc_capabilities:
-            soc.add_switches()
-        if "spi" in board.soc_capabilities:
-            soc.add_spi(args.spi_data_width, args.spi_clk_freq)
-        if "i2c" in board.soc_capabilities:
-            soc.add_i2c()
-
-        # Build ------------------------------------------------------------------------------------
-        build_kwargs = {
-            "run"        : args.build,
-            "build_name" : board_name,
-        }
-
-        # Agilex uses quartus_syn/quartus_pfg instead of quartus_map/quartus_cpf
-        if board_name in ["atum_a3_nano"]:
-            build_kwargs.update({
-                "synth_tool" : "quartus_syn",
-                "conv_tool"  : "quartus_pfg",
-            })
-
-        build_dir = os.path.join("build", board_name)
-        builder   = Builder(soc,
-            output_dir   = os.path.join("build", board_name),
-            bios_console = "lite",
-            csr_json     = os.path.join(build_dir, "csr.json"),
-            csr_csv      = os.path.join(build_dir, "csr.csv")
-        )
-        builder.build(**build_kwargs)
-
-        # Buildroot defconfig ----------------------------------------------------------------------
-        buildroot_defconfig_file = os.path.join(build_dir, "buildroot_defconfig")
-        buildroot_base_defconfig = generate_buildroot_defconfig(
-            buildroot_defconfig_file,
-            with_usb_host = "usb_host" in board.soc_capabilities,
-            with_aes      = VexRiscvSMP.aes_instruction,
-            with_fpu      = VexRiscvSMP.with_fpu,
-            with_nfs_root = args.rootfs == "nfs",
-        )
-        print(f"Buildroot defconfig: {buildroot_defconfig_file}")
-        print(f"Buildroot base defconfig: {buildroot_base_defconfig}")
-
-        # DTS --------------------------------------------------------------------------------------
-        soc.generate_dts(
-            board_name,
-            args.rootfs,
-            nfs_server  = args.remote_ip,
-            nfs_root    = args.nfs_root,
-            nfs_options = args.nfs_options,
-        )
-        if hasattr(soc, "get_fdtoverlays"):
-            fdtoverlays = soc.get_fdtoverlays(board_name, args.fdtoverlays)
-        else:
-            fdtoverlays = args.fdtoverlays
-        soc.compile_dts(board_name, fdtoverlays)
-
-        # DTB --------------------------------------------------------------------------------------
-        soc.combine_dtb(board_name, fdtoverlays)
-
-        # boot.json --------------------------------------------------------------------------------
-        shutil.copyfile(f"images/boot_{args.rootfs}.json", "images/boot.json")
-
-        # PCIe Driver ------------------------------------------------------------------------------
-        if "pcie" in board.soc_capabilities:
-            from litepcie.software import generate_litepcie_software
-            generate_litepcie_software(soc, os.path.join(builder.output_dir, "driver"))
-
-        # Load FPGA bitstream ----------------------------------------------------------------------
-        if args.load:
-            board.load(filename=builder.get_bitstream_filename(mode="sram"))
-
-        # Flash bitstream/images (to SPI Flash) ----------------------------------------------------
-        if args.flash:
-            board.flash(filename=builder.get_bitstream_filename(mode="flash"))
-
-        # Generate SoC documentation ---------------------------------------------------------------
-        if args.doc:
-            soc.generate_doc(board_name)
+        reset_peak_rss()
+        build_board(board_name, args)
+        # Release the elaborated SoC (Migen objects are full of reference cycles).
+        gc.collect()
+        print(f"{board_name}: peak RSS {get_peak_rss()/1024:.1f}MiB")
 
 if __name__ == "__main__":
     main()
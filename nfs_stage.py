@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import stat
+import json
+import shutil
+import tarfile
+import argparse
+
+# NFS Root Staging ---------------------------------------------------------------------------------
+
+# Incremental sync of the Buildroot rootfs.tar (make.py --rootfs=nfs) into the NFS exported directory:
+# - entries are only written when their type/size/mtime/mode/owner/target differ (rsync quick check),
+#   files being replaced atomically (running binaries on the NFS clients are not corrupted).
+# - ownership and device nodes from the tarball are preserved (requires root).
+# - overlay directories (ex: per-board configuration) are applied on top of the tarball.
+# - entries removed from the tarball/overlays since the last staging are deleted; files created at
+#   runtime on the board (never staged) are kept.
+
+nfs_stage_manifest = ".nfs_stage.json"
+
+class NFSStage:
+    def __init__(self, nfs_root, verbose=False):
+        self.nfs_root = os.path.realpath(nfs_root)
+        self.verbose  = verbose
+        self.is_root  = (os.geteuid() == 0)
+        self.stats    = {"written": 0, "unchanged": 0, "removed": 0, "skipped": 0}
+        self.staged   = set()
+        self.dirs     = []
+
+    def log(self, message):
+        if self.verbose:
+            print(f"[NFS-STAGE] {message}")
+
+    def get_path(self, name):
+        # Entry path in the NFS root (rejecting entries escaping it, directly or through symlinks).
+        name = os.path.normpath(name.lstrip("/"))
+        if name in [".", ""]:
+            return name, self.nfs_root
+        if name.startswith(".."):
+            raise ValueError(f"Invalid entry {name}")
+        path   = os.path.join(self.nfs_root, name)
+        parent = os.path.realpath(os.path.dirname(path))
+        if os.path.commonpath([self.nfs_root, parent]) != self.nfs_root:
+            raise ValueError(f"Invalid entry {name}")
+        return name, path
+
+    # Entries --------------------------------------------------------------------------------------
+
+    def is_unchanged(self, path, info, st):
+        # info: (type, size, mtime, mode, uid, gid, linkname, devmajor, devminor).
+        kind, size, mtime, mode, uid, gid, linkname, major, minor = info
+        if st is None or stat.S_IFMT(st.st_mode) != kind:
+            return False
+        if stat.S_IMODE(st.st_mode) != mode and kind != stat.S_IFLNK:
+            return False
+        if self.is_root and (st.st_uid, st.st_gid) != (uid, gid):
+            return False
+        if kind == stat.S_IFREG:
+            return st.st_size == size and int(st.st_mtime) == int(mtime)
+        if kind == stat.S_IFLNK:
+            return os.readlink(path) == linkname
+        if kind in [stat.S_IFCHR, stat.S_IFBLK]:
+            return (os.major(st.st_rdev), os.minor(st.st_rdev)) == (major, minor)
+        return True
+
+    def remove(self, path, st):
+        if stat.S_ISDIR(st.st_mode):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+    def set_attributes(self, path, info):
+        kind, size, mtime, mode, uid, gid = info[:6]
+        if self.is_root:
+            os.lchown(path, uid, gid)
+        if kind != stat.S_IFLNK:
+            os.chmod(path, mode)
+            if kind != stat.S_IFDIR:
+                os.utime(path, (mtime, mtime))
+
+    def stage(self, name, info, data=None, link=None):
+        # Stages an entry: data is a callable returning a file object (regular files), link the path
+        # of the hard link target.
+        name, path = self.get_path(name)
+        self.staged.add(name)
+        kind = info[0]
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            st = None
+        if kind == stat.S_IFDIR:
+            # Directories: mtime set at the end (modified when staging their entries).
+            self.dirs.append((path, info))
+            if st is not None and not stat.S_ISDIR(st.st_mode):
+                self.remove(path, st)
+                st = None
+            if st is None:
+                os.mkdir(path)
+            if st is None or not self.is_unchanged(path, info, st):
+                self.set_attributes(path, info)
+            return
+        # New entries are created next to the path then renamed over it (atomic for the NFS clients).
+        tmp = path + ".nfs_stage"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        if link is not None:
+            # Hard link: unchanged when already linked to the target.
+            _, target = self.get_path(link)
+            if st is not None and os.path.samestat(st, os.lstat(target)):
+                self.stats["unchanged"] += 1
+                return
+            os.link(target, tmp)
+            os.replace(tmp, path)
+            self.stats["written"] += 1
+            return
+        if self.is_unchanged(path, info, st):
+            self.stats["unchanged"] += 1
+            return
+        if kind in [stat.S_IFCHR, stat.S_IFBLK] and not self.is_root:
+            self.log(f"{name}: device node skipped (requires root)")
+            self.stats["skipped"] += 1
+            return
+        self.log(f"{name}")
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            shutil.rmtree(path)
+        if kind == stat.S_IFREG:
+            with data() as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        elif kind == stat.S_IFLNK:
+            os.symlink(info[6], tmp)
+        else:
+            os.mknod(tmp, kind | info[3], os.makedev(info[7], info[8]))
+        self.set_attributes(tmp, info)
+        os.replace(tmp, path)
+        self.stats["written"] += 1
+
+    # Sources --------------------------------------------------------------------------------------
+
+    def stage_tar(self, filename, overridden=set()):
+        # Entries overridden by an overlay are not staged (would be rewritten twice at each staging).
+        tar_types = {
+            tarfile.REGTYPE  : stat.S_IFREG,
+            tarfile.AREGTYPE : stat.S_IFREG,
+            tarfile.DIRTYPE  : stat.S_IFDIR,
+            tarfile.SYMTYPE  : stat.S_IFLNK,
+            tarfile.CHRTYPE  : stat.S_IFCHR,
+            tarfile.BLKTYPE  : stat.S_IFBLK,
+            tarfile.FIFOTYPE : stat.S_IFIFO,
+        }
+        with tarfile.open(filename) as tar:
+            for member in tar:
+                if os.path.normpath(member.name.lstrip("/")) in overridden and not member.isdir():
+                    continue
+                if member.islnk():
+                    self.stage(member.name, (stat.S_IFREG,), link=member.linkname)
+                    continue
+                if member.type not in tar_types:
+                    continue
+                info = (tar_types[member.type], member.size, member.mtime, member.mode & 0o7777,
+                    member.uid, member.gid, member.linkname, member.devmajor, member.devminor)
+                self.stage(member.name, info, data=lambda m=member: tar.extractfile(m))
+
+    def get_overlay_entries(self, directory):
+        # [(name, source path, lstat)] of an overlay directory, parents first.
+        entries = []
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                src = os.path.join(root, name)
+                st  = os.lstat(src)
+                if stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                    entries.append((os.path.normpath(os.path.relpath(src, directory)), src, st))
+        return entries
+
+    def stage_overlay(self, directory):
+        # Overlay entries are owned by root (as Buildroot rootfs overlays).
+        for name, src, st in self.get_overlay_entries(directory):
+            info = (stat.S_IFMT(st.st_mode), st.st_size, st.st_mtime, stat.S_IMODE(st.st_mode),
+                0, 0, os.readlink(src) if stat.S_ISLNK(st.st_mode) else "", 0, 0)
+            self.stage(name, info, data=lambda src=src: open(src, "rb"))
+
+    # Manifest -------------------------------------------------------------------------------------
+
+    def finalize(self):
+        # Remove the entries staged last time but no longer part of the tarball/overlays.
+        manifest = os.path.join(self.nfs_root, nfs_stage_manifest)
+        previous = []
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                previous = json.load(f)
+        for name in sorted(set(previous) - self.staged, reverse=True):
+            _, path = self.get_path(name)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISDIR(st.st_mode) and os.listdir(path):
+                continue # Runtime files left in it.
+            self.log(f"{name} (removed)")
+            if stat.S_ISDIR(st.st_mode):
+                os.rmdir(path)
+            else:
+                os.unlink(path)
+            self.stats["removed"] += 1
+        # Directories mtime (deepest first).
+        for path, info in reversed(self.dirs):
+            os.utime(path, (info[2], info[2]))
+        with open(manifest, "w") as f:
+            json.dump(sorted(self.staged - {"."}), f, indent=0)
+        return self.stats
+
+def stage_nfs_root(nfs_root, tarball, overlays=[], verbose=False):
+    os.makedirs(nfs_root, exist_ok=True)
+    nfs_stage  = NFSStage(nfs_root, verbose=verbose)
+    overridden = {name for overlay in overlays for name, _, _ in nfs_stage.get_overlay_entries(overlay)}
+    nfs_stage.stage_tar(tarball, overridden)
+    for overlay in overlays:
+        nfs_stage.stage_overlay(overlay)
+    return nfs_stage.finalize()
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental staging of the Buildroot rootfs.tar into the NFS root.")
+    parser.add_argument("--nfs-root", default="/srv/nfs/litex-vexriscv", help="NFS exported root directory (make.py --nfs-root).")
+    parser.add_argument("--rootfs",   default="images/rootfs.tar",       help="Buildroot rootfs tarball.")
+    parser.add_argument("--overlay",  default=[], action="append",       help="Overlay directory applied on top of the rootfs (ex: per-board files), can be repeated.")
+    parser.add_argument("--verbose",  action="store_true",               help="Log the written/removed entries.")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("Warning: not running as root, ownership and device nodes are not staged.")
+    stats = stage_nfs_root(args.nfs_root, args.rootfs, args.overlay, verbose=args.verbose)
+    print(f"{args.nfs_root}: {stats['written']} written, {stats['unchanged']} unchanged, "
+          f"{stats['removed']} removed, {stats['skipped']} skipped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import sys
+import json
+import errno
+import shutil
+import struct
+import hashlib
+import argparse
+import subprocess
+
+from xml.etree import ElementTree
+
+# SDCard Image -------------------------------------------------------------------------------------
+
+# Incremental SDCard updates (instead of a full genimage rebuild and a full card write):
+# - update: when the genimage configuration is unchanged, the existing sdcard.img is updated in
+#   place: changed files of the vfat partitions are replaced with mtools (other clusters are kept)
+#   and only the changed blocks of the other partition images (rootfs) are written.
+# - bmap: block map of the sparse sdcard.img (bmaptool 2.0 format, usable with bmaptool copy).
+# - write: writes the mapped blocks of the image to the card, skipping the blocks the card already
+#   holds (read-back comparison: reading an SDCard is much faster than writing it).
+# - config: genimage configuration of the SDCard layout: the boot partition holds boot.json and the
+#   images it loads (the BIOS reads them from the FAT: Image.lz4/boot stub, boot.bin bundle...).
+
+sdcard_sector_size = 512
+sdcard_block_size  = 4096    # Block map/comparison granularity.
+sdcard_chunk_size  = 1 << 20 # Read/write size.
+
+def get_mbr_partitions(filename):
+    # [(offset, size, type)] of the MBR primary partitions (genimage hdimage default).
+    with open(filename, "rb") as f:
+        mbr = f.read(sdcard_sector_size)
+    if len(mbr) < sdcard_sector_size or mbr[510:512] != b"\x55\xaa":
+        raise ValueError(f"{filename}: no MBR partition table")
+    partitions = []
+    for i in range(4):
+        entry = mbr[446 + 16*i:446 + 16*(i + 1)]
+        kind  = entry[4]
+        start, sectors = struct.unpack("<II", entry[8:16])
+        if kind != 0 and sectors != 0:
+            partitions.append((start*sdcard_sector_size, sectors*sdcard_sector_size, kind))
+    return partitions
+
+def get_genimage_config(filename, image):
+    # Partition images of a genimage hdimage (in order) and files of its vfat images.
+    with open(filename) as f:
+        config = f.read()
+    m = re.search(r'image\s+' + re.escape(image) + r'\s*\{\s*hdimage\s*\{(.*)', config, re.S)
+    if m is None:
+        raise ValueError(f"{filename}: no hdimage {image}")
+    partitions = re.findall(r'partition\s+\w+\s*\{[^}]*?image\s*=\s*"([^"]+)"', m.group(1))
+    vfat_files = {}
+    for name, files in re.findall(r'image\s+(\S+)\s*\{\s*vfat\s*\{\s*files\s*=\s*\{([^}]*)\}', config):
+        vfat_files[name] = re.findall(r'"([^"]+)"', files)
+    return partitions, vfat_files
+
+# Layout -------------------------------------------------------------------------------------------
+
+def get_sdcard_boot_files(boot_json, inputpath=None):
+    # Boot partition files: boot.json and the images it loads (missing ones skipped with a warning
+    # when inputpath is given: generated by make.py after the Linux build).
+    with open(boot_json) as f:
+        files = ["boot.json"] + list(json.load(f))
+    if inputpath is not None:
+        missing = [name for name in files if not os.path.exists(os.path.join(inputpath, name))]
+        for name in missing:
+            print(f"Warning: {os.path.join(inputpath, name)} (boot.json) missing, not copied to the SDCard "
+                   "(run make.py then ./sdcard.py update --boot-json).", file=sys.stderr)
+        files = [name for name in files if name not in missing]
+    return files
+
+def generate_genimage_config(template, output, boot_files=None, rootfs="rootfs.ext4", initrd="rootfs.cpio.gz"):
+    # genimage configuration from the template: rootfs partition image, boot partition files (default:
+    # the template files with the selected initramfs).
+    with open(template) as f:
+        config = f.read()
+    config = config.replace('"rootfs.ext4"', f'"{rootfs}"')
+    if boot_files is None:
+        config = config.replace('"rootfs.cpio.gz"', f'"{initrd}"')
+    else:
+        files  = ",\n".join(f'\t\t\t"{name}"' for name in boot_files)
+        config = re.sub(r'(image\s+boot\.vfat\s*\{\s*vfat\s*\{\s*files\s*=\s*\{)[^}]*\}',
+            lambda m: m.group(1) + "\n" + files + "\n\t\t}", config, count=1)
+    with open(output, "w") as f:
+        f.write(config)
+    return config
+
+def get_mapped_ranges(filename):
+    # [(start, end)] data ranges of a (sparse) file, aligned on sdcard_block_size.
+    ranges = []
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(f.fileno(), offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO: # No data after offset.
+                    break
+                ranges = [(0, size)]       # SEEK_DATA not supported: fully mapped.
+                break
+            end = os.lseek(f.fileno(), start, os.SEEK_HOLE)
+            ranges.append((start, end))
+            offset = end
+    aligned = []
+    for start, end in ranges:
+        start = start - start % sdcard_block_size
+        end   = min(size, end + (-end) % sdcard_block_size)
+        if aligned and start <= aligned[-1][1]:
+            aligned[-1] = (aligned[-1][0], max(aligned[-1][1], end))
+        else:
+            aligned.append((start, end))
+    return aligned
+
+def copy_blocks(src_fd, dst_fd, ranges, src_offset=0, dst_offset=0, compare=True):
+    # Copies the ranges of src to dst, only writing the blocks that differ (contiguous differing
+    # blocks are written at once). Returns the number of bytes written.
+    written = 0
+    for start, end in ranges:
+        for chunk in range(start, end, sdcard_chunk_size):
+            size = min(sdcard_chunk_size, end - chunk)
+            data = os.pread(src_fd, size, src_offset + chunk).ljust(size, b"\0")
+            if not compare:
+                os.pwrite(dst_fd, data, dst_offset + chunk)
+                written += size
+                continue
+            current = os.pread(dst_fd, size, dst_offset + chunk).ljust(size, b"\0")
+            run     = None
+            for block in range(0, size + sdcard_block_size, sdcard_block_size):
+                blocks  = slice(block, block + sdcard_block_size)
+                differs = block < size and data[blocks] != current[blocks]
+                if differs and run is None:
+                    run = block
+                elif not differs and run is not None:
+                    os.pwrite(dst_fd, data[run:block], dst_offset + chunk + run)
+                    written += block - run
+                    run = None
+    return written
+
+# Update -------------------------------------------------------------------------------------------
+
+def get_mtools_env():
+    return dict(os.environ, MTOOLS_SKIP_CHECK="1")
+
+def update_vfat_files(image, offset, files, inputpath):
+    # Replaces the files that changed in the vfat filesystem at offset (image@@offset for mtools).
+    if shutil.which("mcopy") is None:
+        raise FileNotFoundError("mcopy (mtools) is required to update vfat partitions")
+    vfat    = f"{image}@@{offset}"
+    updated = []
+    for name in files:
+        with open(os.path.join(inputpath, name), "rb") as f:
+            data = f.read()
+        current = subprocess.run(["mcopy", "-n", "-i", vfat, f"::{name}", "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=get_mtools_env())
+        if current.returncode == 0 and current.stdout == data:
+            continue
+        subprocess.run(["mcopy", "-o", "-i", vfat, os.path.join(inputpath, name), f"::{name}"],
+            check=True, env=get_mtools_env())
+        updated.append(name)
+    return updated
+
+def update_partition(image, offset, size, src):
+    # Writes the blocks of src that differ from the partition contents (src holes as zeros).
+    src_size = os.path.getsize(src)
+    if src_size > size:
+        raise ValueError(f"{src} ({src_size} bytes) does not fit in the partition ({size} bytes)")
+    src_fd = os.open(src, os.O_RDONLY)
+    dst_fd = os.open(image, os.O_RDWR)
+    try:
+        return copy_blocks(src_fd, dst_fd, [(0, src_size)], dst_offset=offset)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+
+def update_sdcard(image, config, inputpath, outputpath=None, boot_files=None):
+    # In-place update of a genimage hdimage with the current input files. Returns {partition image:
+    # updated files (vfat) or written bytes}. boot_files replaces the files of the boot.json vfat.
+    outputpath = outputpath or os.path.dirname(image)
+    partitions, vfat_files = get_genimage_config(config, os.path.basename(image))
+    if boot_files is not None:
+        for name, files in vfat_files.items():
+            if "boot.json" in files:
+                vfat_files[name] = boot_files
+    mbr_partitions = get_mbr_partitions(image)
+    if len(partitions) != len(mbr_partitions):
+        raise ValueError(f"{image}: partitions do not match {config}")
+    updates = {}
+    for name, (offset, size, _) in zip(partitions, mbr_partitions):
+        if name in vfat_files:
+            updates[name] = update_vfat_files(image, offset, vfat_files[name], inputpath)
+            # Keep the standalone vfat image (genimage output) in sync.
+            vfat_image = os.path.join(outputpath, name)
+            if os.path.exists(vfat_image) and updates[name]:
+                update_vfat_files(vfat_image, 0, updates[name], inputpath)
+        else:
+            updates[name] = update_partition(image, offset, size, os.path.join(inputpath, name))
+    return updates
+
+# Block Map ----------------------------------------------------------------------------------------
+
+def generate_bmap(image, bmap=None):
+    # bmaptool 2.0 block map (sha256 of each range, file checksum computed with a zeroed field).
+    bmap   = bmap or image + ".bmap"
+    size   = os.path.getsize(image)
+    ranges = get_mapped_ranges(image)
+    lines  = []
+    mapped = 0
+    with open(image, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            sha256 = hashlib.sha256(f.read(end - start)).hexdigest()
+            first, last = start // sdcard_block_size, (end - 1) // sdcard_block_size
+            blocks = f"{first}-{last}" if last != first else f"{first}"
+            lines.append(f'        <Range chksum="{sha256}"> {blocks} </Range>')
+            mapped += last - first + 1
+    content = "\n".join([
+        '<?xml version="1.0" ?>',
+        '<bmap version="2.0">',
+        f"    <ImageSize> {size} </ImageSize>",
+        f"    <BlockSize> {sdcard_block_size} </BlockSize>",
+        f"    <BlocksCount> {(size + sdcard_block_size - 1) // sdcard_block_size} </BlocksCount>",
+        f"    <MappedBlocksCount> {mapped} </MappedBlocksCount>",
+        "    <ChecksumType> sha256 </ChecksumType>",
+        "    <BmapFileChecksum> {} </BmapFileChecksum>",
+        "    <BlockMap>",
+        *lines,
+        "    </BlockMap>",
+        "</bmap>",
+        "",
+    ])
+    checksum = hashlib.sha256(content.format("0"*64).encode()).hexdigest()
+    with open(bmap, "w") as f:
+        f.write(content.format(checksum))
+    return ranges
+
+def read_bmap(bmap):
+    root       = ElementTree.parse(bmap).getroot()
+    block_size = int(root.findtext("BlockSize"))
+    image_size = int(root.findtext("ImageSize"))
+    ranges     = []
+    for r in root.iter("Range"):
+        first, _, last = r.text.strip().partition("-")
+        ranges.append((int(first)*block_size, min(image_size, (int(last or first) + 1)*block_size)))
+    return ranges
+
+# Write --------------------------------------------------------------------------------------------
+
+def check_not_mounted(device):
+    device = os.path.realpath(device)
+    with open("/proc/mounts") as f:
+        for line in f:
+            source = line.split()[0]
+            if source.startswith("/dev/") and os.path.realpath(source).startswith(device):
+                raise ValueError(f"{device} is mounted ({source}), unmount it first")
+
+def write_sdcard(image, device, bmap=None, compare=True):
+    # Returns (mapped bytes, written bytes).
+    ranges = read_bmap(bmap) if bmap is not None else get_mapped_ranges(image)
+    if device.startswith("/dev/"):
+        check_not_mounted(device)
+    src_fd = os.open(image, os.O_RDONLY)
+    dst_fd = os.open(device, os.O_RDWR)
+    try:
+        if device.startswith("/dev/") and os.lseek(dst_fd, 0, os.SEEK_END) < os.path.getsize(image):
+            raise ValueError(f"{device} is smaller than {image}")
+        written = copy_blocks(src_fd, dst_fd, ranges, compare=compare)
+        os.fsync(dst_fd)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    return sum(end - start for start, end in ranges), written
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental SDCard image update/write.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update = subparsers.add_parser("update", help="Update the changed files/blocks of an existing sdcard.img.")
+    update.add_argument("image",                                   help="SDCard image (ex: images/sdcard.img).")
+    update.add_argument("--config",    required=True,              help="genimage configuration used to generate the image.")
+    update.add_argument("--inputpath", default="images",           help="genimage input directory.")
+    update.add_argument("--boot-json", default=None,               help="Update the boot partition with boot.json and the images it loads.")
+    config = subparsers.add_parser("config", help="Generate the genimage configuration of the SDCard layout.")
+    config.add_argument("template",                                help="genimage configuration template (ex: buildroot/board/litex_vexriscv/genimage.cfg).")
+    config.add_argument("output",                                  help="Generated genimage configuration.")
+    config.add_argument("--boot-json", default=None,               help="Boot partition files from boot.json (default: template files).")
+    config.add_argument("--inputpath", default="images",           help="genimage input directory.")
+    config.add_argument("--rootfs",    default="rootfs.ext4",      help="RootFS partition image.")
+    config.add_argument("--initrd",    default="rootfs.cpio.gz",   help="Initramfs (without --boot-json).")
+    bmap = subparsers.add_parser("bmap", help="Generate the block map (<image>.bmap) of a sparse image.")
+    bmap.add_argument("image",                                     help="SDCard image (ex: images/sdcard.img).")
+    write = subparsers.add_parser("write", help="Write an image to a SDCard, skipping the unchanged blocks.")
+    write.add_argument("image",                                    help="SDCard image (ex: images/sdcard.img).")
+    write.add_argument("device",                                   help="SDCard device (ex: /dev/sdX, /dev/mmcblkX).")
+    write.add_argument("--bmap",       default=None,               help="Block map (default: <image>.bmap if present, else image holes).")
+    write.add_argument("--no-compare", action="store_true",        help="Write all the mapped blocks (new/unknown card contents).")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        boot_files = None
+        if args.boot_json is not None:
+            boot_files = get_sdcard_boot_files(args.boot_json, args.inputpath)
+        updates = update_sdcard(args.image, args.config, args.inputpath, boot_files=boot_files)
+        for name, update in updates.items():
+            if isinstance(update, list):
+                print(f"{name}: {', '.join(update) if update else 'unchanged'}.")
+            else:
+                print(f"{name}: {update} bytes written.")
+    elif args.command == "config":
+        boot_files = None
+        if args.boot_json is not None and os.path.exists(args.boot_json):
+            boot_files = get_sdcard_boot_files(args.boot_json, args.inputpath)
+        generate_genimage_config(args.template, args.output, boot_files, args.rootfs, args.initrd)
+    elif args.command == "bmap":
+        ranges = generate_bmap(args.image)
+        print(f"{args.image}.bmap: {sum(end - start for start, end in ranges)} bytes mapped.")
+    else:
+        bmap = args.bmap
+        if bmap is None and os.path.exists(args.image + ".bmap"):
+            bmap = args.image + ".bmap"
+        mapped, written = write_sdcard(args.image, args.device, bmap, compare=not args.no_compare)
+        print(f"{args.device}: {written} bytes written ({mapped} bytes mapped).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import json
+import time
+import argparse
+
+# Serial Boot --------------------------------------------------------------------------------------
+
+# High-speed serial boot of the boot.json images, driven from the host with the LiteX BIOS commands:
+# - serial: the UART PHY tuning word (make.py --uart-dynamic-baudrate) is set to the boot baudrate
+#   with mem_write, the images are uploaded with serialboot (SFL) at this rate, then the console
+#   baudrate is restored before booting with the boot command.
+# - crossover: the images are written directly to memory through the litex_server bridge (ex: PCIe)
+#   instead of going through the crossover UART, then booted with the boot command.
+
+bios_prompt     = re.compile(rb"litex[^>]*> ")
+sfl_magic_req   = b"sL5DdSMmkekro\n"
+uart_oversample = 16 # Max baudrate: sys_clk_freq/16 (UART PHY sampling margin).
+
+def get_tuning_word(baudrate, clk_freq):
+    # Same computation as the LiteX RS232PHY.
+    return int((baudrate/clk_freq)*2**32)
+
+def get_serial_boot_baudrate(baudrate, clk_freq):
+    return min(int(baudrate), int(clk_freq//uart_oversample))
+
+def get_boot_images(boot_json):
+    # [(filename, address)] in boot.json order, the last image being booted.
+    with open(boot_json) as f:
+        images = json.load(f)
+    boot_dir = os.path.dirname(boot_json)
+    return [(os.path.join(boot_dir, image), int(address, 0)) for image, address in images.items()]
+
+class SerialBoot:
+    def __init__(self, port, timeout=10.0):
+        self.port    = port
+        self.timeout = timeout
+
+    def read_until(self, pattern, timeout=None, on_data=None):
+        data     = b""
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        # Non-blocking reads here only (LiteXTerm SFL/console reads are blocking).
+        port_timeout, self.port.timeout = self.port.timeout, 0.1
+        try:
+            while time.time() < deadline:
+                data += self.port.read(max(1, self.port.in_waiting))
+                if on_data is not None:
+                    on_data(data)
+                if isinstance(pattern, re.Pattern):
+                    found = pattern.search(data) is not None
+                else:
+                    found = pattern in data
+                if found:
+                    return data
+        finally:
+            self.port.timeout = port_timeout
+        raise TimeoutError(f"Timeout waiting for {pattern!r} (received {data[-64:]!r})")
+
+    def get_prompt(self, timeout=None):
+        # Abort the BIOS boot sequence (serialboot magic) to get the BIOS prompt.
+        def abort_serialboot(data):
+            if data.endswith(sfl_magic_req):
+                self.port.write(b"\x1b")
+        self.port.write(b"\n")
+        self.read_until(bios_prompt, timeout, on_data=abort_serialboot)
+
+    def command(self, command, wait_prompt=True):
+        self.port.reset_input_buffer()
+        self.port.write(command.encode() + b"\n")
+        if wait_prompt:
+            self.read_until(bios_prompt)
+
+    def set_baudrate(self, baudrate, tuning_word_addr, tuning_word):
+        # The BIOS answers at the new baudrate: wait for the command to be sent/echoed, switch the
+        # host side and check the BIOS prompt.
+        self.command(f"mem_write 0x{tuning_word_addr:08x} 0x{tuning_word:08x}", wait_prompt=False)
+        self.port.flush()
+        time.sleep(0.1)
+        self.port.baudrate = baudrate
+        self.port.reset_input_buffer()
+        self.get_prompt(timeout=2.0)
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="High-speed serial boot of the Linux images.")
+    parser.add_argument("port",                                           help="Serial port (ex: /dev/ttyUSB1) or crossover.")
+    parser.add_argument("--csr-json",   required=True,                    help="SoC csr.json (ex: build/arty/csr.json).")
+    parser.add_argument("--images",     default="images/boot.json",       help="boot.json of the images to load.")
+    parser.add_argument("--speed",      default=115200, type=float,       help="Console baudrate (make.py --uart-baudrate).")
+    parser.add_argument("--boot-speed", default=3e6,    type=float,       help="Baudrate used to upload the images (serial).")
+    parser.add_argument("--safe",       action="store_true",              help="Safe SFL upload (no upload speed optimizations).")
+    parser.add_argument("--no-console", action="store_true",              help="Exit after booting instead of opening the console.")
+    args = parser.parse_args()
+
+    from litex.tools.litex_term import LiteXTerm, CrossoverUART, SFLFrame, sfl_magic_ack, sfl_cmd_abort
+
+    with open(args.csr_json) as f:
+        csr = json.load(f)
+    clk_freq = csr["constants"]["config_clock_frequency"]
+    images   = get_boot_images(args.images)
+
+    # Serial port/crossover bridge.
+    xover = None
+    port  = args.port
+    if args.port == "crossover":
+        xover = CrossoverUART(csr_csv=os.path.splitext(args.csr_json)[0] + ".csv")
+        xover.open()
+        port  = os.ttyname(xover.name)
+    term = LiteXTerm(serial_boot=False, kernel_image=None, kernel_address=None, json_images=None, safe=args.safe)
+    term.open(port, int(args.speed))
+    boot = SerialBoot(term.port)
+    print("[SERIAL-BOOT] Waiting for the BIOS prompt...")
+    boot.get_prompt()
+
+    start = time.time()
+    if xover is not None:
+        # Crossover: direct memory writes through the bridge.
+        for filename, address in images:
+            print(f"[SERIAL-BOOT] Writing {filename} to 0x{address:08x}...")
+            with open(filename, "rb") as f:
+                data = f.read()
+            data += bytes(-len(data) % 4)
+            words = [int.from_bytes(data[i:i + 4], "little") for i in range(0, len(data), 4)]
+            for i in range(0, len(words), 128):
+                xover.bus.write(address + 4*i, words[i:i + 128])
+    else:
+        # Serial: switch to the boot baudrate for the SFL upload.
+        if "uart_phy_tuning_word" not in csr["csr_registers"]:
+            raise ValueError("No UART PHY tuning word in the SoC: build it with make.py --uart-dynamic-baudrate")
+        tuning_word_addr = csr["csr_registers"]["uart_phy_tuning_word"]["addr"]
+        boot_speed       = get_serial_boot_baudrate(args.boot_speed, clk_freq)
+        print(f"[SERIAL-BOOT] Switching to {boot_speed} bauds...")
+        boot.set_baudrate(boot_speed, tuning_word_addr, get_tuning_word(boot_speed, clk_freq))
+        boot.command("serialboot", wait_prompt=False)
+        boot.read_until(sfl_magic_req)
+        term.port.write(sfl_magic_ack)
+        for filename, address in images:
+            term.upload(filename, address)
+        frame     = SFLFrame()
+        frame.cmd = sfl_cmd_abort
+        term.send_frame(frame)
+        boot.read_until(bios_prompt)
+        print(f"[SERIAL-BOOT] Switching back to {int(args.speed)} bauds...")
+        boot.set_baudrate(int(args.speed), tuning_word_addr, get_tuning_word(args.speed, clk_freq))
+    print(f"[SERIAL-BOOT] Images loaded in {time.time() - start:.1f}s, booting.")
+    boot.command(f"boot 0x{images[-1][1]:08x}", wait_prompt=False)
+
+    # Console.
+    if args.no_console:
+        return
+    term.console.configure()
+    term.start()
+    term.join(True)
+
+if __name__ == "__main__":
+    main()
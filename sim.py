@@ -6,8 +6,17 @@
 # Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
 # SPDX-License-Identifier: BSD-2-Clause
 
+import os
+import re
+import sys
 import json
+import mmap
+import array
+import struct
+import hashlib
+import time
 import argparse
+import subprocess
 
 from migen import *
 
@@ -25,7 +34,7 @@ from litex.soc.interconnect           import wishbone
 from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
 
 from litedram import modules as litedram_modules
-from litedram.phy.model       import SDRAMPHYModel, sdram_module_nphases, get_sdram_phy_settings
+from litedram.phy.model       import SDRAMPHYModel, BankModel, sdram_module_nphases, get_sdram_phy_settings
 from litedram.core.controller import ControllerSettings
 
 from liteeth.phy.model import LiteEthPHYModel
@@ -60,34 +69,366 @@ class Platform(SimPlatform):
 
 # Supervisor ---------------------------------------------------------------------------------------
 
+# Trace window (platform.trace, --trace): waveforms are only dumped while the window is open. It is
+# opened/closed at sys_clk cycles and/or at CPU peripheral bus accesses to given addresses (ex: a
+# CSR/peripheral access), and also opened while software sets the supervisor_trace CSR. Without
+# trigger, tracing is always on.
+
 class Supervisor(LiteXModule):
-    def __init__(self):
+    def __init__(self, trace_cycles=(None, None), trace_addresses=(None, None), trace_bus=None, trace_csr=False):
         self._finish = CSR()    # Controlled from CPU.
         self.finish  = Signal() # Controlled from logic.
         self.sync += If(self._finish.re | self.finish, Finish())
 
+        # Trace window.
+        self.trace  = Signal()
+        self._trace = CSRStorage() # Controlled from CPU.
+        if trace_cycles == (None, None) and trace_addresses == (None, None) and not trace_csr:
+            self.comb += self.trace.eq(1)
+        else:
+            # Window opened from reset when only an end trigger is given.
+            window = Signal(reset=trace_cycles[0] is None and trace_addresses[0] is None and
+                (trace_cycles[1] is not None or trace_addresses[1] is not None))
+            start  = Signal()
+            stop   = Signal()
+            cycle  = Signal(64)
+            self.sync += cycle.eq(cycle + 1)
+            for trigger, n in zip([start, stop], [0, 1]):
+                conditions = []
+                if trace_cycles[n] is not None:
+                    conditions.append(cycle == trace_cycles[n])
+                if trace_addresses[n] is not None:
+                    adr = trace_addresses[n] >> log2_int(len(trace_bus.dat_w)//8)
+                    conditions.append(trace_bus.cyc & trace_bus.stb & trace_bus.ack & (trace_bus.adr == adr))
+                if conditions:
+                    self.comb += trigger.eq(reduce(or_, conditions))
+            self.sync += If(start, window.eq(1)).Elif(stop, window.eq(0))
+            self.comb += self.trace.eq(window | self._trace.storage)
+
+# RAM Init -----------------------------------------------------------------------------------------
+
+# The SDRAM model contents are set once the SoC is elaborated (SoCLinux.init_mems, called by the
+# Builder after the csr.json export): the DTB is generated from this same elaboration and the SoC
+# is only built once. Two modes (--ram-init):
+# - gateware: the contents are passed as Python word lists to the bank memories init.
+# - binary:   the flat RAM image is cached in build/sim/ram_init/<hash of boot.json and its images>.bin
+#   and the bank memories only get a placeholder init in the gateware. Their $readmemh files are
+#   rewritten from the (mmap'd) cached image before each run, and Verilator is only re-run when the
+#   other generated sources change: swapping kernels doesn't recompile the simulation.
+
+def get_ram_init_data(boot_json, offset):
+    # Flat RAM image of the boot.json images (paths relative to the boot.json directory).
+    with open(boot_json) as f:
+        images = json.load(f)
+    data = bytearray()
+    for image, address in images.items():
+        with open(os.path.join(os.path.dirname(boot_json), image), "rb") as f:
+            content = f.read()
+        start = int(address, 0) - offset
+        if start + len(content) > len(data):
+            data.extend(bytes(start + len(content) - len(data)))
+        data[start:start + len(content)] = content
+    return data
+
+def get_sdram_bank_memories(sdrphy):
+    banks = [bank for _, bank in sdrphy._submodules if isinstance(bank, BankModel)]
+    return [[s for s in bank._fragment.specials if isinstance(s, Memory)][0] for bank in banks]
+
+def get_sdram_bank_data(data, sdrphy):
+    # Bank memories contents of a flat RAM image (ROW_BANK_COL mapping: each row of each bank
+    # holds databits/8*ncols consecutive bytes), padded to the model words.
+    memories   = get_sdram_bank_memories(sdrphy)
+    nbanks     = len(memories)
+    row_bytes  = sdrphy.settings.databits//8 * 2**sdrphy.module.geom_settings.colbits
+    word_bytes = memories[0].width//8
+    nrows      = (len(data) + nbanks*row_bytes - 1)//(nbanks*row_bytes)
+    bank_data  = []
+    for bank in range(nbanks):
+        content = b"".join(data[(row*nbanks + bank)*row_bytes:(row*nbanks + bank + 1)*row_bytes] for row in range(nrows))
+        bank_data.append(content + bytes(-len(content) % word_bytes))
+    return bank_data
+
+def get_memory_init(content, width):
+    # Memory init (little-endian words).
+    word_bytes = width//8
+    if word_bytes in [1, 2, 4, 8]:
+        return list(struct.unpack("<{}{}".format(len(content)//word_bytes, "BHIQ"[word_bytes.bit_length() - 1]), content))
+    return [int.from_bytes(content[i:i + word_bytes], "little") for i in range(0, len(content), word_bytes)]
+
+def get_sdram_bank_init(data, sdrphy):
+    # Bank memories init (little-endian model words).
+    width = get_sdram_bank_memories(sdrphy)[0].width
+    return [get_memory_init(content, width) for content in get_sdram_bank_data(data, sdrphy)]
+
+def get_ram_init_key(boot_json):
+    # Hash of boot.json and of the images it loads.
+    h = hashlib.sha256()
+    with open(boot_json, "rb") as f:
+        h.update(f.read())
+    with open(boot_json) as f:
+        images = json.load(f)
+    for image in images:
+        with open(os.path.join(os.path.dirname(boot_json), image), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def get_ram_init_binary(boot_json, offset, cache_dir):
+    # Cached flat RAM image of boot.json (generated on a cache miss).
+    filename = os.path.join(cache_dir, "{}.bin".format(get_ram_init_key(boot_json)[:32]))
+    if not os.path.exists(filename):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(filename + ".tmp", "wb") as f:
+            f.write(get_ram_init_data(boot_json, offset))
+        os.replace(filename + ".tmp", filename)
+    return filename
+
+def write_memory_init(filename, data, width):
+    # $readmemh file (one hex word per line) of little-endian words.
+    word_bytes = width//8
+    if word_bytes in [1, 2, 4, 8]:
+        words = array.array({1: "B", 2: "H", 4: "I", 8: "Q"}[word_bytes])
+        words.frombytes(data)
+        if sys.byteorder == "little":
+            words.byteswap()
+        data = words.tobytes()
+    else:
+        data = b"".join(data[i:i + word_bytes][::-1] for i in range(0, len(data), word_bytes))
+    with open(filename, "w") as f:
+        if data:
+            f.write(data.hex("\n", word_bytes) + "\n")
+
+def get_sim_gateware_key(gateware_dir):
+    # Hash of the generated simulation sources, except the memories init files (read at runtime)
+    # and the generation date.
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(gateware_dir)):
+        filename = os.path.join(gateware_dir, name)
+        if not os.path.isfile(filename) or name.endswith(".init") or name == "sim.key":
+            continue
+        with open(filename, "rb") as f:
+            h.update(name.encode() + b"\0" + re.sub(rb"(?m)^// Date .*$", b"", f.read()))
+    return h.hexdigest()
+
+# The LiteX Verilator toolchain always re-runs Verilator and runs the simulation in the current
+# environment: the generated build/run steps are run here instead (without the LiteX private
+# helpers), the simulation process getting its own environment.
+
+def _get_verilator_build_script(gateware_dir, build_name="sim"):
+    build_script = os.path.join(gateware_dir, f"build_{build_name}.sh")
+    if not os.path.exists(build_script):
+        raise ValueError(f"{build_script} not found, unsupported LiteX simulation build layout")
+    return build_script
+
+def compile_verilator_sim(gateware_dir, build_name="sim"):
+    build_script = _get_verilator_build_script(gateware_dir, build_name)
+    subprocess.check_call(["bash", os.path.basename(build_script)], cwd=gateware_dir)
+
+def run_verilator_sim(gateware_dir, build_name="sim", env=None, interactive=True):
+    _get_verilator_build_script(gateware_dir, build_name)
+    interactive = interactive and sys.stdin.isatty()
+    if interactive:
+        import termios
+        termios_settings = termios.tcgetattr(sys.stdin.fileno())
+    try:
+        subprocess.call([os.path.join("obj_dir", f"V{build_name}")], cwd=gateware_dir, env={**os.environ, **(env or {})})
+    finally:
+        if interactive:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSAFLUSH, termios_settings)
+
+def run_sim(soc, vns, gateware_dir, env=None, interactive=True):
+    # Rewrite the main RAM $readmemh files from the cached image (--ram-init=binary), re-run
+    # Verilator only when the simulation sources changed, then run the simulation. Returns the
+    # simulation sources key.
+    if getattr(soc, "ram_init_binary", None) is not None:
+        with open(soc.ram_init_binary, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for memory, content in zip(soc.get_main_ram_memories(), soc.get_main_ram_data(data)):
+                write_memory_init(os.path.join(gateware_dir, "sim_{}.init".format(vns.get_name(memory))), content, memory.width)
+    key      = get_sim_gateware_key(gateware_dir)
+    key_file = os.path.join(gateware_dir, "sim.key")
+    last_key = None
+    if os.path.exists(key_file) and os.path.exists(os.path.join(gateware_dir, "obj_dir", "Vsim")):
+        with open(key_file) as f:
+            last_key = f.read()
+    if key != last_key:
+        compile_verilator_sim(gateware_dir)
+        with open(key_file, "w") as f:
+            f.write(key)
+    else:
+        print("Simulation sources unchanged, Verilator compilation skipped.")
+    start = time.time()
+    run_verilator_sim(gateware_dir, env=env, interactive=interactive)
+    print("Simulation run: {:.1f}s.".format(time.time() - start))
+    return key
+
+# Checkpoint ---------------------------------------------------------------------------------------
+
+# Verilator checkpoint/restore (--checkpoint-save/--checkpoint-restore): the model is built with
+# --savable and the generated sim_init.cpp is extended with:
+# - a per-tick hook (litex_sim_dump) counting the sys_clk cycles and matching the serial output
+#   against a marker (ex: the shell prompt). Once the cycle/marker is reached, the model state
+#   and the simulation time are saved on the next sys_clk falling edge (serial2console only acts
+#   on rising edges) and the simulation exits.
+# - a restore of the saved state before the first evaluation (litex_sim_init).
+# The checkpoint parameters are passed to the simulation through LITEX_SIM_CHECKPOINT_* variables
+# and checkpoints are only restored by the simulation build that saved them (<checkpoint>.key).
+# The same hook reports the boot time (--boot-marker, LITEX_SIM_BOOT_MARKER): sys_clk cycles and
+# wall time until the serial output marker, comparable between the main RAM modes.
+
+sim_checkpoint_cpp = """
+// Checkpoint/restore (sim.py --checkpoint-*) and boot time (sim.py --boot-marker).
+#include <sys/time.h>
+#include "verilated_save.h"
+
+extern "C" uint64_t sim_time_ps;
+extern "C" uint64_t timebase_ps;
+extern uint64_t main_time;
+
+static Vsim *checkpoint_sim;
+static const char *checkpoint_save;
+static const char *checkpoint_marker;
+static uint64_t checkpoint_cycle;
+static uint64_t checkpoint_cycles;
+static size_t checkpoint_matched;
+static int checkpoint_pending;
+static int checkpoint_clk;
+static const char *boot_marker;
+static size_t boot_matched;
+static struct timeval boot_start;
+
+static int litex_sim_marker_match(const char *marker, size_t *matched, char c)
+{
+    if (c == marker[*matched])
+        (*matched)++;
+    else
+        *matched = (c == marker[0]);
+    return !marker[*matched];
+}
+
+static void litex_sim_checkpoint_init(Vsim *sim)
+{
+    const char *restore = getenv("LITEX_SIM_CHECKPOINT_RESTORE");
+    const char *cycle   = getenv("LITEX_SIM_CHECKPOINT_CYCLE");
+
+    checkpoint_sim    = sim;
+    checkpoint_save   = getenv("LITEX_SIM_CHECKPOINT_SAVE");
+    checkpoint_marker = getenv("LITEX_SIM_CHECKPOINT_MARKER");
+    checkpoint_cycle  = cycle ? strtoull(cycle, NULL, 0) : 0;
+    boot_marker       = getenv("LITEX_SIM_BOOT_MARKER");
+    if (restore) {
+        VerilatedRestore os;
+        os.open(restore);
+        os >> *sim;
+        os >> sim_time_ps >> checkpoint_cycles;
+        os.close();
+        main_time    = sim_time_ps;
+        sim_time_ps += timebase_ps;
+        printf("[checkpoint] %s restored (cycle %llu)\\n", restore, (unsigned long long)checkpoint_cycles);
+    }
+    gettimeofday(&boot_start, NULL);
+}
+
+static void litex_sim_checkpoint()
+{
+    Vsim *sim = checkpoint_sim;
+    struct timeval now;
+    char c;
+
+    if (!checkpoint_save && !boot_marker)
+        return;
+    if (sim->sys_clk && !checkpoint_clk) {
+        checkpoint_cycles++;
+        if (checkpoint_save && checkpoint_cycles == checkpoint_cycle)
+            checkpoint_pending = 1;
+        if (sim->serial_source_valid) {
+            c = sim->serial_source_data;
+            if (checkpoint_save && checkpoint_marker && litex_sim_marker_match(checkpoint_marker, &checkpoint_matched, c))
+                checkpoint_pending = 1;
+            if (boot_marker && litex_sim_marker_match(boot_marker, &boot_matched, c)) {
+                gettimeofday(&now, NULL);
+                printf("\\n[boot] \\"%s\\" reached at sys_clk cycle %llu (%.1fs)\\n", boot_marker,
+                    (unsigned long long)checkpoint_cycles,
+                    (now.tv_sec - boot_start.tv_sec) + (now.tv_usec - boot_start.tv_usec)/1e6);
+                fflush(stdout);
+                boot_marker = NULL;
+            }
+        }
+    } else if (!sim->sys_clk && checkpoint_clk && checkpoint_pending) {
+        VerilatedSave os;
+        os.open(checkpoint_save);
+        os << *sim;
+        os << sim_time_ps << checkpoint_cycles;
+        os.close();
+        printf("\\n[checkpoint] %s saved (cycle %llu)\\n", checkpoint_save, (unsigned long long)checkpoint_cycles);
+        fflush(stdout);
+        exit(0);
+    }
+    checkpoint_clk = sim->sys_clk;
+}
+"""
+
+def _patch_sim_file(filename, replacements):
+    # Replaces anchors of a generated file ([(anchor, replacement)]), each anchor must occur once: a
+    # changed LiteX template would otherwise silently build the model without the hooks.
+    with open(filename) as f:
+        content = f.read()
+    for anchor, replacement in replacements:
+        count = content.count(anchor)
+        if count != 1:
+            raise ValueError("{}: {!r} found {} times (expected once), unsupported LiteX simulation template".format(
+                filename, anchor, count))
+        content = content.replace(anchor, replacement)
+    with open(filename, "w") as f:
+        f.write(content)
+
+def add_sim_checkpoint(gateware_dir):
+    # Build the model with --savable and add the checkpoint hooks to sim_init.cpp.
+    _patch_sim_file(os.path.join(gateware_dir, "sim_init.cpp"), [
+        ('#include "sim_header.h"\n',             '#include "sim_header.h"\n' + sim_checkpoint_cpp),
+        ('extern "C" void litex_sim_dump()\n{\n', 'extern "C" void litex_sim_dump()\n{\n    litex_sim_checkpoint();\n'),
+        ("    *out=sim;\n",                       "    litex_sim_checkpoint_init(sim);\n    *out=sim;\n"),
+    ])
+    _patch_sim_file(os.path.join(gateware_dir, "build_sim.sh"), [
+        ('CC_SRCS="', 'CC_SRCS="--savable '),
+    ])
+
+def get_sim_checkpoint_env(save=None, cycle=None, marker=None, restore=None, boot_marker=None):
+    env = {}
+    for name, value in [("SAVE", save), ("CYCLE", cycle), ("MARKER", marker), ("RESTORE", restore)]:
+        if value is not None:
+            env[f"LITEX_SIM_CHECKPOINT_{name}"] = os.path.abspath(value) if name in ["SAVE", "RESTORE"] else str(value)
+    if boot_marker is not None:
+        env["LITEX_SIM_BOOT_MARKER"] = boot_marker
+    return env
+
 # SoCLinux -----------------------------------------------------------------------------------------
 
 class SoCLinux(SoCCore):
     def __init__(self, sys_clk_freq=int(100e6),
         init_memories    = False,
+        ram_init         = "gateware",
+        with_sdram       = False,
+        main_ram_size    = 0x4000000,
         sdram_module     = "MT48LC16M16",
         sdram_data_width = 32,
-        sdram_verbosity  = 0
+        sdram_verbosity  = 0,
+        trace_cycles     = (None, None),
+        trace_addresses  = (None, None),
+        trace_csr        = False,
     ):
+        self.init_memories = init_memories
+        self.ram_init      = ram_init
+        self.with_sdram    = with_sdram
+
         # Platform ---------------------------------------------------------------------------------
         platform     = Platform()
-        self.comb += platform.trace.eq(1)
-
-        # RAM Init ---------------------------------------------------------------------------------
-        ram_init = []
-        if init_memories:
-            ram_init = get_mem_data("images/boot_ram0.json", endianness="little", offset=0x40000000)
 
         # CRG --------------------------------------------------------------------------------------
         self.crg = CRG(platform.request("sys_clk"))
 
         # SoCCore ----------------------------------------------------------------------------------
+        # Memory accesses through the CPU Wishbone bus without SDRAM (no LiteDRAM port), sets the bus
+        # width. Class attribute: always set, a previous SoC must not leak its setting.
+        VexRiscvSMP.wishbone_memory = not with_sdram
         SoCCore.__init__(self, platform, clk_freq=sys_clk_freq,
             cpu_type            = "vexriscv_smp",
             cpu_variant         = "linux",
@@ -100,31 +441,74 @@ class SoCLinux(SoCCore):
         self.add_constant("ROM_BOOT_ADDRESS", self.bus.regions["opensbi"].origin)
 
         # Supervisor -------------------------------------------------------------------------------
-        self.supervisor = Supervisor()
-
-        # SDRAM ------------------------------------------------------------------------------------
-        sdram_clk_freq   = int(100e6) # FIXME: use 100MHz timings
-        sdram_module_cls = getattr(litedram_modules, sdram_module)
-        sdram_rate       = "1:{}".format(sdram_module_nphases[sdram_module_cls.memtype])
-        sdram_module     = sdram_module_cls(sdram_clk_freq, sdram_rate)
-        phy_settings     = get_sdram_phy_settings(
-            memtype    = sdram_module.memtype,
-            data_width = sdram_data_width,
-            clk_freq   = sdram_clk_freq,
-        )
-        self.sdrphy = SDRAMPHYModel(
-            module    = sdram_module,
-            settings  = phy_settings,
-            clk_freq  = sdram_clk_freq,
-            verbosity = sdram_verbosity,
-            init      = ram_init,
-        )
-        self.add_sdram("sdram",
-            phy           = self.sdrphy,
-            module        = sdram_module,
-            l2_cache_size = 0,
+        self.supervisor = Supervisor(
+            trace_cycles    = trace_cycles,
+            trace_addresses = trace_addresses,
+            trace_bus       = self.cpu.pbus,
+            trace_csr       = trace_csr,
         )
-        self.add_constant("SDRAM_TEST_DISABLE") # Skip SDRAM test to avoid corrupting pre-initialized contents.
+        self.comb += platform.trace.eq(self.supervisor.trace)
+
+        # Main RAM ---------------------------------------------------------------------------------
+        # SDRAM model behind the LiteDRAM controller (timing accurate) with --with-sdram, else an
+        # integrated RAM (functional, no DRAM timings).
+        if with_sdram:
+            sdram_clk_freq   = int(100e6) # FIXME: use 100MHz timings
+            sdram_module_cls = getattr(litedram_modules, sdram_module)
+            sdram_rate       = "1:{}".format(sdram_module_nphases[sdram_module_cls.memtype])
+            sdram_module     = sdram_module_cls(sdram_clk_freq, sdram_rate)
+            phy_settings     = get_sdram_phy_settings(
+                memtype    = sdram_module.memtype,
+                data_width = sdram_data_width,
+                clk_freq   = sdram_clk_freq,
+            )
+            self.sdrphy = SDRAMPHYModel(
+                module    = sdram_module,
+                settings  = phy_settings,
+                clk_freq  = sdram_clk_freq,
+                verbosity = sdram_verbosity,
+            )
+            self.add_sdram("sdram",
+                phy           = self.sdrphy,
+                module        = sdram_module,
+                l2_cache_size = 0,
+            )
+            self.add_constant("SDRAM_TEST_DISABLE") # Skip SDRAM test to avoid corrupting pre-initialized contents.
+        else:
+            self.add_ram("main_ram", self.mem_map["main_ram"], main_ram_size)
+            if init_memories:
+                self.add_config("MAIN_RAM_INIT") # Skip Main RAM test to avoid corrupting pre-initialized contents.
+
+    def init_mems(self, **kwargs):
+        # Called by the Builder between the csr.json export and the gateware generation.
+        self.generate_dts("sim")
+        self.compile_dts("sim")
+        if self.init_memories and self.ram_init == "binary":
+            self.ram_init_binary = get_ram_init_binary("images/boot_ram0.json",
+                offset    = self.mem_map["main_ram"],
+                cache_dir = os.path.join("build", "sim", "ram_init"),
+            )
+            # Placeholder init: the $readmemh files are written before each run.
+            for memory in self.get_main_ram_memories():
+                memory.init = [0]
+        elif self.init_memories:
+            data = get_ram_init_data("images/boot_ram0.json", offset=self.mem_map["main_ram"])
+            for memory, content in zip(self.get_main_ram_memories(), self.get_main_ram_data(data)):
+                memory.init = get_memory_init(content, memory.width)
+
+    def get_main_ram_memories(self):
+        if self.with_sdram:
+            return get_sdram_bank_memories(self.sdrphy)
+        return [self.main_ram.mem]
+
+    def get_main_ram_data(self, data):
+        # Main RAM memories contents of a flat RAM image.
+        if self.with_sdram:
+            return get_sdram_bank_data(data, self.sdrphy)
+        word_bytes = self.main_ram.mem.width//8
+        if len(data) > self.main_ram.mem.depth*word_bytes:
+            raise ValueError("RAM image (0x{:x} bytes) exceeds main_ram size, increase --main-ram-size".format(len(data)))
+        return [bytes(data) + bytes(-len(data) % word_bytes)]
 
     def generate_dts(self, board_name):
         json_src = os.path.join("build", board_name, "csr.json")
@@ -145,37 +529,90 @@ class SoCLinux(SoCCore):
 
 def main():
     parser = argparse.ArgumentParser(description="Linux on LiteX-VexRiscv Simulation.")
-    parser.add_argument("--with-sdram",       action="store_true",   help="Enable SDRAM support.")
+    parser.add_argument("--with-sdram",       action="store_true",   help="Enable SDRAM support (LiteDRAM controller and SDRAM model, default: functional main RAM).")
+    parser.add_argument("--main-ram-size",    default="0x4000000",   help="Main RAM size without SDRAM.")
     parser.add_argument("--sdram-module",     default="MT48LC16M16", help="Select SDRAM chip.")
     parser.add_argument("--sdram-data-width", default=32,            help="Set SDRAM chip data width.")
     parser.add_argument("--sdram-verbosity",  default=0,             help="Set SDRAM checker verbosity.")
+    parser.add_argument("--ram-init",         default="gateware",    help="RAM contents: in the gateware or from a cached binary image (kernel changes don't recompile the simulation).",
+        choices=["gateware", "binary"]
+    )
+    parser.add_argument("--checkpoint-save",    default=None,        help="Save a simulation checkpoint to this file (at --checkpoint-cycle/--checkpoint-marker) and exit.")
+    parser.add_argument("--checkpoint-cycle",   default=None, type=int, help="sys_clk cycle of the checkpoint.")
+    parser.add_argument("--checkpoint-marker",  default=None,        help="Serial output marker of the checkpoint (ex: \"# \" for the shell prompt).")
+    parser.add_argument("--checkpoint-restore", default=None,        help="Start the simulation from a checkpoint saved by the same simulation build.")
+    parser.add_argument("--boot-marker",        default=None,        help="Print the sys_clk cycle/wall time at which this serial output marker is reached (ex: \"# \"), to compare the boot time of the main RAM modes.")
+    parser.add_argument("--trace-cycle-start",   default=None, type=int,            help="Open the trace window at this sys_clk cycle.")
+    parser.add_argument("--trace-cycle-end",     default=None, type=int,            help="Close the trace window at this sys_clk cycle.")
+    parser.add_argument("--trace-address-start", default=None, type=lambda x: int(x, 0), help="Open the trace window on a CPU peripheral bus access to this address.")
+    parser.add_argument("--trace-address-end",   default=None, type=lambda x: int(x, 0), help="Close the trace window on a CPU peripheral bus access to this address.")
+    parser.add_argument("--trace-csr",           action="store_true",               help="Also trace while software sets the supervisor_trace CSR (window closed at start).")
     VexRiscvSMP.args_fill(parser)
     verilator_build_args(parser)
     args = parser.parse_args()
+    if args.checkpoint_save and args.checkpoint_cycle is None and args.checkpoint_marker is None:
+        parser.error("--checkpoint-save requires --checkpoint-cycle or --checkpoint-marker")
+    if (args.checkpoint_cycle is not None or args.checkpoint_marker is not None) and not args.checkpoint_save:
+        parser.error("--checkpoint-cycle/--checkpoint-marker require --checkpoint-save")
+    if args.checkpoint_restore and not os.path.exists(args.checkpoint_restore):
+        parser.error(f"{args.checkpoint_restore} not found")
+    with_checkpoint = args.checkpoint_save is not None or args.checkpoint_restore is not None
+    with_hooks      = with_checkpoint or args.boot_marker is not None
+    if with_hooks and int(args.threads) > 1:
+        parser.error("Verilator checkpoints/--boot-marker (--savable) require --threads=1")
 
     VexRiscvSMP.args_read(args)
     verilator_build_kwargs = verilator_build_argdict(args)
     sim_config = SimConfig(default_clk="sys_clk")
     sim_config.add_module("serial2console", "serial")
 
-    for i in range(2):
-        prepare = (i == 0)
-        run     = (i == 1)
-        soc = SoCLinux(
-            init_memories    = run,
-            sdram_module     = args.sdram_module,
-            sdram_data_width = int(args.sdram_data_width),
-            sdram_verbosity  = int(args.sdram_verbosity)
+    # Single pass: the DTB and the RAM contents are generated by SoCLinux.init_mems.
+    soc = SoCLinux(
+        init_memories    = True,
+        ram_init         = args.ram_init,
+        with_sdram       = args.with_sdram,
+        main_ram_size    = int(args.main_ram_size, 0),
+        sdram_module     = args.sdram_module,
+        sdram_data_width = int(args.sdram_data_width),
+        sdram_verbosity  = int(args.sdram_verbosity),
+        trace_cycles     = (args.trace_cycle_start,   args.trace_cycle_end),
+        trace_addresses  = (args.trace_address_start, args.trace_address_end),
+        trace_csr        = args.trace_csr,
+    )
+    board_name = "sim"
+    build_dir  = os.path.join("build", board_name)
+    builder = Builder(soc, output_dir=build_dir,
+        csr_json = os.path.join(build_dir, "csr.json"))
+    # The LiteX toolchain always re-runs Verilator: the binary RAM init/checkpoint modes run the
+    # simulation themselves.
+    run = args.ram_init == "gateware" and not with_hooks
+    print("Main RAM: {}.".format("LiteDRAM + SDRAM model (timing accurate)" if args.with_sdram else "integrated RAM (functional)"))
+    vns = builder.build(sim_config=sim_config, run=run, **verilator_build_kwargs)
+    if not run:
+        if with_hooks:
+            add_sim_checkpoint(builder.gateware_dir)
+        if args.checkpoint_restore is not None:
+            key = None
+            if os.path.exists(args.checkpoint_restore + ".key"):
+                with open(args.checkpoint_restore + ".key") as f:
+                    key = f.read()
+            if key != get_sim_gateware_key(builder.gateware_dir):
+                raise ValueError(f"{args.checkpoint_restore} was not saved by this simulation build")
+        if args.checkpoint_save is not None:
+            for filename in [args.checkpoint_save, args.checkpoint_save + ".key"]:
+                if os.path.exists(filename):
+                    os.remove(filename)
+        env = get_sim_checkpoint_env(
+            save        = args.checkpoint_save,
+            cycle       = args.checkpoint_cycle,
+            marker      = args.checkpoint_marker,
+            restore     = args.checkpoint_restore,
+            boot_marker = args.boot_marker,
         )
-        board_name = "sim"
-        build_dir  = os.path.join("build", board_name)
-        builder = Builder(soc, output_dir=build_dir,
-            compile_gateware = run,
-            csr_json         = os.path.join(build_dir, "csr.json"))
-        builder.build(sim_config=sim_config, run=run, **verilator_build_kwargs)
-        if prepare:
-            soc.generate_dts(board_name)
-            soc.compile_dts(board_name)
+        key = run_sim(soc, vns, builder.gateware_dir, env)
+        if args.checkpoint_save is not None and os.path.exists(args.checkpoint_save):
+            with open(args.checkpoint_save + ".key", "w") as f:
+                f.write(key)
 
 if __name__ == "__main__":
     main()
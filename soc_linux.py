@@ -5,8 +5,8 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import os
+import re
 import json
-import shutil
 import subprocess
 
 from migen import *
@@ -19,8 +19,49 @@ from litex.soc.cores.spi     import SPIMaster
 from litex.soc.cores.bitbang import I2CMaster
 from litex.soc.cores.pwm     import PWM
 
+from litex.soc.integration import export
+
 from litex.tools.litex_json2dts_linux import generate_dts
 
+from dtb_patch import combine_dtb
+
+# Boot Arguments -----------------------------------------------------------------------------------
+
+def get_dts_bootargs(dts):
+    m = re.search(r'bootargs\s*=\s*"([^"]*)";', dts)
+    return m.group(1).split() if m is not None else []
+
+def set_dts_bootargs(dts, bootargs):
+    return re.sub(r'(bootargs\s*=\s*)"[^"]*";', lambda m: f'{m.group(1)}"{" ".join(bootargs)}";', dts, count=1)
+
+def get_nfs_bootargs(bootargs, nfs_server, nfs_root, nfs_options=None):
+    nfsroot = f"{nfs_server}:{nfs_root}"
+    if nfs_options:
+        nfsroot += f",{nfs_options}"
+    nfs_bootargs = []
+    for arg in bootargs:
+        # NFS root does not wait for a block device.
+        if arg == "rootwait":
+            continue
+        if arg.startswith("root="):
+            nfs_bootargs += ["root=/dev/nfs", f"nfsroot={nfsroot}"]
+        else:
+            nfs_bootargs.append(arg)
+    return nfs_bootargs
+
+# Read-only compressed RootFS (squashfs/erofs) on the SDCard rootfs partition, started through the
+# overlay init script (tmpfs overlay for writes).
+ro_rootfs_device = "mmcblk0p2"
+ro_rootfs_init   = "/sbin/overlay-init"
+
+def get_ro_rootfs_bootargs(bootargs, fstype):
+    ro_bootargs = [arg for arg in bootargs if arg not in ["ro", "rw"] and not arg.startswith(("rootfstype=", "init="))]
+    return ro_bootargs + ["ro", f"rootfstype={fstype}", f"init={ro_rootfs_init}"]
+
+# Initramfs unpack time measurement (initrd.py boot-time): unpacked synchronously, without other
+# initcalls running meanwhile.
+initrd_timing_bootargs = ["initramfs_async=0"]
+
 # SoCLinux -----------------------------------------------------------------------------------------
 
 def SoCLinux(soc_cls, **kwargs):
@@ -72,61 +113,76 @@ def SoCLinux(soc_cls, **kwargs):
         def generate_dts(
             self,
             board_name,
-            rootfs      = "ram0",
-            nfs_server  = None,
-            nfs_root    = None,
-            nfs_options = None,
+            rootfs        = "ram0",
+            nfs_server    = None,
+            nfs_root      = None,
+            nfs_options   = None,
+            build_dir     = "build",
+            images_dir    = "images",
+            initrd        = "rootfs.cpio.gz",
+            initrd_start  = None,
+            initrd_timing = False,
         ):
-            json_src = os.path.join("build", board_name, "csr.json")
-            dts = os.path.join("build", board_name, "{}.dts".format(board_name))
+            dts = os.path.join(build_dir, board_name, "{}.dts".format(board_name))
             if rootfs == "ram0":
-                initrd = os.path.join("images", "rootfs.cpio.gz")
+                initrd = os.path.join(images_dir, initrd)
                 if not os.path.exists(initrd):
                     initrd = "enabled"
             else:
                 initrd = "disabled"
 
-            with open(json_src) as json_file, open(dts, "w") as dts_file:
-                dts_content = generate_dts(json.load(json_file),
-                    initrd      = initrd,
-                    polling     = False,
-                    root_device = rootfs
-                )
-                if rootfs == "nfs":
-                    if nfs_server is None or nfs_root is None:
-                        raise ValueError("nfs_server and nfs_root are required for NFS rootfs")
-                    nfsroot = f"{nfs_server}:{nfs_root}"
-                    if nfs_options:
-                        nfsroot += f",{nfs_options}"
-                    dts_content = dts_content.replace(
-                        "rootwait root=/dev/nfs",
-                        f"root=/dev/nfs nfsroot={nfsroot}",
-                    )
+            # Generate the DTS from the live SoC (same contents as the csr.json exported by the
+            # Builder, without writing/reading it back from disk).
+            # The initrd start (boot layout) is relative to the main RAM base for json2dts.
+            csr_dict = self.get_csr_dict()
+            if initrd_start is not None:
+                initrd_start -= csr_dict["memories"]["main_ram"]["base"]
+            dts_content = generate_dts(csr_dict,
+                initrd_start = initrd_start,
+                initrd       = initrd,
+                polling      = False,
+                root_device  = ro_rootfs_device if rootfs in ["squashfs", "erofs"] else rootfs
+            )
+            if rootfs == "nfs":
+                if nfs_server is None or nfs_root is None:
+                    raise ValueError("nfs_server and nfs_root are required for NFS rootfs")
+                bootargs = get_nfs_bootargs(get_dts_bootargs(dts_content), nfs_server, nfs_root, nfs_options)
+                dts_content = set_dts_bootargs(dts_content, bootargs)
+            if rootfs in ["squashfs", "erofs"]:
+                bootargs = get_ro_rootfs_bootargs(get_dts_bootargs(dts_content), rootfs)
+                dts_content = set_dts_bootargs(dts_content, bootargs)
+            if initrd_timing and rootfs == "ram0":
+                bootargs = get_dts_bootargs(dts_content) + initrd_timing_bootargs
+                dts_content = set_dts_bootargs(dts_content, bootargs)
+            with open(dts, "w") as dts_file:
                 dts_file.write(dts_content)
+            return dts_content
+
+        def get_csr_dict(self):
+            return json.loads(export.get_csr_json(
+                csr_regions = self.csr_regions,
+                constants   = self.constants,
+                mem_regions = self.mem_regions,
+            ))
 
         # DTS compilation --------------------------------------------------------------------------
 
-        def compile_dts(self, board_name, symbols=False):
-            dts = os.path.join("build", board_name, "{}.dts".format(board_name))
-            dtb = os.path.join("build", board_name, "{}.dtb".format(board_name))
-            subprocess.check_call(
-                "dtc {} -O dtb -o {} {}".format("-@" if symbols else "", dtb, dts), shell=True)
+        def compile_dts(self, board_name, symbols=False, build_dir="build"):
+            dts = os.path.join(build_dir, board_name, "{}.dts".format(board_name))
+            dtb = os.path.join(build_dir, board_name, "{}.dtb".format(board_name))
+            subprocess.check_call(["dtc", *(["-@"] if symbols else []), "-O", "dtb", "-o", dtb, dts])
 
         # DTB combination --------------------------------------------------------------------------
 
-        def combine_dtb(self, board_name, overlays=""):
-            dtb_in = os.path.join("build", board_name, "{}.dtb".format(board_name))
-            dtb_out = os.path.join("images", "rv32.dtb")
-            if overlays == "":
-                shutil.copyfile(dtb_in, dtb_out)
-            else:
-                subprocess.check_call(
-                    "fdtoverlay -i {} -o {} {}".format(dtb_in, dtb_out, overlays), shell=True)
+        def combine_dtb(self, board_name, overlays="", build_dir="build", images_dir="images"):
+            dtb_in = os.path.join(build_dir, board_name, "{}.dtb".format(board_name))
+            dtb_out = os.path.join(images_dir, "rv32.dtb")
+            combine_dtb(dtb_in, dtb_out, overlays)
 
         # Documentation generation -----------------------------------------------------------------
-        def generate_doc(self, board_name):
+        def generate_doc(self, board_name, build_dir="build"):
             from litex.soc.doc import generate_docs
-            doc_dir = os.path.join("build", board_name, "doc")
+            doc_dir = os.path.join(build_dir, board_name, "doc")
             generate_docs(self, doc_dir)
             os.system("sphinx-build -M html {}/ {}/_build".format(doc_dir, doc_dir))
 
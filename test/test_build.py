@@ -5,18 +5,93 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 import os
+import json
+import argparse
+import zlib
+import struct
 import shutil
 import tempfile
 import unittest
+import types
 import subprocess
 
+from boards import Board
+from boards_manifest import get_boards_manifest, filter_boards_manifest
+from boot_layout import (
+    generate_boot_json,
+    generate_flash_boot,
+    get_boot_json_images,
+    get_initrd_start,
+    get_missing_boot_stub_images,
+)
+from build_cache import get_build_cache_key, restore_build_cache, store_build_cache
+from dtb_patch import combine_dtb, get_dtb_int, patch_dtb_initrd, write_image
+from flash_delta import flash_delta, has_flash_offset_support, write_flash
+from initrd import compress_initrd, get_initrd_unpack_time
+from nfs_stage import stage_nfs_root
+from sdcard import (
+    generate_bmap,
+    generate_genimage_config,
+    get_genimage_config,
+    get_mapped_ranges,
+    get_sdcard_boot_files,
+    read_bmap,
+    update_sdcard,
+    write_sdcard,
+)
+from serial_boot import SerialBoot, get_boot_images, get_serial_boot_baudrate, get_tuning_word
+from sim import (
+    Supervisor,
+    add_sim_checkpoint,
+    compile_verilator_sim,
+    get_memory_init,
+    get_ram_init_binary,
+    get_ram_init_data,
+    get_sdram_bank_data,
+    get_sdram_bank_init,
+    get_sdram_bank_memories,
+    get_sim_checkpoint_env,
+    get_sim_gateware_key,
+    run_verilator_sim,
+    write_memory_init,
+)
+from soc_linux import (
+    get_dts_bootargs,
+    get_nfs_bootargs,
+    get_ro_rootfs_bootargs,
+    set_dts_bootargs,
+)
 from make import (
+    apply_bitstream_config,
+    generate_boot_images,
     generate_buildroot_defconfig,
+    get_board_argv,
+    get_board_shard,
     get_buildroot_base_defconfig,
     get_buildroot_config_overrides,
+    get_flash_images,
+    link_board_images,
+    reset_vexriscv_smp_config,
     supported_boards,
 )
 
+def generate_test_dtb(chosen):
+    # Minimal DTB with a /chosen node holding the given 32-bit properties.
+    strings = b""
+    dt = struct.pack(">I", 0x1) + b"\0\0\0\0"
+    dt += struct.pack(">I", 0x1) + b"chosen\0\0"
+    for name, value in chosen.items():
+        dt += struct.pack(">IIII", 0x3, 4, len(strings), value)
+        strings += name.encode() + b"\0"
+    dt += struct.pack(">III", 0x2, 0x2, 0x9)
+    off_rsvmap = 40
+    off_struct = off_rsvmap + 16
+    off_strings = off_struct + len(dt)
+    total = off_strings + len(strings)
+    header = struct.pack(">10I", 0xd00dfeed, total, off_struct, off_strings, off_rsvmap,
+        17, 16, 0, len(strings), len(dt))
+    return header + bytes(16) + dt + strings
+
 class TestBuild(unittest.TestCase):
     def board_build_test(
         self, board, cpu_count=1, extra_args=None,
@@ -121,6 +196,822 @@ class TestBuild(unittest.TestCase):
                         self.assertIn("\nBR2_TARGET_ROOTFS_TAR=y\n", "\n" + generated_defconfig)
                     if not with_fpu and not with_nfs_root:
                         self.assertNotIn("BR2_LINUX_KERNEL_CONFIG_FRAGMENT_FILES", generated_defconfig)
+                    self.assertNotIn("BR2_PACKAGE_LITEX_BOOT_STUB", generated_defconfig)
+
+        # Boot stub only built for the boot modes using it, host-lz4/Image.lz4 only for LZ4 boot.
+        for with_boot_stub, with_boot_compression in [(True, "none"), (True, "lz4")]:
+            with self.subTest(with_boot_stub=with_boot_stub, with_boot_compression=with_boot_compression):
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    generated = os.path.join(tmpdir, "buildroot_defconfig")
+                    generate_buildroot_defconfig(generated,
+                        with_boot_stub        = with_boot_stub,
+                        with_boot_compression = with_boot_compression,
+                    )
+                    with open(generated, encoding="utf-8") as f:
+                        config = f.read().splitlines()
+                self.assertIn("BR2_PACKAGE_LITEX_BOOT_STUB=y", config)
+                self.assertEqual("BR2_PACKAGE_HOST_LZ4=y" in config, with_boot_compression == "lz4")
+                self.assertEqual('BR2_ROOTFS_POST_SCRIPT_ARGS="boot=lz4"' in config, with_boot_compression == "lz4")
+
+    def test_board_shards(self):
+        board_names = list(supported_boards.keys())
+        shards = [get_board_shard(board_names, f"{i}/4") for i in range(1, 5)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(board_names))
+        for shard in ["0/4", "5/4", "1-4"]:
+            with self.assertRaises(ValueError):
+                get_board_shard(board_names, shard)
+
+    def test_board_argv(self):
+        argv = ["--board=all", "--jobs", "8", "--shard=1/2", "--cpu-count=2", "--build"]
+        self.assertEqual(
+            get_board_argv("arty", argv),
+            ["--board=arty", "--cpu-count=2", "--build"],
+        )
+        # Parallel builds: each board gets its own images directory, linking the Linux images.
+        self.assertEqual(
+            get_board_argv("arty", argv + ["--images-dir", "images"], "build/arty/images"),
+            ["--board=arty", "--cpu-count=2", "--build", "--images-dir=build/arty/images"],
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            images_dir = os.path.join(tmpdir, "images")
+            os.makedirs(images_dir)
+            for name in ["Image", "rv32.dtb"]:
+                with open(os.path.join(images_dir, name), "wb") as f:
+                    f.write(name.encode())
+            board_images_dir = os.path.join(tmpdir, "build", "arty", "images")
+            link_board_images(images_dir, board_images_dir)
+            link_board_images(images_dir, board_images_dir)
+            self.assertEqual(os.listdir(board_images_dir), ["Image"])
+            with open(os.path.join(board_images_dir, "Image"), "rb") as f:
+                self.assertEqual(f.read(), b"Image")
+
+    def test_vexriscv_smp_config_reset(self):
+        from litex.soc.cores.cpu.vexriscv_smp import VexRiscvSMP
+        reset_vexriscv_smp_config()
+        cpu_count, with_fpu = VexRiscvSMP.cpu_count, VexRiscvSMP.with_fpu
+        VexRiscvSMP.cpu_count = 4
+        VexRiscvSMP.with_fpu  = not with_fpu
+        reset_vexriscv_smp_config()
+        self.assertEqual(VexRiscvSMP.cpu_count, cpu_count)
+        self.assertEqual(VexRiscvSMP.with_fpu,  with_fpu)
+
+    def test_build_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, "input")
+            with open(input_file, "w") as f:
+                f.write("0")
+            key = get_build_cache_key({"board": "arty", "l2_size": 0}, [input_file])
+            self.assertEqual(key, get_build_cache_key({"l2_size": 0, "board": "arty"}, [input_file]))
+            self.assertNotEqual(key, get_build_cache_key({"board": "arty", "l2_size": 2048}, [input_file]))
+            with open(input_file, "w") as f:
+                f.write("1")
+            self.assertNotEqual(key, get_build_cache_key({"board": "arty", "l2_size": 0}, [input_file]))
+
+            cache_dir = os.path.join(tmpdir, "cache")
+            build_dir = os.path.join(tmpdir, "build", "arty")
+            dtb       = os.path.join(tmpdir, "images", "rv32.dtb")
+            os.makedirs(build_dir)
+            for filename, content in [("csr.json", "{}"), ("arty.dtb", "dtb"), ("make.log", "log")]:
+                with open(os.path.join(build_dir, filename), "w") as f:
+                    f.write(content)
+            self.assertFalse(restore_build_cache(cache_dir, key, build_dir))
+            store_build_cache(cache_dir, key, build_dir)
+            self.assertEqual(sorted(os.listdir(os.path.join(cache_dir, key))), ["build"])
+            shutil.rmtree(build_dir)
+            self.assertTrue(restore_build_cache(cache_dir, key, build_dir))
+            self.assertTrue(os.path.isfile(os.path.join(build_dir, "csr.json")))
+            self.assertFalse(os.path.exists(os.path.join(build_dir, "make.log")))
+            # The shared DTB is regenerated from the restored board DTB.
+            combine_dtb(os.path.join(build_dir, "arty.dtb"), dtb)
+            with open(dtb) as f:
+                self.assertEqual(f.read(), "dtb")
+
+    def test_boards_manifest(self):
+        manifest = get_boards_manifest()
+        self.assertEqual(sorted(manifest.keys()), sorted(supported_boards.keys()))
+        for name, info in manifest.items():
+            with self.subTest(board=name):
+                soc_kwargs = dict(Board.soc_kwargs)
+                soc_kwargs.update(supported_boards[name].soc_kwargs)
+                self.assertEqual(info["soc_kwargs"], soc_kwargs)
+                self.assertEqual(info["bitstream_config"], supported_boards[name].bitstream_config)
+                self.assertIsNotNone(info["family"])
+                self.assertIsNotNone(info["target"])
+                self.assertNotEqual(info["capabilities"], [])
+        boards = filter_boards_manifest(manifest, ["ethernet", "sdcard"])
+        self.assertIn("arty", boards)
+        self.assertNotIn("arty_s7", boards)
+
+    def test_bitstream_config(self):
+        class Platform:
+            def __init__(self, toolchain):
+                self.toolchain = type(toolchain, (), {"bitstream_commands": []})()
+        platform     = Platform("XilinxVivadoToolchain")
+        build_kwargs = {}
+        self.assertTrue(apply_bitstream_config(platform, supported_boards["alveo_u250"].bitstream_config, build_kwargs))
+        self.assertEqual(build_kwargs, {})
+        self.assertEqual(platform.toolchain.bitstream_commands, [
+            "set_property BITSTREAM.GENERAL.COMPRESS TRUE [current_design]",
+            "set_property BITSTREAM.CONFIG.CONFIGRATE 63.8 [current_design]",
+            "set_property BITSTREAM.CONFIG.SPI_BUSWIDTH 4 [current_design]",
+            "set_property BITSTREAM.CONFIG.SPI_FALL_EDGE YES [current_design]",
+            "set_property BITSTREAM.CONFIG.SPI_32BIT_ADDR YES [current_design]",
+        ])
+        self.assertTrue(apply_bitstream_config(Platform("LatticeTrellisToolchain"), supported_boards["ulx3s"].bitstream_config, build_kwargs))
+        self.assertEqual(build_kwargs, {"compress": True, "freq": 38.8, "spimode": "fast-read"})
+        self.assertFalse(apply_bitstream_config(Platform("GowinToolchain"), {"compress": True}, build_kwargs))
+
+    def test_flash_delta(self):
+        class FlashProgrammer:
+            def __init__(self, readback=True):
+                self.memory = bytearray(b"\xff"*0x100000)
+                self.calls  = []
+                if readback:
+                    self.read_flash = self._read_flash
+            def _read_flash(self, offset, size, filename):
+                with open(filename, "wb") as f:
+                    f.write(self.memory[offset:offset + size])
+            def flash(self, address, data):
+                with open(data, "rb") as f:
+                    data = f.read()
+                self.memory[address:address + len(data)] = data
+                self.calls.append((address, len(data)))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bitstream = bytearray(os.urandom(0x48000))
+            images    = {0: os.path.join(tmpdir, "top.bin"), 0x60000: os.path.join(tmpdir, "rv32.dtb")}
+            with open(images[0x60000], "wb") as f:
+                f.write(os.urandom(0x800))
+            for readback in [True, False]:
+                with self.subTest(readback=readback):
+                    prog  = FlashProgrammer(readback)
+                    state = os.path.join(tmpdir, f"flash_state_{readback}.json")
+                    prog.memory[0x48000:0x50000] = bytes(0x8000) # Data after the bitstream.
+                    with open(images[0], "wb") as f:
+                        f.write(bitstream)
+                    self.assertEqual(flash_delta(prog, images, state=state), (6, 6))
+                    self.assertTrue(all(address % 0x10000 == 0 and size % 0x10000 == 0 for address, size in prog.calls))
+                    self.assertEqual(prog.memory[:0x48000], bitstream)
+                    if readback:
+                        self.assertEqual(prog.memory[0x48000:0x50000], bytes(0x8000))
+                    # Unchanged: nothing programmed, one changed byte: one sector programmed.
+                    self.assertEqual(flash_delta(prog, images, state=state), (0, 6))
+                    bitstream[0x21234] ^= 0xff
+                    with open(images[0], "wb") as f:
+                        f.write(bitstream)
+                    prog.calls.clear()
+                    self.assertEqual(flash_delta(prog, images, state=state), (1, 6))
+                    self.assertEqual(prog.calls, [(0x20000, 0x10000)])
+                    self.assertEqual(prog.memory[:0x48000], bitstream)
+                    bitstream[0x21234] ^= 0xff
+
+            # Runs are merged over close sectors, never over sectors not covered by the images.
+            prog = FlashProgrammer()
+            flash_delta(prog, images)
+            prog.calls.clear()
+            prog.memory[0x00000] ^= 0xff
+            prog.memory[0x30000] ^= 0xff
+            prog.memory[0x60000] ^= 0xff
+            self.assertEqual(flash_delta(prog, images), (5, 6))
+            self.assertEqual(prog.calls, [(0x00000, 0x40000), (0x60000, 0x10000)])
+
+        # Delta/images flashing only with programmers writing at the given offset, all the OpenOCD
+        # runs in one session.
+        from litex.build.openocd import OpenOCD
+        from litex.build.xilinx.programmer import VivadoProgrammer
+        class OpenOCDProgrammer(OpenOCD):
+            def __init__(self):
+                OpenOCD.__init__(self, "board.cfg", "proxy.bit")
+                self.calls = []
+            def find_config(self):
+                return self.config
+            def find_flash_proxy(self):
+                return self.flash_proxy_basename
+            def call(self, command):
+                self.calls.append(command)
+        self.assertTrue(has_flash_offset_support(OpenOCDProgrammer()))
+        self.assertFalse(has_flash_offset_support(VivadoProgrammer()))
+        prog = OpenOCDProgrammer()
+        write_flash(prog, {0x400000: "Image", 0: "top.bin"})
+        self.assertEqual(len(prog.calls), 1)
+        script = prog.calls[0][-1]
+        self.assertIn("jtagspi_program {top.bin} 0x0; jtagspi_program {Image} 0x400000; fpga_program", script)
+        self.assertEqual(script.count("jtagspi_init"), 1)
+        board = Board()
+        board.platform = types.SimpleNamespace(create_programmer=VivadoProgrammer)
+        with self.assertRaises(ValueError):
+            board.flash("top.bin", images={0x400000: "Image"})
+        with self.assertRaises(ValueError):
+            board.flash("top.bin", delta=True)
+
+        self.assertEqual(get_flash_images(["images/Image@0x400000", "rv32.dtb@4096"]),
+            {0x400000: "images/Image", 4096: "rv32.dtb"})
+        for flash_image in ["images/Image", "images/Image@foo", "@0x1000"]:
+            with self.assertRaises(ValueError):
+                get_flash_images([flash_image])
+
+    def test_dtb_initrd_patch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dtb    = os.path.join(tmpdir, "rv32.dtb")
+            initrd = os.path.join(tmpdir, "rootfs.cpio.gz")
+            with open(initrd, "wb") as f:
+                f.write(bytes(0x1234))
+            with open(dtb, "wb") as f:
+                f.write(generate_test_dtb({
+                    "bootargs"           : 0,
+                    "linux,initrd-start" : 0x41000000,
+                    "linux,initrd-end"   : 0x41800000,
+                }))
+            self.assertEqual(patch_dtb_initrd(dtb, initrd), (0x41000000, 0x41001234))
+            self.assertEqual(patch_dtb_initrd(dtb, initrd, 0x42000000), (0x42000000, 0x42001234))
+            with open(dtb, "rb") as f:
+                content = f.read()
+            self.assertEqual(get_dtb_int(content, "/chosen", "linux,initrd-start"), 0x42000000)
+            self.assertEqual(get_dtb_int(content, "/chosen", "linux,initrd-end"),   0x42001234)
+            # Initrd not built yet: the range is moved with its current size.
+            self.assertEqual(patch_dtb_initrd(dtb, initrd_start=0x40f80000), (0x40f80000, 0x40f81234))
+
+            with open(dtb, "wb") as f:
+                f.write(generate_test_dtb({"bootargs": 0}))
+            self.assertIsNone(patch_dtb_initrd(dtb, initrd))
+
+    def test_boot_layout(self):
+        memories = {
+            "main_ram" : {"base": 0x40000000, "size": 0x02000000},
+            "opensbi"  : {"base": 0x40f00000, "size": 0x00080000},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Image header with a 0x800000 effective size (larger than the file).
+            header = bytearray(64)
+            struct.pack_into("<Q", header, 16, 0x800000)
+            header[48:60] = b"RISCV\0\0\0RSC\x05"
+            with open(os.path.join(tmpdir, "Image"), "wb") as f:
+                f.write(header)
+            with open(os.path.join(tmpdir, "rv32.dtb"), "wb") as f:
+                f.write(generate_test_dtb({
+                    "linux,initrd-start" : 0x41000000,
+                    "linux,initrd-end"   : 0x41800000,
+                }))
+
+            # Before the Buildroot build (no rootfs yet): the DTB initrd start already follows the
+            # layout (json2dts default range moved).
+            self.assertEqual(get_initrd_start(memories), 0x40f80000)
+            self.assertEqual(generate_boot_json("ram0", memories, tmpdir)["rootfs.cpio.gz"], 0x40f80000)
+            with open(os.path.join(tmpdir, "rv32.dtb"), "rb") as f:
+                dtb = f.read()
+            self.assertEqual(get_dtb_int(dtb, "/chosen", "linux,initrd-start"), 0x40f80000)
+            self.assertEqual(get_dtb_int(dtb, "/chosen", "linux,initrd-end"),   0x40f80000 + 0x800000)
+
+            with open(os.path.join(tmpdir, "rootfs.cpio.gz"), "wb") as f:
+                f.write(bytes(0x1234))
+            layout = generate_boot_json("ram0", memories, tmpdir)
+            self.assertEqual(layout, {
+                "Image"          : 0x40000000,
+                "rv32.dtb"       : 0x40ef0000,
+                "rootfs.cpio.gz" : 0x40f80000,
+                "opensbi.bin"    : 0x40f00000,
+            })
+            with open(os.path.join(tmpdir, "boot.json")) as f:
+                self.assertEqual(json.load(f)["rootfs.cpio.gz"], "0x40f80000")
+            with open(os.path.join(tmpdir, "rv32.dtb"), "rb") as f:
+                dtb = f.read()
+            self.assertEqual(get_dtb_int(dtb, "/chosen", "linux,initrd-start"), 0x40f80000)
+            self.assertEqual(get_dtb_int(dtb, "/chosen", "linux,initrd-end"),   0x40f81234)
+
+            # No rootfs for NFS.
+            self.assertNotIn("rootfs.cpio.gz", generate_boot_json("nfs", memories, tmpdir))
+
+            # Kernel larger than the space below the DTB / rootfs larger than main RAM.
+            struct.pack_into("<Q", header, 16, 0x1000000)
+            with open(os.path.join(tmpdir, "Image"), "wb") as f:
+                f.write(header)
+            with self.assertRaises(ValueError):
+                generate_boot_json("ram0", memories, tmpdir)
+            struct.pack_into("<Q", header, 16, 0x800000)
+            with open(os.path.join(tmpdir, "Image"), "wb") as f:
+                f.write(header)
+            memories["main_ram"]["size"] = 0x00f80000
+            with self.assertRaises(ValueError):
+                generate_boot_json("ram0", memories, tmpdir)
+            memories["main_ram"]["size"] = 0x02000000
+
+            # LZ4 boot: Image.lz4 and the boot stub are packed after the rootfs, the stub is booted.
+            with open(os.path.join(tmpdir, "Image.lz4"), "wb") as f:
+                f.write(bytes(0x2345))
+            with open(os.path.join(tmpdir, "boot-stub.bin"), "wb") as f:
+                f.write(bytes(0x1fe))
+            layout = generate_boot_json("ram0", memories, tmpdir, compression="lz4")
+            self.assertEqual(list(layout.items())[-1], ("boot-unlz4.bin", 0x40f85000))
+            self.assertEqual(layout["Image.lz4"], 0x40f82000)
+            self.assertNotIn("Image", layout)
+            with open(os.path.join(tmpdir, "boot-unlz4.bin"), "rb") as f:
+                boot = f.read()
+            self.assertEqual(len(boot), 0x200 + 4*4 + 6*4)
+            self.assertEqual(struct.unpack_from("<4I", boot, 0x200), (
+                0x5442584c, 1, 0x40f00000, 0x40f85000 + 0x228 + 0x1000))
+            self.assertEqual(struct.unpack_from("<6I", boot, 0x210), (
+                0x40f82000, 0x2345, 0x40000000, 64, 1, zlib.crc32(bytes(0x2345))))
+
+            # Bundled boot: a single boot.bin, the rootfs is used in place.
+            with open(os.path.join(tmpdir, "opensbi.bin"), "wb") as f:
+                f.write(b"opensbi")
+            layout = generate_boot_json("ram0", memories, tmpdir, bundle=True)
+            self.assertEqual(layout, {"boot.bin": 0x40f80000})
+            with open(os.path.join(tmpdir, "boot.bin"), "rb") as f:
+                boot = f.read()
+            magic, count, next_addr, _ = struct.unpack_from("<4I", boot, 0x200)
+            self.assertEqual((magic, count, next_addr), (0x5442584c, 4, 0x40f00000))
+            entries = {}
+            for i in range(count):
+                src, size, dst, _, flags, crc = struct.unpack_from("<6I", boot, 0x210 + 24*i)
+                data = boot[src - 0x40f80000:src - 0x40f80000 + size]
+                self.assertEqual(zlib.crc32(data), crc)
+                entries[dst] = (src, data, flags)
+            self.assertEqual(entries[0x40f00000][1], b"opensbi")
+            rootfs_src, rootfs, _ = [e for dst, e in entries.items() if dst == e[0]][0]
+            self.assertEqual(rootfs_src % 0x1000, 0)
+            self.assertEqual(rootfs, bytes(0x1234))
+            with open(os.path.join(tmpdir, "rv32.dtb"), "rb") as f:
+                dtb = f.read()
+            self.assertEqual(get_dtb_int(dtb, "/chosen", "linux,initrd-start"), rootfs_src)
+
+    def test_flash_boot(self):
+        memories = {
+            "main_ram" : {"base": 0x40000000, "size": 0x02000000},
+            "opensbi"  : {"base": 0x40f00000, "size": 0x00080000},
+            "spiflash" : {"base": 0xd0000000, "size": 0x01000000},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            header = bytearray(64)
+            struct.pack_into("<Q", header, 16, 0x800000)
+            header[0:8]   = b"code0123"
+            header[48:60] = b"RISCV\0\0\0RSC\x05"
+            image = bytes(header) + bytes(range(256))*0x100
+            for name, data in [("Image", image), ("rootfs.cpio.gz", bytes(0x1234)), ("opensbi.bin", b"opensbi"),
+                ("boot-stub.bin", bytes(0x1fe)), ("rv32.dtb", generate_test_dtb({"linux,initrd-start": 0, "linux,initrd-end": 0}))]:
+                with open(os.path.join(tmpdir, name), "wb") as f:
+                    f.write(data)
+            layout = generate_boot_json("ram0", memories, tmpdir)
+            images = generate_flash_boot(get_boot_json_images("ram0"), memories, tmpdir)
+
+            # Images at erase sector aligned offsets after the bitstream, flash_boot.bin first.
+            offsets = {os.path.basename(filename): offset for offset, filename in images.items()}
+            self.assertEqual(offsets["flash_boot.bin"], 0x400000)
+            self.assertEqual(sorted(offsets.values())[1], 0x420000)
+            self.assertTrue(all(offset % 0x10000 == 0 for offset in offsets.values()))
+            with open(os.path.join(tmpdir, "flash.json")) as f:
+                self.assertEqual(json.load(f)["opensbi.bin"], f"0x{offsets['opensbi.bin']:08x}")
+
+            # BIOS flash header + Image (first 8 bytes: jump to the stub placed after the Image).
+            with open(os.path.join(tmpdir, "flash_boot.bin"), "rb") as f:
+                boot = f.read()
+            length, crc = struct.unpack_from("<2I", boot)
+            payload = boot[8:]
+            self.assertEqual((length, crc), (len(payload), zlib.crc32(payload)))
+            self.assertEqual(payload[8:len(image)], image[8:])
+            auipc, jalr = struct.unpack_from("<2I", payload)
+            self.assertEqual((auipc & 0xfff, jalr & 0xfffff), (0x297, 0x28067))
+            stub = (auipc & 0xfffff000) + ((jalr >> 20) ^ 0x800) - 0x800
+            self.assertEqual(stub, 0x11000)
+
+            # Descriptor: images copied from the memory-mapped flash, Image first bytes restored last.
+            magic, count, next_addr, stack_top = struct.unpack_from("<4I", payload, stub + 0x200)
+            self.assertEqual((magic, count, next_addr), (0x5442584c, 4, 0x40f00000))
+            self.assertLessEqual(stack_top, 0x40ef0000)
+            entries = [struct.unpack_from("<6I", payload, stub + 0x210 + 24*i) for i in range(count)]
+            for (src, size, dst, _, flags, crc), name in zip(entries, ["rv32.dtb", "rootfs.cpio.gz", "opensbi.bin"]):
+                with open(os.path.join(tmpdir, name), "rb") as f:
+                    data = f.read()
+                self.assertEqual((src, size, dst, flags, crc), (0xd0000000 + offsets[name], len(data), layout[name], 0, zlib.crc32(data)))
+            src, size, dst, _, _, crc = entries[-1]
+            self.assertEqual((size, dst, crc), (8, 0x40000000, zlib.crc32(b"code0123")))
+            self.assertEqual(payload[src - 0x40000000:src - 0x40000000 + 8], b"code0123")
+
+            # Images larger than the SPI Flash.
+            memories["spiflash"]["size"] = 0x420000
+            with self.assertRaises(ValueError):
+                generate_flash_boot(get_boot_json_images("ram0"), memories, tmpdir)
+
+    def test_boot_images_before_buildroot(self):
+        memories = {
+            "main_ram" : {"base": 0x40000000, "size": 0x02000000},
+            "opensbi"  : {"base": 0x40f00000, "size": 0x00080000},
+            "spiflash" : {"base": 0xd0000000, "size": 0x01000000},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "rv32.dtb"), "wb") as f:
+                f.write(generate_test_dtb({"linux,initrd-start": 0, "linux,initrd-end": 0}))
+            self.assertEqual(get_missing_boot_stub_images(get_boot_json_images("ram0", "lz4"), tmpdir),
+                ["boot-stub.bin", "Image.lz4", "rootfs.cpio.gz", "opensbi.bin", "Image"])
+
+            # First build (no Linux images yet): the boot stub images are skipped, not an error.
+            args = argparse.Namespace(rootfs="ram0", images_dir=tmpdir, boot_compression="none",
+                boot_bundle=True, initrd_compression="gzip", flash_boot=True, flash_boot_offset="0x400000")
+            self.assertEqual(generate_boot_images(args, memories), ({}, {}))
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "boot.bin")))
+
+            # Flash boot skipped, boot.json still generated (and the DTB initrd start synced).
+            args.boot_bundle = False
+            boot_layout, flash_images = generate_boot_images(args, memories)
+            self.assertEqual(boot_layout["rootfs.cpio.gz"], 0x40f80000)
+            self.assertEqual(flash_images, {})
+
+            # Once built by Buildroot, the boot stub images are generated.
+            for name in ["Image", "rootfs.cpio.gz", "opensbi.bin", "boot-stub.bin"]:
+                with open(os.path.join(tmpdir, name), "wb") as f:
+                    f.write(bytes(0x100))
+            self.assertEqual(get_missing_boot_stub_images(get_boot_json_images("ram0"), tmpdir), [])
+            self.assertIn(0x400000, generate_boot_images(args, memories)[1])
+
+    def test_sim_ram_init(self):
+        from litex.soc.integration.common import get_mem_data
+        from litedram.modules import MT48LC16M16
+        from litedram.phy.model import SDRAMPHYModel, get_sdram_phy_settings
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, data in [("Image", bytes(range(256))*40), ("rv32.dtb", b"dtb!"*9)]:
+                with open(os.path.join(tmpdir, name), "wb") as f:
+                    f.write(data)
+            with open(os.path.join(tmpdir, "boot.json"), "w") as f:
+                json.dump({"Image": "0x40000000", "rv32.dtb": "0x40003000"}, f)
+            data = get_ram_init_data(os.path.join(tmpdir, "boot.json"), offset=0x40000000)
+            self.assertEqual(len(data), 0x3000 + 36)
+            self.assertEqual(data[0x2800:0x3000], bytes(0x800))
+
+            # Functional main RAM (integrated RAM): same words as the LiteX init.
+            words = get_mem_data(os.path.join(tmpdir, "boot.json"), endianness="little", offset=0x40000000)
+            self.assertEqual(get_memory_init(bytes(data), 32), words)
+
+            # Same bank contents as the LiteDRAM SDRAMPHYModel init (from a word list).
+            module = MT48LC16M16(100e6, "1:1")
+            for data_width in [16, 32]:
+                settings = get_sdram_phy_settings(memtype="SDR", data_width=data_width, clk_freq=100e6)
+                words    = get_mem_data(os.path.join(tmpdir, "boot.json"), endianness="little", offset=0x40000000)
+                ref      = SDRAMPHYModel(module=module, settings=settings, init=words)
+                sdrphy   = SDRAMPHYModel(module=module, settings=settings)
+                for memory, init in zip(get_sdram_bank_memories(ref), get_sdram_bank_init(data, sdrphy)):
+                    # (LiteDRAM pads to 32-bit words.)
+                    self.assertEqual(memory.init[:len(init)], init)
+                    self.assertFalse(any(memory.init[len(init):]))
+
+                # $readmemh files of the binary mode: same words as the gateware init.
+                for i, content in enumerate(get_sdram_bank_data(data, sdrphy)):
+                    write_memory_init(os.path.join(tmpdir, "bank.init"), content, data_width)
+                    with open(os.path.join(tmpdir, "bank.init")) as f:
+                        self.assertEqual([int(l, 16) for l in f.read().split()], get_sdram_bank_init(data, sdrphy)[i])
+
+            # Binary images cached by boot.json/images contents.
+            cache_dir = os.path.join(tmpdir, "ram_init")
+            binary    = get_ram_init_binary(os.path.join(tmpdir, "boot.json"), 0x40000000, cache_dir)
+            with open(binary, "rb") as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(get_ram_init_binary(os.path.join(tmpdir, "boot.json"), 0x40000000, cache_dir), binary)
+            with open(os.path.join(tmpdir, "Image"), "wb") as f:
+                f.write(b"new kernel")
+            self.assertNotEqual(get_ram_init_binary(os.path.join(tmpdir, "boot.json"), 0x40000000, cache_dir), binary)
+
+            # Simulation sources key: independent of the init files and of the generation date.
+            gateware_dir = os.path.join(tmpdir, "gateware")
+            os.makedirs(gateware_dir)
+            for name, content in [("sim.v", "// Date       : 2024-01-01\nmodule sim;\n"), ("sim_mem.init", "00\n")]:
+                with open(os.path.join(gateware_dir, name), "w") as f:
+                    f.write(content)
+            key = get_sim_gateware_key(gateware_dir)
+            for name, content in [("sim.v", "// Date       : 2024-01-02\nmodule sim;\n"), ("sim_mem.init", "01\n")]:
+                with open(os.path.join(gateware_dir, name), "w") as f:
+                    f.write(content)
+            self.assertEqual(get_sim_gateware_key(gateware_dir), key)
+            with open(os.path.join(gateware_dir, "sim.v"), "a") as f:
+                f.write("endmodule\n")
+            self.assertNotEqual(get_sim_gateware_key(gateware_dir), key)
+
+    def test_sim_checkpoint(self):
+        from litex.build.sim.verilator import _build_sim, _generate_sim_cpp
+        class Platform:
+            sim_requested = []
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Sources generated by the LiteX Verilator toolchain.
+            os.chdir(tmpdir)
+            try:
+                _generate_sim_cpp(Platform())
+                _build_sim("sim", [("sim.v", "verilog", "work")], jobs=None, threads=1, coverage=False)
+            finally:
+                os.chdir(cwd)
+            key = get_sim_gateware_key(tmpdir)
+            add_sim_checkpoint(tmpdir)
+            self.assertNotEqual(get_sim_gateware_key(tmpdir), key)
+            with open(os.path.join(tmpdir, "sim_init.cpp")) as f:
+                sim_init = f.read()
+            self.assertIn("{\n    litex_sim_checkpoint();\n", sim_init)
+            self.assertIn("    litex_sim_checkpoint_init(sim);\n    *out=sim;\n", sim_init)
+            self.assertLess(sim_init.index("static void litex_sim_checkpoint()"), sim_init.index("void litex_sim_dump()"))
+            with open(os.path.join(tmpdir, "build_sim.sh")) as f:
+                self.assertIn('CC_SRCS="--savable --cc sim.v', f.read())
+
+            # Changed LiteX template: the missing hooks are an error.
+            with open(os.path.join(tmpdir, "sim_init.cpp"), "w") as f:
+                f.write(sim_init.replace("    *out=sim;\n", "    *out = sim;\n"))
+            with self.assertRaisesRegex(ValueError, "found 0 times"):
+                add_sim_checkpoint(tmpdir)
+
+        self.assertEqual(get_sim_checkpoint_env(save="boot.ckpt", marker="# "), {
+            "LITEX_SIM_CHECKPOINT_SAVE"   : os.path.abspath("boot.ckpt"),
+            "LITEX_SIM_CHECKPOINT_MARKER" : "# ",
+        })
+        self.assertEqual(get_sim_checkpoint_env(cycle=1000), {"LITEX_SIM_CHECKPOINT_CYCLE": "1000"})
+        self.assertEqual(get_sim_checkpoint_env(boot_marker="# "), {"LITEX_SIM_BOOT_MARKER": "# "})
+
+    def test_sim_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                compile_verilator_sim(tmpdir)
+            # Generated build script/model: the environment is only passed to the simulation.
+            with open(os.path.join(tmpdir, "build_sim.sh"), "w") as f:
+                f.write("mkdir -p obj_dir\nprintf '#!/bin/sh\\necho $LITEX_SIM_TEST > env.txt\\n' > obj_dir/Vsim\nchmod +x obj_dir/Vsim\n")
+            compile_verilator_sim(tmpdir)
+            run_verilator_sim(tmpdir, env={"LITEX_SIM_TEST": "1"}, interactive=False)
+            with open(os.path.join(tmpdir, "env.txt")) as f:
+                self.assertEqual(f.read(), "1\n")
+            self.assertNotIn("LITEX_SIM_TEST", os.environ)
+
+    def test_sim_trace_window(self):
+        from migen.sim import run_simulation
+        from litex.soc.interconnect import wishbone
+
+        def get_trace(supervisor, cycles=16, bus=None, csr=None):
+            trace = []
+            def generator():
+                for cycle in range(cycles):
+                    if csr is not None:
+                        yield supervisor._trace.storage.eq(cycle in csr)
+                    if bus is not None:
+                        yield bus.cyc.eq(cycle == 5)
+                        yield bus.stb.eq(cycle == 5)
+                        yield bus.ack.eq(cycle == 5)
+                        yield bus.adr.eq(0xf0001800 >> 2)
+                    yield
+                    trace.append((yield supervisor.trace))
+            run_simulation(supervisor, generator())
+            return trace
+
+        # Always on without trigger.
+        self.assertEqual(get_trace(Supervisor()), [1]*16)
+        # Cycle window.
+        self.assertEqual(get_trace(Supervisor(trace_cycles=(4, 8))), [0]*4 + [1]*4 + [0]*8)
+        self.assertEqual(get_trace(Supervisor(trace_cycles=(None, 8))), [1]*8 + [0]*8)
+        # Bus access trigger.
+        bus = wishbone.Interface(data_width=32)
+        self.assertEqual(get_trace(Supervisor(trace_addresses=(0xf0001800, None), trace_bus=bus), bus=bus),
+            [0]*6 + [1]*10)
+        # Software trigger.
+        self.assertEqual(get_trace(Supervisor(trace_csr=True), csr=[2, 3]), [0]*2 + [1]*2 + [0]*12)
+
+    def test_serial_boot(self):
+        # Tuning word/baudrate limit of the UART PHY.
+        self.assertEqual(get_tuning_word(115200, 100e6), 4947802)
+        self.assertEqual(get_serial_boot_baudrate(3e6, 100e6), 3000000)
+        self.assertEqual(get_serial_boot_baudrate(12e6, 100e6), 6250000)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "boot.json"), "w") as f:
+                f.write('{"Image": "0x40000000", "opensbi.bin": "0x40f00000"}')
+            self.assertEqual(get_boot_images(os.path.join(tmpdir, "boot.json")), [
+                (os.path.join(tmpdir, "Image"),       0x40000000),
+                (os.path.join(tmpdir, "opensbi.bin"), 0x40f00000),
+            ])
+
+        # BIOS prompt: the serialboot magic request is aborted (ESC), then the prompt is received.
+        class FakePort:
+            timeout    = None
+            in_waiting = 0
+            def __init__(self):
+                self.rx = b"sL5DdSMmkekro\n"
+                self.tx = b""
+            def read(self, size=1):
+                data, self.rx = self.rx[:size], self.rx[size:]
+                return data
+            def write(self, data):
+                self.tx += data
+                if data == b"\x1b":
+                    self.rx += b"Cancelled\n\x1b[92;1mlitex\x1b[0m> "
+        port = FakePort()
+        SerialBoot(port, timeout=1.0).get_prompt()
+        self.assertEqual(port.tx, b"\n\x1b")
+        self.assertIsNone(port.timeout)
+
+    def test_tftp_server(self):
+        import asyncio
+        from tftp_server import start_tftp_server, tftp_get, TFTPClientError, TFTPFileCache
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = {
+                "Image"       : os.urandom(0x120000), # mmap'd.
+                "rv32.dtb"    : os.urandom(4096), # Multiple of the block size (empty last block).
+                "opensbi.bin" : b"",
+                "rollover"    : os.urandom(8*70000), # Block number rollover.
+            }
+            for name, data in files.items():
+                with open(os.path.join(tmpdir, name), "wb") as f:
+                    f.write(data)
+
+            async def run():
+                transport, server = await start_tftp_server(tmpdir, "127.0.0.1", 0, timeout=0.5)
+                port = transport.get_extra_info("sockname")[1]
+                try:
+                    # Concurrent transfers: lock-step, LiteX BIOS (blksize 1024) and windowed (RFC 7440).
+                    results = await asyncio.gather(
+                        tftp_get("127.0.0.1", port, "Image"),
+                        tftp_get("127.0.0.1", port, "Image",       blksize=1024),
+                        tftp_get("127.0.0.1", port, "Image",       blksize=1428, windowsize=16),
+                        tftp_get("127.0.0.1", port, "rv32.dtb",    blksize=1024, windowsize=4),
+                        tftp_get("127.0.0.1", port, "opensbi.bin", windowsize=8),
+                        tftp_get("127.0.0.1", port, "rollover",    blksize=8, windowsize=256),
+                    )
+                    for name, data in zip(["Image", "Image", "Image", "rv32.dtb", "opensbi.bin", "rollover"], results):
+                        self.assertEqual(data, files[name], name)
+                    # Errors.
+                    with self.assertRaisesRegex(TFTPClientError, "File not found"):
+                        await tftp_get("127.0.0.1", port, "rootfs.cpio.gz")
+                    with self.assertRaisesRegex(TFTPClientError, "Access violation"):
+                        await tftp_get("127.0.0.1", port, "../" + os.path.basename(tmpdir) + "_x/Image")
+                finally:
+                    transport.close()
+            asyncio.run(run())
+
+            # Small files are snapshotted: an in-flight transfer survives a rewrite in place, a
+            # replaced file is reloaded.
+            cache = TFTPFileCache(tmpdir)
+            content = cache.get("rv32.dtb")
+            with open(os.path.join(tmpdir, "rv32.dtb"), "wb") as f:
+                f.write(b"dtb")
+            self.assertEqual(bytes(content), files["rv32.dtb"])
+            write_image(os.path.join(tmpdir, "rv32.dtb"), b"new dtb")
+            self.assertEqual(bytes(cache.get("rv32.dtb")), b"new dtb")
+            self.assertEqual(sorted(os.listdir(tmpdir)), sorted(files))
+
+    def test_nfs_stage(self):
+        import io
+        import stat
+        import tarfile
+
+        def add(tar, name, data=None, **kwargs):
+            info = tarfile.TarInfo(name)
+            info.mtime = 1700000000
+            for k, v in kwargs.items():
+                setattr(info, k, v)
+            if data is not None:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            else:
+                tar.addfile(info)
+
+        def make_tar(filename, busybox):
+            with tarfile.open(filename, "w") as tar:
+                add(tar, "./",                type=tarfile.DIRTYPE, mode=0o755)
+                add(tar, "./bin",             type=tarfile.DIRTYPE, mode=0o755)
+                add(tar, "./bin/busybox",     busybox, mode=0o4755, mtime=1700000000 + int(busybox[1:]))
+                add(tar, "./bin/sh",          type=tarfile.SYMTYPE, linkname="busybox")
+                add(tar, "./bin/ls",          type=tarfile.LNKTYPE, linkname="./bin/busybox")
+                add(tar, "./dev",             type=tarfile.DIRTYPE, mode=0o755)
+                add(tar, "./dev/console",     type=tarfile.CHRTYPE, mode=0o600, devmajor=5, devminor=1)
+                add(tar, "./etc",             type=tarfile.DIRTYPE, mode=0o755)
+                add(tar, "./etc/hostname",    b"buildroot\n", mode=0o644)
+                add(tar, "./etc/shadow",      b"root::\n",    mode=0o600, uid=0, gid=42)
+                if busybox == b"v1":
+                    add(tar, "./etc/old.conf", b"old\n", mode=0o644)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tarball  = os.path.join(tmpdir, "rootfs.tar")
+            nfs_root = os.path.join(tmpdir, "nfs")
+            overlay  = os.path.join(tmpdir, "overlay", "etc")
+            os.makedirs(overlay)
+            with open(os.path.join(overlay, "hostname"), "w") as f:
+                f.write("arty\n")
+
+            # Initial staging.
+            make_tar(tarball, b"v1")
+            stats = stage_nfs_root(nfs_root, tarball, [os.path.dirname(overlay)])
+            self.assertEqual(stats["written"], 7 if os.geteuid() == 0 else 6)
+            st = os.stat(os.path.join(nfs_root, "bin/busybox"))
+            self.assertEqual(stat.S_IMODE(st.st_mode), 0o4755)
+            self.assertEqual(st.st_mtime, 1700000001)
+            self.assertEqual(os.readlink(os.path.join(nfs_root, "bin/sh")), "busybox")
+            self.assertTrue(os.path.samefile(os.path.join(nfs_root, "bin/ls"), os.path.join(nfs_root, "bin/busybox")))
+            with open(os.path.join(nfs_root, "etc/hostname")) as f:
+                self.assertEqual(f.read(), "arty\n")
+            if os.geteuid() == 0:
+                self.assertTrue(stat.S_ISCHR(os.lstat(os.path.join(nfs_root, "dev/console")).st_mode))
+                self.assertEqual(os.stat(os.path.join(nfs_root, "etc/shadow")).st_gid, 42)
+
+            # No changes: nothing written.
+            stats = stage_nfs_root(nfs_root, tarball, [os.path.dirname(overlay)])
+            self.assertEqual(stats["written"], 0)
+
+            # Rebuild: only the changed file is written, removed files are deleted, runtime files kept.
+            with open(os.path.join(nfs_root, "etc/runtime.log"), "w") as f:
+                f.write("runtime\n")
+            inode = os.stat(os.path.join(nfs_root, "etc/shadow")).st_ino
+            make_tar(tarball, b"v2")
+            stats = stage_nfs_root(nfs_root, tarball, [os.path.dirname(overlay)])
+            self.assertEqual((stats["written"], stats["removed"]), (2, 1)) # busybox + ls hard link.
+            with open(os.path.join(nfs_root, "bin/ls"), "rb") as f:
+                self.assertEqual(f.read(), b"v2")
+            self.assertFalse(os.path.exists(os.path.join(nfs_root, "etc/old.conf")))
+            self.assertTrue(os.path.exists(os.path.join(nfs_root, "etc/runtime.log")))
+            self.assertEqual(os.stat(os.path.join(nfs_root, "etc/shadow")).st_ino, inode)
+
+    def test_sdcard_update(self):
+        config = (
+            'image sdcard.img {\n\thdimage {\n\t}\n'
+            '\tpartition boot {\n\t\tpartition-type = 0xC\n\t\timage = "boot.bin"\n\t}\n'
+            '\tpartition rootfs {\n\t\tpartition-type = 0x83\n\t\timage = "rootfs.ext4"\n\t}\n}\n'
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "genimage.cfg"), "w") as f:
+                f.write(config)
+            # Sparse image with a MBR: boot (1MB @ 1MB) and rootfs (4MB @ 2MB) partitions.
+            image = os.path.join(tmpdir, "sdcard.img")
+            mbr   = bytearray(512)
+            struct.pack_into("<B3xB3xII", mbr, 446, 0x80, 0x0c, 2048, 2048)
+            struct.pack_into("<B3xB3xII", mbr, 462, 0x00, 0x83, 4096, 8192)
+            mbr[510:512] = b"\x55\xaa"
+            with open(image, "wb") as f:
+                f.write(mbr)
+                f.truncate(6 << 20)
+            boot   = os.urandom(0x3000)
+            rootfs = bytearray(os.urandom(0x10000))
+            with open(os.path.join(tmpdir, "boot.bin"), "wb") as f:
+                f.write(boot)
+            with open(os.path.join(tmpdir, "rootfs.ext4"), "wb") as f:
+                f.write(rootfs)
+
+            self.assertEqual(update_sdcard(image, os.path.join(tmpdir, "genimage.cfg"), tmpdir),
+                {"boot.bin": 0x3000, "rootfs.ext4": 0x10000})
+            with open(image, "rb") as f:
+                f.seek(1 << 20)
+                self.assertEqual(f.read(0x3000), boot)
+            # Only the changed rootfs block is rewritten, the image stays sparse.
+            rootfs[0x5000] ^= 0xff
+            with open(os.path.join(tmpdir, "rootfs.ext4"), "wb") as f:
+                f.write(rootfs)
+            self.assertEqual(update_sdcard(image, os.path.join(tmpdir, "genimage.cfg"), tmpdir),
+                {"boot.bin": 0, "rootfs.ext4": 0x1000})
+            ranges = get_mapped_ranges(image)
+            self.assertLess(sum(end - start for start, end in ranges), 1 << 20)
+
+            # Block map and writes skipping the blocks the card already holds.
+            generate_bmap(image)
+            self.assertEqual(read_bmap(image + ".bmap"), ranges)
+            card = os.path.join(tmpdir, "card")
+            with open(card, "wb") as f:
+                f.truncate(8 << 20)
+            mapped, written = write_sdcard(image, card, image + ".bmap")
+            self.assertEqual(written, mapped)
+            self.assertEqual(write_sdcard(image, card, image + ".bmap"), (mapped, 0))
+            rootfs[0x9000] ^= 0xff
+            with open(os.path.join(tmpdir, "rootfs.ext4"), "wb") as f:
+                f.write(rootfs)
+            update_sdcard(image, os.path.join(tmpdir, "genimage.cfg"), tmpdir)
+            self.assertEqual(write_sdcard(image, card), (mapped, 0x1000))
+            with open(image, "rb") as f, open(card, "rb") as g:
+                self.assertEqual(f.read(), g.read(6 << 20))
+
+            # Partition images larger than their partition are rejected.
+            with open(os.path.join(tmpdir, "boot.bin"), "wb") as f:
+                f.write(bytes(2 << 20))
+            with self.assertRaises(ValueError):
+                update_sdcard(image, os.path.join(tmpdir, "genimage.cfg"), tmpdir)
+
+    def test_sdcard_layout(self):
+        template = os.path.join(os.path.dirname(__file__), "..", "buildroot", "board", "litex_vexriscv", "genimage.cfg")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = os.path.join(tmpdir, "genimage.cfg")
+
+            # Without boot.json: template files with the selected initramfs/rootfs.
+            generate_genimage_config(template, config, rootfs="rootfs.squashfs", initrd="rootfs.cpio.zst")
+            partitions, vfat_files = get_genimage_config(config, "sdcard.img")
+            self.assertEqual(partitions, ["boot.vfat", "rootfs.squashfs"])
+            self.assertEqual(vfat_files["boot.vfat"], ["boot.json", "Image", "opensbi.bin", "rootfs.cpio.zst", "rv32.dtb"])
+
+            # Boot partition files from boot.json (LZ4 compressed/bundled boot images).
+            boot_json = os.path.join(tmpdir, "boot.json")
+            for layout in [
+                {"Image.lz4": 1, "rv32.dtb": 2, "rootfs.cpio.gz": 3, "opensbi.bin": 4, "boot-unlz4.bin": 5},
+                {"boot.bin": 1},
+            ]:
+                with open(boot_json, "w") as f:
+                    json.dump(layout, f)
+                for name in ["boot.json", *layout]:
+                    with open(os.path.join(tmpdir, name), "a"):
+                        pass
+                generate_genimage_config(template, config, get_sdcard_boot_files(boot_json, tmpdir))
+                partitions, vfat_files = get_genimage_config(config, "sdcard.img")
+                self.assertEqual(partitions, ["boot.vfat", "rootfs.ext4"])
+                self.assertEqual(vfat_files["boot.vfat"], ["boot.json", *layout])
+
+            # Images not generated yet are skipped.
+            os.remove(os.path.join(tmpdir, "boot.bin"))
+            self.assertEqual(get_sdcard_boot_files(boot_json, tmpdir), ["boot.json"])
 
     def test_boards(self):
         excluded_boards = [
@@ -198,6 +1089,137 @@ class TestBuild(unittest.TestCase):
             boot = f.read()
         self.assertNotIn("rootfs.cpio", boot)
 
+    def test_nfs_bootargs(self):
+        dts = 'chosen {\n    bootargs = "console=liteuart rootwait root=/dev/nfs ip=192.168.1.50";\n};\n'
+        bootargs = get_nfs_bootargs(get_dts_bootargs(dts), "192.168.1.100", "/srv/nfs/litex", "vers=3")
+        self.assertEqual(bootargs, [
+            "console=liteuart",
+            "root=/dev/nfs",
+            "nfsroot=192.168.1.100:/srv/nfs/litex,vers=3",
+            "ip=192.168.1.50",
+        ])
+        self.assertEqual(get_dts_bootargs(set_dts_bootargs(dts, bootargs)), bootargs)
+
+    def test_ro_rootfs(self):
+        dts = 'chosen {\n    bootargs = "console=liteuart rootwait root=/dev/mmcblk0p2 rw";\n};\n'
+        bootargs = get_ro_rootfs_bootargs(get_dts_bootargs(dts), "squashfs")
+        self.assertEqual(bootargs, [
+            "console=liteuart",
+            "rootwait",
+            "root=/dev/mmcblk0p2",
+            "ro",
+            "rootfstype=squashfs",
+            "init=/sbin/overlay-init",
+        ])
+        self.assertEqual(get_dts_bootargs(set_dts_bootargs(dts, bootargs)), bootargs)
+
+        for with_usb_host in [False, True]:
+            for fstype in ["squashfs", "erofs"]:
+                with self.subTest(fstype=fstype, with_usb_host=with_usb_host):
+                    with tempfile.TemporaryDirectory() as tmpdir:
+                        generated = os.path.join(tmpdir, "buildroot_defconfig")
+                        generate_buildroot_defconfig(generated, with_usb_host=with_usb_host, with_ro_rootfs=fstype)
+                        with open(generated, encoding="utf-8") as f:
+                            config = f.read().splitlines()
+                    self.assertIn(f"BR2_TARGET_ROOTFS_{fstype.upper()}=y", config)
+                    self.assertIn(f'BR2_ROOTFS_POST_SCRIPT_ARGS="rootfs={fstype}"', config)
+                    self.assertIn(f"board/litex_vexriscv/linux-{fstype}.config", "\n".join(config))
+                    overlay, = [line for line in config if line.startswith("BR2_ROOTFS_OVERLAY=")]
+                    self.assertTrue(overlay.endswith('board/litex_vexriscv/rootfs_overlay_ro"'))
+                    self.assertIn("litex_vexriscv_usbhost/rootfs_overlay " if with_usb_host else "litex_vexriscv/rootfs_overlay ", overlay)
+                    # Buildroot sub-options follow their parent option.
+                    index = config.index(f"BR2_TARGET_ROOTFS_{fstype.upper()}=y")
+                    self.assertTrue(config[index + 1].startswith(f"BR2_TARGET_ROOTFS_{fstype.upper()}"))
+        self.assertTrue(os.path.isfile("images/boot_squashfs.json"))
+        self.assertTrue(os.access("buildroot/board/litex_vexriscv/rootfs_overlay_ro/sbin/overlay-init", os.X_OK))
+
+    def test_initrd_compression(self):
+        data = os.urandom(0x10000) + bytes(range(256)) * 0x2000 + b"TRAILER!!!"
+        decompress = {
+            "gzip" : ["gzip", "-dc"],
+            "lz4"  : ["lz4",  "-dc"],
+            "zstd" : ["zstd", "-dc"],
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rootfs = os.path.join(tmpdir, "rootfs.cpio")
+            with open(rootfs, "wb") as f:
+                f.write(data)
+            for compression, cmd in decompress.items():
+                with self.subTest(compression=compression):
+                    if shutil.which(cmd[0]) is None:
+                        self.skipTest(f"{cmd[0]} not available")
+                    output = os.path.join(tmpdir, f"rootfs.{compression}")
+                    self.assertEqual(compress_initrd(rootfs, output, compression, jobs=4), os.path.getsize(output))
+                    result = subprocess.run([*cmd, output], check=True, stdout=subprocess.PIPE)
+                    self.assertEqual(result.stdout, data)
+            with open(os.path.join(tmpdir, "rootfs.lz4"), "rb") as f:
+                self.assertEqual(f.read(4), struct.pack("<I", 0x184c2102)) # Legacy format.
+
+            # boot.json/DTB initrd from the selected initramfs.
+            memories = {"main_ram": {"base": 0x40000000, "size": 0x02000000}}
+            os.replace(os.path.join(tmpdir, "rootfs.lz4"), os.path.join(tmpdir, "rootfs.cpio.lz4"))
+            layout = generate_boot_json("ram0", memories, tmpdir, initrd_compression="lz4")
+            self.assertNotIn("rootfs.cpio.gz", layout)
+            self.assertEqual(layout["rootfs.cpio.lz4"], 0x40f80000)
+
+        for compression in ["gzip", "lz4", "zstd", "none"]:
+            with self.subTest(compression=compression):
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    generated = os.path.join(tmpdir, "buildroot_defconfig")
+                    generate_buildroot_defconfig(generated, with_ro_rootfs="squashfs", with_initrd_compression=compression)
+                    with open(generated, encoding="utf-8") as f:
+                        config = f.read().splitlines()
+                args = "rootfs=squashfs" + ("" if compression == "gzip" else f" initrd={compression}")
+                self.assertIn(f'BR2_ROOTFS_POST_SCRIPT_ARGS="{args}"', config)
+                self.assertEqual("linux-initrd-zstd.config" in "\n".join(config), compression == "zstd")
+
+        log = (
+            "[    1.234567] Trying to unpack rootfs image as initramfs...\n"
+            "[    2.000000] random: crng init done\n"
+            "[    3.734567] Freeing initrd memory: 4096K\n"
+        )
+        self.assertAlmostEqual(get_initrd_unpack_time(log), 2.5)
+        self.assertIsNone(get_initrd_unpack_time("[    0.000000] Linux version 6.1\n"))
+
+    def test_dts_only(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            build_dir  = os.path.join(tmpdir, "build")
+            images_dir = os.path.join(tmpdir, "images")
+            subprocess.run(
+                [
+                    "./make.py",
+                    "--board=arty",
+                    "--dts-only",
+                    f"--build-dir={build_dir}",
+                    f"--images-dir={images_dir}",
+                ],
+                check=True,
+            )
+
+            # csr.json/DTS/DTB generated without BIOS/software or gateware generation.
+            for filename in ["csr.json", "csr.csv", "arty.dts", "arty.dtb"]:
+                self.assertTrue(os.path.isfile(os.path.join(build_dir, "arty", filename)))
+            self.assertTrue(os.path.isfile(os.path.join(images_dir, "rv32.dtb")))
+            self.assertFalse(os.path.exists(os.path.join(build_dir, "arty", "software")))
+            self.assertFalse(os.path.exists(os.path.join(build_dir, "arty", "gateware")))
+
+    def test_dts_only_args(self):
+        for arg in ["--build", "--load", "--flash", "--doc"]:
+            with self.subTest(arg=arg):
+                result = subprocess.run(
+                    [
+                        "./make.py",
+                        "--board=arty",
+                        "--dts-only",
+                        arg,
+                    ],
+                    check=False,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                )
+                self.assertEqual(result.returncode, 2)
+                self.assertIn("--dts-only can't be combined", result.stderr)
+
     def test_nfs_rootfs_requires_ethernet(self):
         result = subprocess.run(
             [
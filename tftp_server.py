@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+#
+# This file is part of Linux-on-LiteX-VexRiscv
+#
+# Copyright (c) 2019-2024, Linux-on-LiteX-VexRiscv Developers
+# SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import mmap
+import struct
+import asyncio
+import argparse
+
+# TFTP ---------------------------------------------------------------------------------------------
+
+# Read-only asyncio TFTP server for netboot (RFC 1350), with option negotiation (RFC 2347): blksize
+# (RFC 2348), timeout/tsize (RFC 2349) and windowsize (RFC 7440). Each transfer runs on its own UDP
+# endpoint, so many boards can boot at the same time; files are mmap'd and shared between transfers.
+
+TFTP_RRQ   = 1
+TFTP_WRQ   = 2
+TFTP_DATA  = 3
+TFTP_ACK   = 4
+TFTP_ERROR = 5
+TFTP_OACK  = 6
+
+TFTP_ERROR_NOT_FOUND = 1
+TFTP_ERROR_ACCESS    = 2
+TFTP_ERROR_ILLEGAL   = 4
+TFTP_ERROR_TID       = 5
+
+tftp_default_blksize = 512
+tftp_options_range   = {
+    "blksize"    : (8, 65464),
+    "windowsize" : (1, 65535),
+    "timeout"    : (1, 255),
+}
+
+def tftp_packet(opcode, *fields):
+    # Request/OACK packets: opcode + zero-terminated strings.
+    return struct.pack(">H", opcode) + b"".join(str(f).encode() + b"\0" for f in fields)
+
+def tftp_error(code, message):
+    return struct.pack(">HH", TFTP_ERROR, code) + message.encode() + b"\0"
+
+def parse_tftp_request(data):
+    # Returns (opcode, filename, mode, options).
+    opcode, = struct.unpack_from(">H", data)
+    fields  = data[2:].split(b"\0")[:-1]
+    if len(fields) < 2 or len(fields) % 2:
+        raise ValueError("Malformed request")
+    filename, mode = fields[0].decode(), fields[1].decode().lower()
+    options = {fields[i].decode().lower(): fields[i + 1].decode() for i in range(2, len(fields), 2)}
+    return opcode, filename, mode, options
+
+def _unwrap_block(block, base):
+    # 16-bit block number (rolling over to 0) to the transfer block index closest above base.
+    return base + ((block - base) & 0xffff)
+
+# File Cache ---------------------------------------------------------------------------------------
+
+# Small files (boot.json, rv32.dtb, opensbi.bin...) are read into memory: they are regenerated often
+# and a mapped file truncated under an in-flight transfer crashes the server (SIGBUS). Larger images
+# are mmap'd: they must be replaced (written to a new file renamed over them, as the images written
+# by make.py/post-image.sh are), never rewritten in place, while being served.
+tftp_mmap_min_size = 1 << 20
+
+class TFTPFileCache:
+    # Files shared by the transfers (reloaded when the file changes, ex: after a rebuild).
+    def __init__(self, root):
+        self.root  = os.path.realpath(root)
+        self.files = {}
+
+    def get(self, filename):
+        path = os.path.realpath(os.path.join(self.root, filename.lstrip("/")))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise PermissionError(filename)
+        st  = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if path not in self.files or self.files[path][0] != key:
+            with open(path, "rb") as f:
+                if st.st_size < tftp_mmap_min_size:
+                    data = f.read()
+                else:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if hasattr(data, "madvise"):
+                        data.madvise(mmap.MADV_WILLNEED)
+            self.files[path] = (key, memoryview(data))
+        return self.files[path][1]
+
+# Server -------------------------------------------------------------------------------------------
+
+class _TFTPEndpoint(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait((data, addr))
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+class TFTPServer(asyncio.DatagramProtocol):
+    def __init__(self, root, timeout=1.0, retries=5, default_windowsize=1, verbose=False):
+        self.cache              = TFTPFileCache(root)
+        self.timeout            = timeout
+        self.retries            = retries
+        self.default_windowsize = default_windowsize
+        self.verbose            = verbose
+        self.transfers          = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.ensure_future(self.handle_request(data, addr))
+        self.transfers.add(task)
+        task.add_done_callback(self.transfers.discard)
+
+    def log(self, message):
+        if self.verbose:
+            print(f"[TFTP] {message}")
+
+    async def handle_request(self, data, addr):
+        loop = asyncio.get_running_loop()
+        transport, endpoint = await loop.create_datagram_endpoint(_TFTPEndpoint,
+            local_addr = (self.transport.get_extra_info("sockname")[0], 0))
+        try:
+            await self.send_file(data, addr, endpoint)
+        except Exception as e:
+            self.log(f"{addr[0]}:{addr[1]}: {e}")
+        finally:
+            transport.close()
+
+    async def send_file(self, data, addr, endpoint):
+        transport = endpoint.transport
+        try:
+            opcode, filename, mode, options = parse_tftp_request(data)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            transport.sendto(tftp_error(TFTP_ERROR_ILLEGAL, "Malformed request"), addr)
+            return
+        if opcode != TFTP_RRQ:
+            transport.sendto(tftp_error(TFTP_ERROR_ACCESS, "Read-only server"), addr)
+            return
+        # Images are binaries: netascii is served as octet.
+        if mode not in ["octet", "netascii"]:
+            transport.sendto(tftp_error(TFTP_ERROR_ILLEGAL, f"Unsupported mode {mode}"), addr)
+            return
+        try:
+            content = self.cache.get(filename)
+        except PermissionError:
+            transport.sendto(tftp_error(TFTP_ERROR_ACCESS, "Access violation"), addr)
+            return
+        except OSError:
+            transport.sendto(tftp_error(TFTP_ERROR_NOT_FOUND, "File not found"), addr)
+            return
+
+        # Options negotiation.
+        oack = {}
+        for name, (low, high) in tftp_options_range.items():
+            if name in options:
+                try:
+                    value = int(options[name])
+                except ValueError:
+                    continue
+                # blksize/windowsize are clamped to the server limits, timeout must be valid.
+                if name == "timeout" and not (low <= value <= high):
+                    continue
+                oack[name] = max(low, min(value, high))
+        if "tsize" in options:
+            oack["tsize"] = len(content)
+        blksize    = oack.get("blksize",    tftp_default_blksize)
+        windowsize = oack.get("windowsize", self.default_windowsize)
+        timeout    = oack.get("timeout",    self.timeout)
+        self.log(f"{addr[0]}:{addr[1]}: {filename} ({len(content)} bytes, blksize {blksize}, windowsize {windowsize})")
+
+        async def wait_ack():
+            # Returns the acknowledged 16-bit block number (or None on timeout).
+            loop     = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                try:
+                    data, src = await endpoint.receive(max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    return None
+                # Packets from another TID are answered with an error (RFC 1350).
+                if src != addr:
+                    transport.sendto(tftp_error(TFTP_ERROR_TID, "Unknown transfer ID"), src)
+                    continue
+                if len(data) >= 4:
+                    opcode, block = struct.unpack_from(">HH", data)
+                    if opcode == TFTP_ACK:
+                        return block
+                    if opcode == TFTP_ERROR:
+                        raise ConnectionAbortedError("Transfer aborted by client")
+
+        # OACK, acknowledged by ACK 0.
+        if oack:
+            for _ in range(self.retries):
+                transport.sendto(tftp_packet(TFTP_OACK, *[x for kv in oack.items() for x in kv]), addr)
+                if await wait_ack() == 0:
+                    break
+            else:
+                raise TimeoutError("No OACK acknowledgement")
+
+        # Data, sent by windows. With a negotiated window (RFC 7440), ACKs are cumulative and an ACK
+        # before the end of the window means a loss: the window restarts after it (once per ACK value,
+        # duplicates would restart it for each received block). Clients ACKing every block (ex: the
+        # LiteX BIOS with --default-windowsize) get a sliding window with selective ACKs, the last
+        # block (ending the transfer) being only sent once all the previous ones are acknowledged.
+        restart = "windowsize" in oack and windowsize > 1
+        rewound = None
+        acked   = set()
+        nblocks = len(content)//blksize + 1
+        block   = 1 # First unacknowledged block.
+        sent    = 0 # Last block sent.
+        retries = self.retries
+        while block <= nblocks:
+            end = min(block + windowsize - 1, nblocks if (restart or block == nblocks) else nblocks - 1)
+            for n in range(sent + 1, end + 1):
+                if n not in acked:
+                    chunk = content[(n - 1)*blksize:n*blksize]
+                    transport.sendto(struct.pack(">HH", TFTP_DATA, n & 0xffff) + chunk, addr)
+                sent = n
+            ack = await wait_ack()
+            if ack is None:
+                retries -= 1
+                if retries == 0:
+                    raise TimeoutError(f"Timeout at block {block}")
+                sent = block - 1
+                continue
+            n = _unwrap_block(ack, block - 1)
+            if n > sent:
+                continue
+            if n >= block:
+                retries = self.retries
+            if restart:
+                block = max(block, n + 1)
+                if n < sent and n != rewound:
+                    sent    = n
+                    rewound = n
+            elif n in acked:
+                # Duplicate ACK: acknowledged blocks are never resent, so it comes from a client
+                # ACKing cumulatively (not negotiating the window): treat it as such.
+                acked = {b for b in acked if b > n}
+                block = n + 1
+            else:
+                acked.add(n)
+                while block in acked:
+                    acked.discard(block)
+                    block += 1
+        self.log(f"{addr[0]}:{addr[1]}: {filename} done")
+
+async def start_tftp_server(root, host="0.0.0.0", port=69, **kwargs):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: TFTPServer(root, **kwargs), local_addr=(host, port))
+    return transport, server
+
+# Client -------------------------------------------------------------------------------------------
+
+class TFTPClientError(Exception):
+    pass
+
+async def tftp_get(host, port, filename, blksize=None, windowsize=None, timeout=1.0, retries=5):
+    # Minimal TFTP client (used to test the server on loopback).
+    loop = asyncio.get_running_loop()
+    transport, endpoint = await loop.create_datagram_endpoint(_TFTPEndpoint, local_addr=("0.0.0.0", 0))
+    try:
+        options = {}
+        if blksize is not None:
+            options["blksize"] = blksize
+        if windowsize is not None:
+            options["windowsize"] = windowsize
+        request = tftp_packet(TFTP_RRQ, filename, "octet", *[x for kv in options.items() for x in kv])
+        blksize    = tftp_default_blksize
+        windowsize = 1
+        server     = None
+        data       = bytearray()
+        block      = 0    # Last block received in order.
+        window_end = 1    # Last block of the sender window (ACKed).
+        previous   = None # Previous block received.
+        gap        = None # Block ACKed on the last gap.
+
+        def ack(n):
+            transport.sendto(struct.pack(">HH", TFTP_ACK, n & 0xffff), server or (host, port))
+
+        tries    = retries
+        deadline = loop.time() + timeout
+        while True:
+            # Request/last ACK resent when no progress is made (lost packets).
+            try:
+                packet, src = await endpoint.receive(max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                tries -= 1
+                if tries == 0:
+                    raise TFTPClientError("Timeout")
+                if server is None:
+                    transport.sendto(request, (host, port))
+                else:
+                    ack(block)
+                deadline = loop.time() + timeout
+                continue
+            if server is None:
+                server = src
+            elif src != server:
+                continue
+            opcode, = struct.unpack_from(">H", packet)
+            if opcode == TFTP_ERROR:
+                raise TFTPClientError(packet[4:-1].decode())
+            if opcode == TFTP_OACK:
+                _, _, _, oack = parse_tftp_request(packet[:2] + b"x\0octet\0" + packet[2:])
+                blksize    = int(oack.get("blksize",    blksize))
+                windowsize = int(oack.get("windowsize", windowsize))
+                window_end = windowsize
+                ack(0)
+                continue
+            if opcode != TFTP_DATA:
+                continue
+            n = _unwrap_block(struct.unpack_from(">H", packet, 2)[0], block)
+            if n >= block + 0x8000:
+                n -= 0x10000
+            if n <= block:
+                # Retransmission: the sender window restarts at the first duplicate block.
+                if previous is None or n != previous + 1:
+                    window_end = n + windowsize - 1
+                if n == window_end:
+                    ack(block)
+                    window_end = block + windowsize
+            elif n > block + 1:
+                # Gap: ACK the last block received in order, once (RFC 7440).
+                if gap != block:
+                    ack(block)
+                    gap        = block
+                    window_end = block + windowsize
+            else:
+                block    = n
+                tries    = retries
+                deadline = loop.time() + timeout
+                data    += packet[4:]
+                if len(packet) - 4 < blksize:
+                    ack(block)
+                    return bytes(data)
+                if block == window_end:
+                    ack(block)
+                    window_end = block + windowsize
+            previous = n
+    finally:
+        transport.close()
+
+# Main ---------------------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="TFTP server for the Linux images (netboot).")
+    parser.add_argument("--root",               default="images",  help="Directory to serve.")
+    parser.add_argument("--host",               default="0.0.0.0", help="Listening address (ex: make.py --remote-ip).")
+    parser.add_argument("--port",               default=69,   type=int,   help="Listening UDP port.")
+    parser.add_argument("--timeout",            default=1.0,  type=float, help="Retransmission timeout (s).")
+    parser.add_argument("--retries",            default=5,    type=int,   help="Retransmissions before aborting a transfer.")
+    parser.add_argument("--default-windowsize", default=1,    type=int,
+        help="Window size for clients not negotiating it (ex: 4 for the LiteX BIOS, which ACKs every block).")
+    parser.add_argument("--verbose",            action="store_true",      help="Log the transfers.")
+    args = parser.parse_args()
+
+    async def serve():
+        transport, _ = await start_tftp_server(args.root, args.host, args.port,
+            timeout            = args.timeout,
+            retries            = args.retries,
+            default_windowsize = args.default_windowsize,
+            verbose            = args.verbose,
+        )
+        print(f"Serving {args.root} on {args.host}:{args.port} (TFTP).")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            transport.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()